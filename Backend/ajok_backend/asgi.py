@@ -14,3 +14,16 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ajok_backend.settings")
 
 application = get_asgi_application()
+
+# Load the recommendation index while the server starts taking requests,
+# and write the engagement counts of idle workers.
+from realestate.engagement import start_background_flush  # noqa: E402
+from realestate.recommendations import warm_up_index  # noqa: E402
+
+warm_up_index()
+start_background_flush()
+
+# Fail at startup rather than lose events between workers.
+from realestate.events import check_worker_setup  # noqa: E402
+
+check_worker_setup()
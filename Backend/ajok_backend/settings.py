@@ -186,6 +186,11 @@ STORAGES = {
     "default": {
         "BACKEND": "django.core.files.storage.FileSystemStorage",
     },
+    # Property photos and their variants, stored once per unique content
+    # (see realestate.storage).
+    "property_images": {
+        "BACKEND": "realestate.storage.ContentAddressedStorage",
+    },
 }
 
 CORS_ALLOWED_ORIGINS = [
@@ -196,10 +201,113 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 REST_FRAMEWORK = {
+    # Builds the user of read-only requests from the token's role claims
+    # (see realestate.authentication).
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'realestate.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
 }
+
+# Keyset pagination for property listings (see realestate.pagination)
+LISTINGS_PAGE_SIZE = int(os.getenv('LISTINGS_PAGE_SIZE', '20'))
+LISTINGS_MAX_PAGE_SIZE = int(os.getenv('LISTINGS_MAX_PAGE_SIZE', '100'))
+
+# Cache of serialized listings (see realestate.cache). Uses the default cache,
+# which is local memory unless CACHES is configured.
+LISTING_FRAGMENT_CACHE = os.getenv('LISTING_FRAGMENT_CACHE', 'default')
+LISTING_FRAGMENT_CACHE_TIMEOUT = int(os.getenv('LISTING_FRAGMENT_CACHE_TIMEOUT', '3600'))
+
+# Delta sync for property listings (see realestate.sync). Sync tokens older than
+# the retention period are rejected, as the tombstones they need may be gone.
+# Changes younger than LISTING_CHANGES_COMMIT_LAG seconds, which must exceed the
+# longest listing write transaction, are served again on the next sync.
+LISTING_CHANGES_RETENTION_DAYS = int(os.getenv('LISTING_CHANGES_RETENTION_DAYS', '30'))
+LISTING_CHANGES_COMMIT_LAG = int(os.getenv('LISTING_CHANGES_COMMIT_LAG', '10'))
+
+# Background processing of uploaded property images (see realestate.images).
+# Set IMAGE_PROCESSING_WORKERS to 0 to leave jobs to `manage.py process_images`.
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', '2'))
+
+# Partially received resumable image uploads (see realestate.uploads).
+RESUMABLE_UPLOAD_DIR = os.getenv('RESUMABLE_UPLOAD_DIR', str(BASE_DIR / 'uploads'))
+RESUMABLE_UPLOAD_MAX_SIZE = int(os.getenv('RESUMABLE_UPLOAD_MAX_SIZE', str(50 * 1024 * 1024)))
+
+# Cache of authenticated users with their role and agent (see
+# realestate.principals). Entries live PRINCIPAL_CACHE_TIMEOUT seconds in the
+# shared cache and PRINCIPAL_CACHE_LOCAL_TIMEOUT seconds in each process.
+PRINCIPAL_CACHE_ENABLED = os.getenv('PRINCIPAL_CACHE_ENABLED', 'True') == 'True'
+PRINCIPAL_CACHE = os.getenv('PRINCIPAL_CACHE', 'default')
+PRINCIPAL_CACHE_TIMEOUT = int(os.getenv('PRINCIPAL_CACHE_TIMEOUT', '60'))
+PRINCIPAL_CACHE_LOCAL_TIMEOUT = int(os.getenv('PRINCIPAL_CACHE_LOCAL_TIMEOUT', '5'))
+PRINCIPAL_CACHE_LOCAL_SIZE = int(os.getenv('PRINCIPAL_CACHE_LOCAL_SIZE', '1024'))
+
+# Listing recommendations (see realestate.recommendations). The in-process
+# vector index is built in the background when the server starts (unless
+# RECOMMENDATION_INDEX_WARM_UP is off) and again every
+# RECOMMENDATION_INDEX_MAX_AGE seconds; results are cached per user for
+# RECOMMENDATIONS_CACHE_TIMEOUT seconds.
+RECOMMENDATION_INDEX_MAX_AGE = int(os.getenv('RECOMMENDATION_INDEX_MAX_AGE', '3600'))
+RECOMMENDATION_INDEX_WARM_UP = os.getenv('RECOMMENDATION_INDEX_WARM_UP', 'True') == 'True'
+RECOMMENDATIONS_CACHE_TIMEOUT = int(os.getenv('RECOMMENDATIONS_CACHE_TIMEOUT', '300'))
+
+# Precomputed similar listings (see realestate.similar). Changed listings are
+# queued for `manage.py refresh_similar_listings`, to be run from cron. Turn off
+# the queueing for bulk imports and run `manage.py rebuild_similar_listings`.
+SIMILAR_LISTINGS_COUNT = int(os.getenv('SIMILAR_LISTINGS_COUNT', '10'))
+SIMILAR_LISTINGS_AUTO_REFRESH = os.getenv('SIMILAR_LISTINGS_AUTO_REFRESH', 'True') == 'True'
+
+# Geocoding of listing addresses (see realestate.geocoding). Use
+# realestate.geocoding.NominatimGeocoder for OpenStreetMap lookups, and turn
+# off GEOCODE_ON_SAVE to geocode with `manage.py geocode_listings` instead.
+GEOCODER = os.getenv('GEOCODER', 'realestate.geocoding.OfflineGeocoder')
+GEOCODE_ON_SAVE = os.getenv('GEOCODE_ON_SAVE', 'True') == 'True'
+GEOCODER_USER_AGENT = os.getenv('GEOCODER_USER_AGENT', 'junub-real-estate')
+
+# Search box autocomplete (see realestate.suggest). Each process checks the
+# listing change log every SUGGEST_INDEX_SYNC_INTERVAL seconds and rebuilds its
+# index every SUGGEST_INDEX_MAX_AGE seconds.
+SUGGEST_INDEX_SYNC_INTERVAL = int(os.getenv('SUGGEST_INDEX_SYNC_INTERVAL', '10'))
+SUGGEST_INDEX_MAX_AGE = int(os.getenv('SUGGEST_INDEX_MAX_AGE', '3600'))
+
+# Real-time inquiry events (see realestate.events). Streams buffer at most
+# EVENTS_QUEUE_SIZE events for slow clients and send a heartbeat every
+# EVENTS_HEARTBEAT seconds. LocalBroker only reaches clients of the same process;
+# with several workers use realestate.events.RedisBroker, which relays events
+# over the EVENTS_REDIS_CHANNEL pub/sub channel of EVENTS_REDIS_URL. Stream
+# tickets live EVENTS_TICKET_TIMEOUT seconds in the default cache, which must
+# then be shared between workers too. WEB_CONCURRENCY is the number of worker
+# processes started by start.sh; the ASGI application refuses to start with
+# more than one and a process-local broker or cache.
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '1'))
+EVENTS_BROKER = os.getenv('EVENTS_BROKER', 'realestate.events.LocalBroker')
+EVENTS_QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', '100'))
+EVENTS_HEARTBEAT = int(os.getenv('EVENTS_HEARTBEAT', '15'))
+EVENTS_REDIS_URL = os.getenv('EVENTS_REDIS_URL', 'redis://localhost:6379/0')
+EVENTS_REDIS_CHANNEL = os.getenv('EVENTS_REDIS_CHANNEL', 'inquiry-events')
+EVENTS_TICKET_TIMEOUT = int(os.getenv('EVENTS_TICKET_TIMEOUT', '30'))
+
+# Listing engagement counters (see realestate.engagement). Each worker writes
+# its counts every ENGAGEMENT_FLUSH_INTERVAL seconds (from a timer thread when
+# idle, unless ENGAGEMENT_FLUSH_TIMER is off) or once ENGAGEMENT_FLUSH_SIZE
+# listings are pending, ENGAGEMENT_FLUSH_BATCH listings per UPDATE.
+# Popularity halves every POPULARITY_HALF_LIFE_DAYS days.
+ENGAGEMENT_FLUSH_INTERVAL = int(os.getenv('ENGAGEMENT_FLUSH_INTERVAL', '30'))
+ENGAGEMENT_FLUSH_TIMER = os.getenv('ENGAGEMENT_FLUSH_TIMER', 'True') == 'True'
+ENGAGEMENT_FLUSH_SIZE = int(os.getenv('ENGAGEMENT_FLUSH_SIZE', '1000'))
+ENGAGEMENT_FLUSH_BATCH = int(os.getenv('ENGAGEMENT_FLUSH_BATCH', '500'))
+POPULARITY_HALF_LIFE_DAYS = float(os.getenv('POPULARITY_HALF_LIFE_DAYS', '7'))
+
+# Saved search matching (see realestate.saved_searches). Each process checks
+# for changed searches before matching and rebuilds its predicate index every
+# SAVED_SEARCH_INDEX_MAX_AGE seconds.
+SAVED_SEARCH_INDEX_MAX_AGE = int(os.getenv('SAVED_SEARCH_INDEX_MAX_AGE', '3600'))
+
+# Serving of uploaded media (see realestate.media). Behind nginx set
+# MEDIA_SENDFILE_BACKEND=nginx and map MEDIA_ACCEL_REDIRECT_PREFIX to an internal
+# location aliasing MEDIA_ROOT; behind Apache with mod_xsendfile use "apache".
+MEDIA_SENDFILE_BACKEND = os.getenv('MEDIA_SENDFILE_BACKEND', '')
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv('MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+MEDIA_CACHE_MAX_AGE = int(os.getenv('MEDIA_CACHE_MAX_AGE', '3600'))
@@ -1,14 +1,13 @@
-from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
-    TokenRefreshView,
-)
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework import routers
 from realestate.views import (
-    HouseViewSet, PropertyTypeViewSet, FeatureViewSet, PropertyImageViewSet, AgentViewSet, FavoriteViewSet,
-    UserProfileViewSet, RegisterView, UserMeView, PropertyInquiryViewSet,
-    TenantTokenObtainPairView, AgentTokenObtainPairView, AutoDetectRoleTokenObtainPairView
+    HouseViewSet, PropertyTypeViewSet, FeatureViewSet, PropertyImageViewSet, ImageUploadViewSet, AgentViewSet, FavoriteViewSet,
+    SavedSearchViewSet,
+    UserProfileViewSet, RegisterView, UserMeView, PrincipalCacheStatsView, PropertyInquiryViewSet,
+    TenantTokenObtainPairView, AgentTokenObtainPairView, AutoDetectRoleTokenObtainPairView, VersionedTokenRefreshView
 )
 
 router = routers.DefaultRouter()
@@ -18,22 +17,27 @@ router.register(r'properties/types', PropertyTypeViewSet,
 router.register(r'properties/features', FeatureViewSet, basename='feature')
 router.register(r'properties/images', PropertyImageViewSet,
                 basename='propertyimage')
+router.register(r'properties/uploads', ImageUploadViewSet, basename='imageupload')
 router.register(r'properties/agents', AgentViewSet, basename='agent')
 router.register(r'properties/favorites', FavoriteViewSet, basename='favorite')
+router.register(r'properties/saved-searches', SavedSearchViewSet, basename='savedsearch')
 router.register(r'properties/inquiries', PropertyInquiryViewSet,
                 basename='propertyinquiry')
 
 from django.conf import settings
-from django.conf.urls.static import static
+from realestate.events import inquiry_events
+from realestate.media import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # Server-Sent Events stream, ahead of the router's inquiry detail route.
+    path('api/properties/inquiries/events/', inquiry_events, name='inquiry-events'),
     path('api/', include(router.urls)),
     # General token endpoint with automatic role detection
     path('api/users/token/', AutoDetectRoleTokenObtainPairView.as_view(),
          name='token_obtain_pair'),
     path('api/users/token/refresh/',
-         TokenRefreshView.as_view(), name='token_refresh'),
+         VersionedTokenRefreshView.as_view(), name='token_refresh'),
     # Role-specific login endpoints
     path('api/users/tenant/login/',
          TenantTokenObtainPairView.as_view(), name='tenant-login'),
@@ -42,11 +46,16 @@ urlpatterns = [
     # User management endpoints
     path('api/users/register/', RegisterView.as_view(), name='user-register'),
     path('api/users/me/', UserMeView.as_view(), name='user-me'),
+    path('api/users/auth_cache_stats/', PrincipalCacheStatsView.as_view(), name='auth-cache-stats'),
     path('api/users/update_profile/',
          UserProfileViewSet.as_view({'put': 'update'}), name='user-update-profile'),
 
 ]
 
-# Serve static and media files in development
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Serve media files with range and conditional request support. In
+# production the transfer can be delegated to the reverse proxy, see
+# MEDIA_SENDFILE_BACKEND.
+if settings.MEDIA_URL.startswith('/'):
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='media'),
+    ]
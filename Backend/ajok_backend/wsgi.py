@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ajok_backend.settings")
 
 application = get_wsgi_application()
+
+# Load the recommendation index while the server starts taking requests,
+# and write the engagement counts of idle workers.
+from realestate.engagement import start_background_flush  # noqa: E402
+from realestate.recommendations import warm_up_index  # noqa: E402
+
+warm_up_index()
+start_background_flush()
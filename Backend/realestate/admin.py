@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import House, PropertyType, Feature, PropertyImage, Agent, UserProfile, Favorite, PropertyInquiry
+from .models import (House, PropertyType, Feature, PropertyImage, ImageJob, Agent, UserProfile, Favorite, PropertyInquiry,
+                     SavedSearch)
 
 
 @admin.register(House)
@@ -7,7 +8,7 @@ class HouseAdmin(admin.ModelAdmin):
     list_display = ('id', 'title', 'price', 'address', 'property_status', 'agent', 'created_at')
     search_fields = ('title', 'address', 'description')
     list_filter = ('property_status', 'created_at', 'bedrooms', 'bathrooms', 'agent')
-    readonly_fields = ('id', 'created_at', 'updated_at')
+    readonly_fields = ('id', 'created_at', 'updated_at', 'view_count', 'favorite_count', 'inquiry_count', 'popularity')
     fieldsets = (
         ('Basic Information', {
             'fields': ('id', 'title', 'description', 'price', 'property_status')
@@ -21,6 +22,9 @@ class HouseAdmin(admin.ModelAdmin):
         ('Ownership', {
             'fields': ('agent', 'created_by', 'status')
         }),
+        ('Engagement', {
+            'fields': ('view_count', 'favorite_count', 'inquiry_count', 'popularity')
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at')
         }),
@@ -33,13 +37,6 @@ class PropertyTypeAdmin(admin.ModelAdmin):
     search_fields = ('name',)
     readonly_fields = ('id', 'property_count')
 
-    def property_count(self, obj):
-        """Return the number of properties of this type."""
-        from .models import House
-        return House.objects.filter(property_type=obj).count()
-
-    property_count.short_description = 'Number of Properties'
-
 
 @admin.register(Feature)
 class FeatureAdmin(admin.ModelAdmin):
@@ -47,20 +44,13 @@ class FeatureAdmin(admin.ModelAdmin):
     search_fields = ('name',)
     readonly_fields = ('id', 'property_count')
 
-    def property_count(self, obj):
-        """Return the number of properties with this feature."""
-        from .models import House
-        return House.objects.filter(features=obj).count()
-
-    property_count.short_description = 'Number of Properties'
-
 
 @admin.register(PropertyImage)
 class PropertyImageAdmin(admin.ModelAdmin):
-    list_display = ('id', 'house', 'image', 'get_agent')
+    list_display = ('id', 'house', 'image', 'width', 'height', 'get_agent')
     list_filter = ('house__property_status', 'house__agent')
     search_fields = ('house__title', 'house__address', 'image')
-    readonly_fields = ('id', 'get_agent')
+    readonly_fields = ('id', 'width', 'height', 'variants', 'get_agent')
 
     def get_agent(self, obj):
         """Return the agent associated with the property."""
@@ -69,12 +59,19 @@ class PropertyImageAdmin(admin.ModelAdmin):
     get_agent.short_description = 'Agent'
 
 
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'image', 'status', 'attempts', 'created_at', 'updated_at')
+    list_filter = ('status',)
+    readonly_fields = ('id', 'image', 'attempts', 'error', 'created_at', 'updated_at')
+
+
 @admin.register(Agent)
 class AgentAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'phone', 'email', 'company', 'license_number', 'years_of_experience', 'property_count')
     search_fields = ('name', 'phone', 'email', 'company', 'license_number', 'specialization')
     list_filter = ('years_of_experience', 'company', 'specialization')
-    readonly_fields = ('id', 'property_count')
+    readonly_fields = ('id', 'property_count', 'pending_inquiry_count', 'responded_inquiry_count')
     fieldsets = (
         ('Basic Information', {
             'fields': ('id', 'user', 'name', 'phone', 'email')
@@ -85,15 +82,11 @@ class AgentAdmin(admin.ModelAdmin):
         ('Properties', {
             'fields': ('property_count',)
         }),
+        ('Inquiries', {
+            'fields': ('pending_inquiry_count', 'responded_inquiry_count')
+        }),
     )
 
-    def property_count(self, obj):
-        """Return the number of properties associated with this agent."""
-        from .models import House
-        return House.objects.filter(agent=obj).count()
-
-    property_count.short_description = 'Number of Properties'
-
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
@@ -171,4 +164,11 @@ class PropertyInquiryAdmin(admin.ModelAdmin):
 
     get_agent.short_description = 'Agent'
 
+@admin.register(SavedSearch)
+class SavedSearchAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'name', 'property_type', 'property_status', 'min_price', 'max_price', 'created_at')
+    list_filter = ('property_status', 'property_type', 'created_at')
+    search_fields = ('user__username', 'user__email', 'name')
+    readonly_fields = ('id', 'created_at', 'updated_at')
+
 # Register your models here.
@@ -0,0 +1,170 @@
+"""
+JWT authentication from signed role claims.
+
+Tokens issued at login carry the user's role, agent id and token version as
+claims. On read-only requests ClaimsJWTAuthentication builds the request
+user from those claims alone, so permission checks and role-based querysets
+run without loading the user, their profile or their agent from the
+database. Writes and token refreshes still load the user and reject tokens
+whose version is behind the profile's.
+
+The version is bumped whenever a user's role changes, their agent profile
+is removed or their account is deactivated (see realestate.signals), which
+invalidates every token issued before. A read-only request trusts its
+claims until the access token expires (SIMPLE_JWT ACCESS_TOKEN_LIFETIME).
+
+Requests that do load the user get it, with the current role, agent id and
+token version, from the principal cache in realestate.principals unless
+PRINCIPAL_CACHE_ENABLED is off.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import Agent, UserProfile
+from .principals import build_user, get_principal, invalidate_principals, principal_cache_enabled
+
+ROLE_CLAIM = 'role'
+AGENT_CLAIM = 'agent_id'
+VERSION_CLAIM = 'token_version'
+
+# User fields carried in the token, enough for permission checks.
+USER_CLAIMS = ('username', 'is_staff', 'is_superuser')
+
+
+def add_role_claims(token, user):
+    """
+    Add the role, agent id and token version of `user` to `token`.
+    """
+    profile = getattr(user, 'profile', None)
+    role = profile.role if profile else None
+    agent_id = Agent.objects.filter(user=user).values_list('pk', flat=True).first() if role == 'agent' else None
+    for name in USER_CLAIMS:
+        token[name] = getattr(user, name)
+    token[ROLE_CLAIM] = role
+    token[AGENT_CLAIM] = str(agent_id) if agent_id else None
+    token[VERSION_CLAIM] = profile.token_version if profile else 0
+    return token
+
+
+class RoleRefreshToken(RefreshToken):
+    """
+    Refresh token carrying role claims, which its access tokens copy.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        return add_role_claims(super().for_user(user), user)
+
+
+def token_version(user_id):
+    """
+    Return the current token version of a user, 0 if they have no profile.
+    """
+    return UserProfile.objects.filter(user_id=user_id).values_list('token_version', flat=True).first() or 0
+
+
+def check_token_version(token, current):
+    if token.get(VERSION_CLAIM, 0) != current:
+        raise AuthenticationFailed('Token has been revoked, please log in again.', code='token_not_valid')
+
+
+def invalidate_tokens(user_ids):
+    """
+    Revoke every token issued so far to the given users.
+    """
+    UserProfile.objects.filter(user_id__in=user_ids).update(token_version=F('token_version') + 1)
+    invalidate_principals(user_ids)
+
+
+def get_role(user):
+    """
+    Return the role of the request user, from the token claims when they were
+    used to authenticate and from the profile otherwise.
+    """
+    claims = getattr(user, 'token_claims', None)
+    if claims is not None:
+        return claims[ROLE_CLAIM]
+    profile = getattr(user, 'profile', None)
+    return profile.role if profile else None
+
+
+def get_agent_id(user):
+    """
+    Return the id of the request user's agent profile, or None.
+    """
+    claims = getattr(user, 'token_claims', None)
+    if claims is not None and claims[AGENT_CLAIM]:
+        return claims[AGENT_CLAIM]
+    if get_role(user) != 'agent':
+        return None
+    # Agent profiles created after the token was issued.
+    return Agent.objects.filter(user_id=user.pk).values_list('pk', flat=True).first()
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication building the user of read-only requests from token claims.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+
+        if request.method in SAFE_METHODS and ROLE_CLAIM in validated_token:
+            return self.get_claims_user(validated_token), validated_token
+        return self.get_user(validated_token), validated_token
+
+    def get_claims_user(self, validated_token):
+        """
+        Return a user built from the token claims, with the fields not
+        carried in them deferred. Views serializing the user load it
+        themselves (see UserMeView) rather than reading deferred fields one
+        query at a time.
+        """
+        user_model = get_user_model()
+        values = {
+            api_settings.USER_ID_FIELD: validated_token[api_settings.USER_ID_CLAIM],
+            'is_active': True,
+            **{name: validated_token.get(name, False) for name in USER_CLAIMS},
+        }
+        # from_db expects the loaded fields in model order.
+        names = [field.attname for field in user_model._meta.concrete_fields if field.attname in values]
+        user = user_model.from_db('default', names, [values[name] for name in names])
+        user.token_claims = {ROLE_CLAIM: validated_token[ROLE_CLAIM], AGENT_CLAIM: validated_token.get(AGENT_CLAIM)}
+        return user
+
+    def get_user(self, validated_token):
+        # Revocation on password change needs the password hash, which
+        # cached principals do not keep.
+        if not principal_cache_enabled() or api_settings.CHECK_REVOKE_TOKEN:
+            user = super().get_user(validated_token)
+            if ROLE_CLAIM in validated_token:
+                check_token_version(validated_token, token_version(user.pk))
+                user.token_claims = {ROLE_CLAIM: validated_token[ROLE_CLAIM], AGENT_CLAIM: validated_token.get(AGENT_CLAIM)}
+            return user
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+        bundle = get_principal(user_id)
+        if bundle is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        user = build_user(bundle)
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if ROLE_CLAIM in validated_token:
+            check_token_version(validated_token, bundle['token_version'])
+        # Claims from the database are current even for tokens issued without them.
+        user.token_claims = {ROLE_CLAIM: bundle['role'], AGENT_CLAIM: bundle['agent_id']}
+        return user
@@ -0,0 +1,87 @@
+"""
+Reference counting and garbage collection of content-addressed image files.
+
+Every file written by realestate.storage.ContentAddressedStorage has an
+ImageBlob row. Its ref_count is the number of times property images use
+the file, as their original or as one of their variants, and is kept up to
+date by the PropertyImage signal handlers. Files whose count drops to zero
+are deleted by collect_garbage (the `collect_image_blobs` command).
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .images import VARIANT_FORMATS
+from .models import ImageBlob, PropertyImage
+
+# Unreferenced blobs younger than this are kept: the image row that will
+# reference them may not be committed yet.
+DEFAULT_GRACE_PERIOD = timedelta(hours=24)
+
+
+def blob_names(image):
+    """
+    Return the storage names used by a property image: its original and
+    each of its variant files.
+    """
+    names = [image.image.name] if image.image else []
+    for variant in (image.variants or {}).values():
+        names.extend(variant[extension] for extension in VARIANT_FORMATS if extension in variant)
+    return names
+
+
+def adjust_blob_references(names, delta):
+    """
+    Add `delta` references to the blobs stored under the given names, with
+    one UPDATE per distinct multiplicity. Names that are not blobs (files
+    stored before content addressing) are ignored.
+    """
+    by_count = {}
+    for name, count in Counter(names).items():
+        by_count.setdefault(count, []).append(name)
+    for count, group in by_count.items():
+        queryset = ImageBlob.objects.filter(name__in=group)
+        if delta < 0:
+            queryset = queryset.filter(ref_count__gte=-delta * count)
+        queryset.update(ref_count=F('ref_count') + delta * count)
+
+
+def update_blob_references(old_names, new_names):
+    old, new = Counter(old_names), Counter(new_names)
+    adjust_blob_references(list((new - old).elements()), 1)
+    adjust_blob_references(list((old - new).elements()), -1)
+
+
+def collect_garbage(grace_period=DEFAULT_GRACE_PERIOD, dry_run=False):
+    """
+    Recount blob references from the image table, fix drifted counters and
+    delete blobs nothing refers to. Returns (fixed counters, deleted blobs).
+    """
+    storage = PropertyImage._meta.get_field('image').storage
+    cutoff = timezone.now() - grace_period
+    with transaction.atomic():
+        references = Counter()
+        for image in PropertyImage.objects.only('image', 'variants').iterator(chunk_size=500):
+            references.update(blob_names(image))
+
+        drifted, garbage = [], []
+        for blob in ImageBlob.objects.only('digest', 'name', 'ref_count', 'stored_at').iterator(chunk_size=500):
+            if blob.ref_count != references[blob.name]:
+                blob.ref_count = references[blob.name]
+                drifted.append(blob)
+            if blob.ref_count == 0 and blob.stored_at < cutoff:
+                garbage.append(blob)
+        if dry_run:
+            return len(drifted), len(garbage)
+
+        ImageBlob.objects.bulk_update(drifted, ['ref_count'], batch_size=500)
+        # Skip blobs that gained a reference since they were counted.
+        garbage = ImageBlob.objects.filter(digest__in=[blob.digest for blob in garbage], ref_count=0)
+        names = list(garbage.values_list('name', flat=True))
+        garbage.delete()
+    for name in names:
+        storage.purge(name)
+    return len(drifted), len(names)
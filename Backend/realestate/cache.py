@@ -0,0 +1,167 @@
+"""
+Per-listing cache of serialized house representations.
+
+Each fragment is the rendered JSON of one house for one serializer variant
+(serializer class, rendered fields and host used for absolute URLs), keyed by
+the house id and its `updated_at`. Changes to a house's images, features or
+property type bump `updated_at` through the signal handlers in
+realestate.signals, so stale fragments are never read again and simply
+expire from the cache.
+
+The nested agent is cached separately, keyed by the agent id and
+Agent.updated_at, and merged in when the page is assembled. Agent changes,
+including the property count moving when one of their listings is added or
+removed, thus never rewrite the agent's other listings.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+
+from .models import Agent, House
+from .sync import record_changes
+
+HITS_KEY = 'listing-fragment:hits'
+MISSES_KEY = 'listing-fragment:misses'
+
+
+def get_fragment_cache():
+    return caches[getattr(settings, 'LISTING_FRAGMENT_CACHE', 'default')]
+
+
+def touch_listings(queryset):
+    """
+    Bump `updated_at` on the given houses so their cached fragments (and
+    anything else keyed on the modification time) are invalidated, and
+    record them as changed for delta sync.
+    """
+    house_ids = list(queryset.values_list('pk', flat=True))
+    if not house_ids:
+        return 0
+    record_changes(house_ids)
+    return House.objects.filter(pk__in=house_ids).update(updated_at=timezone.now())
+
+
+def increment(cache, key, delta):
+    if not delta:
+        return
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # The counter was evicted between add() and incr().
+        cache.set(key, delta, timeout=None)
+
+
+def fragment_cache_stats():
+    """
+    Return the fragment cache hit/miss counters.
+    """
+    cache = get_fragment_cache()
+    counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = counters.get(HITS_KEY, 0)
+    misses = counters.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / lookups, 4) if lookups else None,
+    }
+
+
+def representation_variant(view, serializer=None):
+    """
+    Return a short digest identifying how the view renders objects for this
+    request: serializer class, rendered fields and the host used in URLs.
+    """
+    if serializer is None:
+        serializer = view.get_serializer()
+    request = view.request
+    return hashlib.md5(':'.join([
+        type(serializer).__qualname__,
+        ','.join(sorted(serializer.fields)),
+        request.scheme,
+        request.get_host(),
+    ]).encode()).hexdigest()
+
+
+def render_listings(view, houses):
+    """
+    Return the serialized data of houses, in order, for the serializer the
+    view would use for this request.
+
+    Cached fragments are fetched with a single multi-get. Relations are
+    prefetched only for the misses, which are serialized in one pass and
+    written back with a single multi-set.
+    """
+    serializer = view.get_serializer()
+    variant = representation_variant(view, serializer)
+    names = [name for name, field in serializer.fields.items() if not field.write_only]
+    with_agent = 'agent' in names
+    house_kwargs = {'fields': [name for name in names if name != 'agent']} if with_agent else {}
+    keys = {
+        house.pk: f'listing-fragment:{variant}:{house.pk}:{house.updated_at.isoformat()}'
+        for house in houses
+    }
+
+    cache = get_fragment_cache()
+    fragments = cache.get_many(list(keys.values()))
+    misses = [house for house in houses if keys[house.pk] not in fragments]
+
+    if misses:
+        if with_agent:
+            serializer = view.get_serializer(**house_kwargs)
+        prefetch_related_objects(misses, *serializer.get_prefetch_lookups())
+        rendered = view.get_serializer(misses, many=True, **house_kwargs).data
+        new_fragments = {keys[house.pk]: data for house, data in zip(misses, rendered)}
+        cache.set_many(new_fragments, timeout=getattr(settings, 'LISTING_FRAGMENT_CACHE_TIMEOUT', 3600))
+        fragments.update(new_fragments)
+
+    increment(cache, HITS_KEY, len(houses) - len(misses))
+    increment(cache, MISSES_KEY, len(misses))
+    if not with_agent:
+        return [fragments[keys[house.pk]] for house in houses]
+
+    agents = render_agents(view, houses)
+    return [
+        {name: agents.get(house.agent_id) if name == 'agent' else fragments[keys[house.pk]][name] for name in names}
+        for house in houses
+    ]
+
+
+def render_agents(view, houses):
+    """
+    Return {agent id: serialized agent} for the agents of houses, from
+    fragments keyed by Agent.updated_at. Agents loaded with the houses
+    (select_related) cost no query to look up.
+    """
+    versions = {}
+    unloaded = set()
+    for house in houses:
+        if house.agent_id is None:
+            continue
+        if House.agent.is_cached(house):
+            versions[house.agent_id] = house.agent.updated_at
+        else:
+            unloaded.add(house.agent_id)
+    if unloaded:
+        versions.update(Agent.objects.filter(pk__in=unloaded).values_list('pk', 'updated_at'))
+    if not versions:
+        return {}
+
+    keys = {pk: f'listing-agent:{pk}:{updated_at.isoformat()}' for pk, updated_at in versions.items()}
+    cache = get_fragment_cache()
+    fragments = cache.get_many(list(keys.values()))
+    missing = [pk for pk, key in keys.items() if key not in fragments]
+    if missing:
+        # Imported here: serializers imports this module through realestate.uploads.
+        from .serializers import AgentSerializer
+
+        agents = list(Agent.objects.select_related('user').filter(pk__in=missing))
+        rendered = AgentSerializer(agents, many=True, context=view.get_serializer_context()).data
+        new_fragments = {keys[agent.pk]: data for agent, data in zip(agents, rendered)}
+        cache.set_many(new_fragments, timeout=getattr(settings, 'LISTING_FRAGMENT_CACHE_TIMEOUT', 3600))
+        fragments.update(new_fragments)
+    return {pk: fragments[key] for pk, key in keys.items() if key in fragments}
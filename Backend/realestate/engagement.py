@@ -0,0 +1,215 @@
+"""
+Write-behind engagement counters and popularity.
+
+Listing views, favorites and inquiries are counted in memory by each worker
+and written to House.view_count, favorite_count, inquiry_count and
+popularity in batches: one UPDATE per ENGAGEMENT_FLUSH_BATCH listings,
+adding every pending delta through a CASE on the primary key. A flush runs
+in the request that finds the last one more than ENGAGEMENT_FLUSH_INTERVAL
+seconds old or ENGAGEMENT_FLUSH_SIZE listings pending, and when the process
+exits. Server processes also flush from a timer thread
+ENGAGEMENT_FLUSH_INTERVAL seconds after a count lands in an empty buffer,
+so that a worker going idle still writes its counts: the timer is enabled
+by `start_background_flush`, which the WSGI and ASGI entry points call
+unless ENGAGEMENT_FLUSH_TIMER is off. Management commands and the test
+runner never load those, so they only flush inline. A crashed server
+worker thus loses at most that window of counts.
+
+Popularity decays with a half-life of POPULARITY_HALF_LIFE_DAYS. Instead of
+rewriting every row as time passes, an event at time t adds
+weight * 2 ** ((t - EPOCH) / half_life): all scores then share the same
+decay factor at any moment, so ordering by the stored column ranks
+listings by their decayed popularity and `ordering=popular` is an index
+scan on (popularity, id). With a 7-day half-life the increments stay
+within double precision for about 19 years after EPOCH; before then, move
+EPOCH forward and scale the stored scores down by the same factor.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Case, F, FloatField, IntegerField, Value, When
+
+from .models import House
+
+logger = logging.getLogger(__name__)
+
+# 2025-01-01T00:00:00Z, the reference point of popularity increments.
+EPOCH = 1735689600
+
+# Popularity added by each kind of engagement, and the counter it bumps.
+WEIGHTS = {
+    'view': 1.0,
+    'favorite': 5.0,
+    'inquiry': 10.0,
+}
+COUNTERS = {
+    'view': 'view_count',
+    'favorite': 'favorite_count',
+    'inquiry': 'inquiry_count',
+}
+
+
+def popularity_increment(kind, now=None):
+    half_life = getattr(settings, 'POPULARITY_HALF_LIFE_DAYS', 7) * 86400
+    return WEIGHTS[kind] * 2 ** (((now or time.time()) - EPOCH) / half_life)
+
+
+class EngagementBuffer:
+    """
+    Per-process engagement deltas awaiting a flush.
+    """
+
+    def __init__(self, timer_class=None):
+        self.lock = threading.Lock()
+        self.pending = defaultdict(lambda: defaultdict(float))
+        self.flushed_at = time.monotonic()
+        # Called as timer_class(interval, function) to flush in the
+        # background; None leaves flushing to requests and process exit.
+        self.timer_class = timer_class
+        self.timer = None
+
+    def record(self, house_id, kind, count=1):
+        with self.lock:
+            deltas = self.pending[str(house_id)]
+            deltas[COUNTERS[kind]] += count
+            deltas['popularity'] += count * popularity_increment(kind)
+            due = (
+                len(self.pending) >= getattr(settings, 'ENGAGEMENT_FLUSH_SIZE', 1000)
+                or time.monotonic() - self.flushed_at >= getattr(settings, 'ENGAGEMENT_FLUSH_INTERVAL', 30)
+            )
+        if due:
+            self.flush()
+        self.schedule()
+
+    def schedule(self):
+        """
+        Start the timer flushing the pending deltas, unless there is no
+        timer class or one is running.
+        """
+        with self.lock:
+            if self.timer_class is None or not self.pending or self.timer is not None:
+                return
+            self.timer = self.timer_class(
+                getattr(settings, 'ENGAGEMENT_FLUSH_INTERVAL', 30), self.flush_in_background)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def cancel(self):
+        """
+        Stop the running timer, if any. Pending deltas are kept.
+        """
+        with self.lock:
+            timer, self.timer = self.timer, None
+        if timer is not None:
+            timer.cancel()
+
+    def flush_in_background(self):
+        with self.lock:
+            self.timer = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Could not flush engagement counters")
+        finally:
+            # The timer thread got its own connection; do not leak it.
+            connection.close()
+        # Deltas put back by a failed flush are retried on the next tick.
+        self.schedule()
+
+    def take(self):
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(lambda: defaultdict(float))
+            self.flushed_at = time.monotonic()
+        return pending
+
+    def restore(self, pending):
+        with self.lock:
+            for house_id, deltas in pending.items():
+                for field, delta in deltas.items():
+                    self.pending[house_id][field] += delta
+
+    def flush(self):
+        """
+        Write the pending deltas and return the number of listings updated.
+        Deltas are kept for the next flush if the database refuses them.
+        """
+        pending = self.take()
+        if not pending:
+            return 0
+        batch_size = getattr(settings, 'ENGAGEMENT_FLUSH_BATCH', 500)
+        house_ids = list(pending)
+        written = 0
+        try:
+            for start in range(0, len(house_ids), batch_size):
+                chunk = house_ids[start:start + batch_size]
+                with transaction.atomic():
+                    written += House.objects.filter(pk__in=chunk).update(**increments(chunk, pending))
+                for house_id in chunk:
+                    del pending[house_id]
+        except DatabaseError:
+            logger.exception("Could not flush engagement counters of %d listing(s)", len(pending))
+            self.restore(pending)
+        return written
+
+    def __len__(self):
+        return len(self.pending)
+
+
+def increments(house_ids, pending):
+    """
+    Return the update() arguments adding each listing's deltas to its row.
+    """
+    changes = {}
+    fields = [(name, int, IntegerField()) for name in COUNTERS.values()] + [('popularity', float, FloatField())]
+    for field, convert, output_field in fields:
+        whens = [
+            When(pk=house_id, then=Value(convert(pending[house_id][field]), output_field=output_field))
+            for house_id in house_ids if pending[house_id].get(field)
+        ]
+        if whens:
+            changes[field] = F(field) + Case(*whens, default=Value(convert(0), output_field=output_field))
+    return changes
+
+
+_buffer = EngagementBuffer()
+
+
+def get_buffer():
+    return _buffer
+
+
+def record_engagement(house_id, kind):
+    """
+    Count a view, favorite or inquiry of a listing.
+    """
+    _buffer.record(house_id, kind)
+
+
+def record_engagement_on_commit(house_id, kind):
+    transaction.on_commit(lambda: record_engagement(house_id, kind))
+
+
+def flush_engagement():
+    return _buffer.flush()
+
+
+def start_background_flush():
+    """
+    Flush this process's counts from a timer thread as well, unless
+    ENGAGEMENT_FLUSH_TIMER is off. Called when the server starts.
+    """
+    if getattr(settings, 'ENGAGEMENT_FLUSH_TIMER', True):
+        _buffer.timer_class = threading.Timer
+
+
+@atexit.register
+def flush_on_exit():
+    try:
+        flush_engagement()
+    except Exception:
+        logger.exception("Could not flush engagement counters on exit")
@@ -0,0 +1,414 @@
+"""
+Real-time inquiry notifications over Server-Sent Events.
+
+When an inquiry is created, responded to or closed, an event is published,
+once the transaction commits, to the channel of the property's agent
+("agent:<agent id>") and to that of the tenant ("tenant:<user id>").
+`inquiry_events` streams the events of the requesting user's channel as
+text/event-stream, so clients can stop polling the inquiry list.
+
+Publishing goes through the broker named by EVENTS_BROKER. LocalBroker
+delivers within the current process, which suits a single ASGI worker and
+tests. RedisBroker forwards publish() to Redis pub/sub and hands what each
+worker receives to its local subscriptions, so it reaches the clients of
+every worker.
+
+Every subscription has a bounded queue (EVENTS_QUEUE_SIZE). A client that
+falls behind has its backlog dropped and gets a single "resync" event,
+telling it to reload its inquiries, instead of holding memory without
+bound. Idle streams carry a comment every EVENTS_HEARTBEAT seconds so
+proxies keep them open and dead clients are noticed, and streams end when
+the access token expires.
+
+Streams hold their connection open and must be served by an ASGI server
+(see start.sh); under WSGI each one would tie up a worker thread, so the
+stream answers 501 there. With WEB_CONCURRENCY above one, the ASGI
+application refuses to start on process-local state (check_worker_setup).
+
+EventSource cannot set headers, so browsers first exchange their access
+token for a stream ticket (POST .../inquiries/events/ticket/) and open the
+stream with `?ticket=`. Tickets are random, expire after
+EVENTS_TICKET_TIMEOUT seconds and are redeemed once, so URLs that end up in
+access logs are of no use.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import secrets
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from .authentication import ClaimsJWTAuthentication, get_agent_id, get_role
+
+logger = logging.getLogger(__name__)
+
+RESYNC = {'type': 'resync'}
+
+# Reconnection delay suggested to EventSource clients, in milliseconds.
+RETRY_MS = 5000
+
+_event_ids = itertools.count(1)
+
+
+def agent_channel(agent_id):
+    return f'agent:{agent_id}'
+
+
+def tenant_channel(user_id):
+    return f'tenant:{user_id}'
+
+
+class Subscription:
+    """
+    Bounded queue of events for one stream, fed from any thread.
+    """
+
+    def __init__(self, broker, channels, queue_size):
+        self.broker = broker
+        self.channels = tuple(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def deliver(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self.put, event)
+        except RuntimeError:
+            # The stream's event loop has closed.
+            self.broker.unsubscribe(self)
+
+    def put(self, event):
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            event = RESYNC
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout):
+        """
+        Return the next event, raising asyncio.TimeoutError after `timeout` seconds.
+        """
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class Broker:
+    """
+    Base class of event brokers.
+    """
+
+    def subscribe(self, channels, queue_size):
+        """
+        Return a Subscription to the given channels. Called from the
+        stream's event loop.
+        """
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+    def publish(self, channels, event):
+        """
+        Deliver an event to the subscribers of the given channels. Safe to
+        call from any thread.
+        """
+        raise NotImplementedError
+
+
+class LocalBroker(Broker):
+    """
+    Broker delivering events to the subscriptions of the current process.
+    """
+    process_local = True
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+
+    def subscribe(self, channels, queue_size):
+        subscription = Subscription(self, channels, queue_size)
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                subscribers = self.subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.subscriptions[channel]
+
+    def publish(self, channels, event):
+        with self.lock:
+            subscribers = set().union(*(self.subscriptions.get(channel, ()) for channel in channels))
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+    def broadcast(self, event):
+        """
+        Deliver an event to every subscription of this process.
+        """
+        with self.lock:
+            subscribers = set().union(*self.subscriptions.values())
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+    def subscriber_count(self):
+        with self.lock:
+            return len(set().union(*self.subscriptions.values()))
+
+
+class RedisBroker(LocalBroker):
+    """
+    Broker relaying events between workers over Redis pub/sub.
+
+    Each event is published once on EVENTS_REDIS_CHANNEL together with the
+    channels it is for. Every process listens from a daemon thread, started
+    with its first subscription, and delivers what it receives to its own
+    subscriptions. Events published while the connection is down are lost,
+    so after reconnecting the subscriptions get a resync.
+    """
+    process_local = False
+    reconnect_delay = 1
+
+    def __init__(self, client=None):
+        super().__init__()
+        if client is None:
+            try:
+                import redis
+            except ImportError as exc:
+                raise ImproperlyConfigured('RedisBroker requires the redis package.') from exc
+            client = redis.Redis.from_url(getattr(settings, 'EVENTS_REDIS_URL', 'redis://localhost:6379/0'))
+        self.client = client
+        self.channel = getattr(settings, 'EVENTS_REDIS_CHANNEL', 'inquiry-events')
+        self.listener = None
+
+    def subscribe(self, channels, queue_size):
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self.listen, name='inquiry-events', daemon=True)
+                self.listener.start()
+        return super().subscribe(channels, queue_size)
+
+    def listen(self):
+        reconnected = False
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                if reconnected:
+                    self.broadcast(RESYNC)
+                for message in pubsub.listen():
+                    self.receive(message['data'])
+            except Exception:
+                logger.warning('Lost the connection to the event broker, reconnecting', exc_info=True)
+            reconnected = True
+            time.sleep(self.reconnect_delay)
+
+    def receive(self, data):
+        """
+        Deliver a message read from the bus to the local subscriptions.
+        """
+        message = json.loads(data)
+        super().publish(message['channels'], message['event'])
+
+    def publish(self, channels, event):
+        self.client.publish(self.channel, json.dumps({'channels': list(channels), 'event': event}))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'EVENTS_BROKER', 'realestate.events.LocalBroker'))()
+        return _broker
+
+
+def check_worker_setup():
+    """
+    Raise ImproperlyConfigured if several worker processes (WEB_CONCURRENCY)
+    would keep events or stream tickets to themselves: a process-local
+    broker only reaches its own clients, and a ticket in a local-memory
+    cache can only be redeemed by the worker that issued it. Called when
+    the ASGI application starts.
+    """
+    workers = getattr(settings, 'WEB_CONCURRENCY', 1)
+    if workers <= 1:
+        return
+    broker = getattr(settings, 'EVENTS_BROKER', 'realestate.events.LocalBroker')
+    if import_string(broker).process_local:
+        raise ImproperlyConfigured(
+            f'EVENTS_BROKER {broker} only reaches clients of its own process, but WEB_CONCURRENCY is '
+            f'{workers}. Use realestate.events.RedisBroker.')
+    if isinstance(caches['default'], LocMemCache):
+        raise ImproperlyConfigured(
+            f'Stream tickets need a cache shared by the {workers} workers; the default cache is local memory.')
+
+
+def reset_broker():
+    global _broker
+    with _broker_lock:
+        _broker = None
+
+
+def publish_inquiry_events(events):
+    """
+    Publish (event type, inquiry id, house id, status, agent id, tenant id)
+    tuples once the current transaction commits.
+    """
+    events = list(events)
+    if not events:
+        return
+
+    def publish():
+        broker = get_broker()
+        for kind, inquiry_id, house_id, status, agent_id, tenant_id in events:
+            channels = [tenant_channel(tenant_id)]
+            if agent_id is not None:
+                channels.append(agent_channel(agent_id))
+            broker.publish(channels, {
+                'type': kind,
+                'id': str(inquiry_id),
+                'house_id': str(house_id),
+                'status': status,
+            })
+
+    transaction.on_commit(publish)
+
+
+def format_event(event):
+    """
+    Encode an event as a Server-Sent Events message.
+    """
+    data = {key: value for key, value in event.items() if key != 'type'}
+    return f"id: {next(_event_ids)}\nevent: {event['type']}\ndata: {json.dumps(data)}\n\n"
+
+
+def subscriber_channels(user):
+    """
+    Return the channels a user's stream listens to.
+    """
+    role = get_role(user)
+    if role == 'agent':
+        agent_id = get_agent_id(user)
+        return [agent_channel(agent_id)] if agent_id else []
+    if role == 'tenant':
+        return [tenant_channel(user.pk)]
+    return []
+
+
+def ticket_key(ticket):
+    return f'events-ticket:{ticket}'
+
+
+def issue_ticket(raw_token):
+    """
+    Return a single-use ticket opening a stream as the holder of an access
+    token, valid for EVENTS_TICKET_TIMEOUT seconds.
+    """
+    ticket = secrets.token_urlsafe(32)
+    cache.set(ticket_key(ticket), raw_token, getattr(settings, 'EVENTS_TICKET_TIMEOUT', 30))
+    return ticket
+
+
+def redeem_ticket(ticket):
+    """
+    Return the access token a ticket was issued for, or None if the ticket
+    is unknown, expired or already used.
+    """
+    key = ticket_key(ticket)
+    raw_token = cache.get(key)
+    # Of two requests redeeming the same ticket, only one deletes it.
+    if raw_token is None or not cache.delete(key):
+        return None
+    return raw_token
+
+
+def authenticate(request):
+    """
+    Return the user and validated access token of a stream request. The
+    token comes from the Authorization header or, since EventSource cannot
+    set headers, from the stream ticket in the `ticket` query parameter.
+    """
+    authentication = ClaimsJWTAuthentication()
+    header = authentication.get_header(request)
+    if header:
+        raw_token = authentication.get_raw_token(header)
+    elif 'ticket' in request.GET:
+        raw_token = redeem_ticket(request.GET['ticket'])
+        if raw_token is None:
+            raise AuthenticationFailed('Stream ticket is invalid or expired.')
+        raw_token = raw_token.encode()
+    else:
+        raw_token = None
+    if not raw_token:
+        raise AuthenticationFailed('Authentication credentials were not provided.')
+    validated_token = authentication.get_validated_token(raw_token)
+    # Streams outlive single requests, so check revocation like writes do.
+    return authentication.get_user(validated_token), validated_token
+
+
+async def inquiry_events(request):
+    """
+    Stream inquiry events for the authenticated agent or tenant as
+    text/event-stream.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'detail': 'Inquiry events are only served over ASGI.'}, status=501)
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+    try:
+        user, token = await sync_to_async(authenticate)(request)
+    except (AuthenticationFailed, InvalidToken) as exc:
+        return JsonResponse(exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}, status=401)
+    channels = await sync_to_async(subscriber_channels)(user)
+    if not channels:
+        return JsonResponse({'detail': 'Only agents and tenants receive inquiry events.'}, status=403)
+
+    broker = get_broker()
+    subscription = broker.subscribe(channels, getattr(settings, 'EVENTS_QUEUE_SIZE', 100))
+    heartbeat = getattr(settings, 'EVENTS_HEARTBEAT', 15)
+    deadline = time.monotonic() + max(token['exp'] - time.time(), 0)
+    # Events published while a client was reconnecting are lost.
+    resync = 'HTTP_LAST_EVENT_ID' in request.META
+
+    async def stream():
+        try:
+            yield f'retry: {RETRY_MS}\n\n'
+            if resync:
+                yield format_event(RESYNC)
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    event = await subscription.get(min(heartbeat, remaining))
+                except asyncio.TimeoutError:
+                    yield ': heartbeat\n\n'
+                    continue
+                yield format_event(event)
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
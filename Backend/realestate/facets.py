@@ -0,0 +1,98 @@
+"""
+Facet counts for the listing filters.
+
+All facets are computed from one GROUP BY query: every listing in the
+filtered queryset is labelled with its bedroom bucket, bathroom bucket and
+price band by CASE expressions, the rows are grouped on those labels plus
+property type and status, and the (small) grouped result is rolled up per
+facet in Python.
+"""
+from collections import OrderedDict
+
+from django.db.models import Case, CharField, Count, Value, When
+
+from .models import House
+
+# Upper bounds (exclusive) of the price bands, in USD. The last band is open ended.
+PRICE_BAND_BOUNDS = [500, 1000, 5000, 20000, 100000, 500000]
+
+# Room counts at or above these values are grouped into a single "N+" bucket.
+MAX_BEDROOM_BUCKET = 5
+MAX_BATHROOM_BUCKET = 4
+
+
+def room_bucket(field, maximum):
+    whens = [When(**{field: count}, then=Value(str(count))) for count in range(maximum)]
+    return Case(*whens, default=Value(f'{maximum}+'), output_field=CharField())
+
+
+def bucket_labels(maximum):
+    return [str(count) for count in range(maximum)] + [f'{maximum}+']
+
+
+def price_band_labels():
+    labels = []
+    lower = 0
+    for upper in PRICE_BAND_BOUNDS:
+        labels.append(f'{lower}-{upper}')
+        lower = upper
+    labels.append(f'{lower}+')
+    return labels
+
+
+def price_band():
+    labels = price_band_labels()
+    whens = [When(price__lt=upper, then=Value(label)) for upper, label in zip(PRICE_BAND_BOUNDS, labels)]
+    return Case(*whens, default=Value(labels[-1]), output_field=CharField())
+
+
+def listing_facets(queryset):
+    """
+    Return facet counts for a filtered House queryset.
+    """
+    groups = (
+        queryset
+        .prefetch_related(None)
+        .order_by()
+        .annotate(
+            bedroom_bucket=room_bucket('bedrooms', MAX_BEDROOM_BUCKET),
+            bathroom_bucket=room_bucket('bathrooms', MAX_BATHROOM_BUCKET),
+            price_band=price_band(),
+        )
+        .values('property_type_id', 'property_type__name', 'property_status',
+                'bedroom_bucket', 'bathroom_bucket', 'price_band')
+        .annotate(count=Count('pk'))
+    )
+
+    status_labels = dict(House.PROPERTY_STATUS_CHOICES)
+    property_types = OrderedDict()
+    property_status = OrderedDict((value, 0) for value in status_labels)
+    bedrooms = OrderedDict((label, 0) for label in bucket_labels(MAX_BEDROOM_BUCKET))
+    bathrooms = OrderedDict((label, 0) for label in bucket_labels(MAX_BATHROOM_BUCKET))
+    price_bands = OrderedDict((label, 0) for label in price_band_labels())
+    total = 0
+
+    for group in groups:
+        count = group['count']
+        total += count
+        type_id = group['property_type_id']
+        if type_id is not None:
+            entry = property_types.setdefault(type_id, {
+                'id': type_id, 'name': group['property_type__name'], 'count': 0})
+            entry['count'] += count
+        property_status[group['property_status']] = property_status.get(group['property_status'], 0) + count
+        bedrooms[group['bedroom_bucket']] += count
+        bathrooms[group['bathroom_bucket']] += count
+        price_bands[group['price_band']] += count
+
+    return {
+        'count': total,
+        'property_type': sorted(property_types.values(), key=lambda entry: (-entry['count'], entry['name'])),
+        'property_status': [
+            {'value': value, 'label': status_labels.get(value, value), 'count': count}
+            for value, count in property_status.items()
+        ],
+        'bedrooms': [{'value': label, 'count': count} for label, count in bedrooms.items()],
+        'bathrooms': [{'value': label, 'count': count} for label, count in bathrooms.items()],
+        'price': [{'value': label, 'count': count} for label, count in price_bands.items()],
+    }
@@ -0,0 +1,225 @@
+"""
+Geohash cells for map browsing.
+
+Each listing with coordinates stores its geohash, a base-32 string whose
+prefixes name ever smaller cells of a fixed grid, in an ordinary indexed
+column. A bounding box is covered by a handful of cells, and every cell is
+one range scan on the index (geohash >= cell AND geohash < next cell), so
+map queries need no spatial extension on MySQL or SQLite. Grouping on a
+prefix of the geohash clusters listings per cell.
+"""
+import math
+
+from django.db.models import Avg, Count, FloatField, Min, Q
+from django.db.models.functions import Cast, Substr
+
+from .search import prefix_upper_bound
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+PRECISION = 12
+
+# Coverings larger than this fall back to a coarser precision.
+MAX_COVER_CELLS = 32
+
+# Map responses never hold more clusters than this.
+MAX_CLUSTERS = 256
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    """
+    Return the geohash of a point.
+    """
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    latitude, longitude = float(latitude), float(longitude)
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """
+    Return the (height, width) in degrees of a cell of the given precision.
+    """
+    lng_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def split_bbox(bbox):
+    """
+    Split a box crossing the antimeridian into two boxes that do not.
+    """
+    min_lng, min_lat, max_lng, max_lat = bbox
+    if min_lng <= max_lng:
+        return [bbox]
+    return [(min_lng, min_lat, 180.0, max_lat), (-180.0, min_lat, max_lng, max_lat)]
+
+
+def cover(bbox, precision):
+    """
+    Return the geohash cells of the given precision overlapping a box given
+    as (min_lng, min_lat, max_lng, max_lat).
+    """
+    height, width = cell_size(precision)
+    cells = set()
+    for min_lng, min_lat, max_lng, max_lat in split_bbox(bbox):
+        # Walk the grid from the cell containing the south-west corner.
+        lat = math.floor((min_lat + 90) / height) * height - 90
+        while lat <= max_lat and lat < 90:
+            lng = math.floor((min_lng + 180) / width) * width - 180
+            while lng <= max_lng and lng < 180:
+                cells.add(encode(lat + height / 2, lng + width / 2, precision))
+                lng += width
+            lat += height
+    return sorted(cells)
+
+
+def cover_count(bbox, precision):
+    """
+    Return how many cells of the given precision cover a box, without listing them.
+    """
+    height, width = cell_size(precision)
+    count = 0
+    for min_lng, min_lat, max_lng, max_lat in split_bbox(bbox):
+        rows = math.floor((min(max_lat, 90 - 1e-9) + 90) / height) - math.floor((min_lat + 90) / height) + 1
+        columns = math.floor((min(max_lng, 180 - 1e-9) + 180) / width) - math.floor((min_lng + 180) / width) + 1
+        count += rows * columns
+    return count
+
+
+def covering_precision(bbox, target, max_cells=MAX_COVER_CELLS):
+    """
+    Return the finest precision up to `target` covering the box with at most
+    `max_cells` cells.
+    """
+    precision = target
+    while precision > 1 and cover_count(bbox, precision) > max_cells:
+        precision -= 1
+    return precision
+
+
+def zoom_precision(zoom):
+    """
+    Return the geohash precision whose cells are about a quarter of a map
+    tile wide at the given web map zoom level.
+    """
+    target = 360.0 / 2 ** (zoom + 2)
+    precision = 1
+    while precision < PRECISION and cell_size(precision)[1] > target:
+        precision += 1
+    return precision
+
+
+def parse_bbox(value):
+    """
+    Parse "min_lng,min_lat,max_lng,max_lat" into a tuple of floats.
+    Raises ValueError when malformed or out of range.
+    """
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4 or not all(math.isfinite(part) for part in parts):
+        raise ValueError('bbox must be min_lng,min_lat,max_lng,max_lat')
+    min_lng, min_lat, max_lng, max_lat = parts
+    if not (-180 <= min_lng <= 180 and -180 <= max_lng <= 180 and -90 <= min_lat <= max_lat <= 90):
+        raise ValueError('bbox is out of range')
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def parse_point(value):
+    """
+    Parse "lat,lng" into a tuple of floats. Raises ValueError when malformed.
+    """
+    latitude, longitude = [float(part) for part in value.split(',')]
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('point is out of range')
+    return latitude, longitude
+
+
+def radius_bbox(latitude, longitude, radius_km):
+    """
+    Return the box enclosing a circle around a point.
+    """
+    dlat = radius_km / KM_PER_DEGREE
+    dlng = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 1e-6))
+    if dlng >= 180:
+        return -180.0, max(latitude - dlat, -90.0), 180.0, min(latitude + dlat, 90.0)
+    min_lng = (longitude - dlng + 540) % 360 - 180
+    max_lng = (longitude + dlng + 540) % 360 - 180
+    return min_lng, max(latitude - dlat, -90.0), max_lng, min(latitude + dlat, 90.0)
+
+
+def bbox_q(bbox, precision=PRECISION):
+    """
+    Return a Q object matching listings inside the box: index range scans
+    over the covering cells, then the exact coordinates.
+    """
+    precision = covering_precision(bbox, precision)
+    cells = Q()
+    for cell in cover(bbox, precision):
+        cells |= Q(geohash__gte=cell, geohash__lt=prefix_upper_bound(cell))
+
+    min_lng, min_lat, max_lng, max_lat = bbox
+    within = Q(latitude__gte=min_lat, latitude__lte=max_lat)
+    if min_lng <= max_lng:
+        within &= Q(longitude__gte=min_lng, longitude__lte=max_lng)
+    else:
+        within &= Q(longitude__gte=min_lng) | Q(longitude__lte=max_lng)
+    return cells & within
+
+
+def filter_near(queryset, latitude, longitude, radius_km):
+    """
+    Filter listings within radius_km of a point: the enclosing box through
+    the geohash index, then an equirectangular distance check, accurate to
+    well under a percent at city scale.
+    """
+    queryset = queryset.filter(bbox_q(radius_bbox(latitude, longitude, radius_km)))
+    scale = math.cos(math.radians(latitude))
+    dlat = Cast('latitude', FloatField()) - latitude
+    dlng = (Cast('longitude', FloatField()) - longitude) * scale
+    return queryset.alias(distance_squared=dlat * dlat + dlng * dlng).filter(
+        distance_squared__lte=(radius_km / KM_PER_DEGREE) ** 2)
+
+
+def cluster_listings(queryset, bbox, zoom):
+    """
+    Group the listings inside a box into geohash cells sized for the zoom
+    level, with a single GROUP BY query. Returns a list of clusters with
+    their cell, listing count and mean position, plus the listing id for
+    clusters of one. The cell size is coarsened until the box spans at most
+    MAX_CLUSTERS cells, which bounds the response.
+    """
+    precision = covering_precision(bbox, zoom_precision(zoom), MAX_CLUSTERS)
+    rows = (
+        queryset.filter(bbox_q(bbox)).order_by()
+        .annotate(cell=Substr('geohash', 1, precision))
+        .values('cell')
+        .annotate(count=Count('pk'), latitude=Avg('latitude'), longitude=Avg('longitude'), house_id=Min('pk'))
+        .order_by('cell')
+    )
+    return [
+        {
+            'geohash': row['cell'],
+            'count': row['count'],
+            'latitude': round(float(row['latitude']), 6),
+            'longitude': round(float(row['longitude']), 6),
+            'house_id': row['house_id'] if row['count'] == 1 else None,
+        }
+        for row in rows
+    ]
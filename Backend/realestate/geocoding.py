@@ -0,0 +1,130 @@
+"""
+Pluggable geocoding of listing addresses.
+
+GEOCODER names the class turning a listing's location and address into
+coordinates. The default OfflineGeocoder knows the main towns of South
+Sudan and the neighbourhoods of Juba and needs no network, which makes it
+suitable for development and tests; NominatimGeocoder queries
+OpenStreetMap. Listings saved without coordinates, or whose address or
+location changed while their coordinates did not, are geocoded on save
+unless GEOCODE_ON_SAVE is off, in which case `manage.py geocode_listings`
+fills them in. Listings placed at the centroid of a town, neighbourhood or
+street rather than at their building are marked `coordinates_approximate`.
+"""
+import json
+import logging
+import re
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class Geocoder:
+    """
+    Base class of geocoders.
+    """
+
+    def geocode(self, query):
+        """
+        Return (latitude, longitude, approximate) for a free-text place, or
+        None. `approximate` is True when the point is the centre of an area
+        rather than the place itself.
+        """
+        raise NotImplementedError
+
+
+class OfflineGeocoder(Geocoder):
+    """
+    Geocoder matching place names against a built-in gazetteer.
+    Neighbourhoods are tried before towns, so "Munuki, Juba" resolves to Munuki.
+    Every point it returns is a centroid, hence approximate.
+    """
+    NEIGHBOURHOODS = {
+        'munuki': (4.8667, 31.5667),
+        'gudele': (4.8790, 31.5480),
+        'hai malakal': (4.8524, 31.5921),
+        'hai cinema': (4.8530, 31.6010),
+        'jebel': (4.8320, 31.5560),
+        'kator': (4.8440, 31.6030),
+        'thongpiny': (4.8720, 31.5990),
+        'tongping': (4.8720, 31.5990),
+        'gumbo': (4.8620, 31.6400),
+        'juba na bari': (4.8630, 31.5850),
+    }
+    TOWNS = {
+        'juba': (4.8594, 31.5713),
+        'wau': (7.7011, 27.9953),
+        'malakal': (9.5334, 31.6605),
+        'yei': (4.0950, 30.6779),
+        'bor': (6.2092, 31.5589),
+        'torit': (4.4133, 32.5678),
+        'rumbek': (6.8000, 29.6833),
+        'aweil': (8.7619, 27.3999),
+        'bentiu': (9.2333, 29.8333),
+        'kuajok': (8.3000, 27.9833),
+        'yambio': (4.5721, 28.3955),
+        'nimule': (3.5983, 32.0633),
+    }
+
+    def geocode(self, query):
+        text = ' '.join(re.findall(r'\w+', (query or '').lower()))
+        for places in (self.NEIGHBOURHOODS, self.TOWNS):
+            for name, point in places.items():
+                if re.search(rf'\b{name}\b', text):
+                    return (*point, True)
+        return None
+
+
+class NominatimGeocoder(Geocoder):
+    """
+    Geocoder using the OpenStreetMap Nominatim search API. Respect its usage
+    policy: set GEOCODER_USER_AGENT and keep to one request per second, e.g.
+    by geocoding with `manage.py geocode_listings` instead of on save.
+    """
+    url = 'https://nominatim.openstreetmap.org/search'
+    timeout = 5
+    # Nominatim's place rank of buildings and addresses; lower ranks are streets and areas.
+    ADDRESS_RANK = 30
+
+    def geocode(self, query):
+        if not query:
+            return None
+        params = urllib.parse.urlencode({'q': query, 'format': 'json', 'limit': 1})
+        request = urllib.request.Request(
+            f'{self.url}?{params}',
+            headers={'User-Agent': getattr(settings, 'GEOCODER_USER_AGENT', 'junub-real-estate')})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                results = json.load(response)
+        except (urllib.error.URLError, TimeoutError, ValueError) as exc:
+            logger.warning("Geocoding %r failed: %s", query, exc)
+            return None
+        if not results:
+            return None
+        result = results[0]
+        return float(result['lat']), float(result['lon']), int(result.get('place_rank', 0)) < self.ADDRESS_RANK
+
+
+def get_geocoder():
+    return import_string(getattr(settings, 'GEOCODER', 'realestate.geocoding.OfflineGeocoder'))()
+
+
+def geocode_house(house, geocoder=None):
+    """
+    Set the coordinates of a house, and whether they are approximate, from
+    its location and address. Returns True if they were found.
+    """
+    geocoder = geocoder or get_geocoder()
+    for query in (', '.join(filter(None, [house.address, house.location])), house.location, house.address):
+        point = geocoder.geocode(query) if query else None
+        if point is not None:
+            house.latitude, house.longitude, house.coordinates_approximate = point
+            # Lets the pre_save signal tell these from coordinates set by hand.
+            house._geocoded_position = point[:2]
+            return True
+    return False
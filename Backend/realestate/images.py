@@ -0,0 +1,205 @@
+"""
+Background processing of property images.
+
+Uploads are stored inside the request, with their EXIF and XMP metadata
+dropped losslessly by realestate.storage, and an ImageJob is queued for
+each of them. After the transaction commits, the job is handed to a small
+in-process thread pool which records the original's upright dimensions and
+writes resized WebP and JPEG variants next to it. Jobs live in the database,
+so anything the pool did not get to (a restart, or
+IMAGE_PROCESSING_WORKERS = 0) is picked up by `manage.py process_images`.
+"""
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .metadata import strip_metadata
+from .models import ImageJob
+
+logger = logging.getLogger(__name__)
+
+# Longest edge of each variant, in pixels, smallest first.
+VARIANT_SIZES = {
+    'thumbnail': 320,
+    'medium': 960,
+    'large': 1920,
+}
+
+# Pillow format and encoder options per variant file extension.
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+MAX_ATTEMPTS = 3
+
+# Running jobs older than this are assumed to belong to a dead worker.
+STALE_AFTER = timedelta(minutes=10)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_name(image, size, extension):
+    return f'property_images/variants/{image.pk}/{size}.{extension}'
+
+
+def encode(picture, image_format, **options):
+    buffer = io.BytesIO()
+    picture.save(buffer, format=image_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def replace_file(storage, name, content):
+    """
+    Save content under name, replacing the existing file. Content-addressed
+    storage picks the name itself and never overwrites shared files.
+    """
+    if not getattr(storage, 'content_addressed', False) and storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, content)
+
+
+def flatten(picture):
+    """
+    Return picture in RGB, composing transparent images onto white.
+    """
+    if picture.mode in ('RGBA', 'LA') or (picture.mode == 'P' and 'transparency' in picture.info):
+        picture = picture.convert('RGBA')
+        background = Image.new('RGB', picture.size, (255, 255, 255))
+        background.paste(picture, mask=picture.getchannel('A'))
+        return background
+    return picture.convert('RGB')
+
+
+def process_image(image):
+    """
+    Record the upright size of the original and write its variants,
+    stripping the metadata of originals stored before uploads were.
+
+    Variants are never upscaled: sizes larger than the original are skipped,
+    except the smallest one, which every processed image has.
+    """
+    storage = image.image.storage
+    with image.image.open('rb') as source:
+        stripped = strip_metadata(source)
+    if stripped is not None:
+        # Stored before metadata was stripped on upload.
+        with stripped:
+            image.image.name = replace_file(storage, image.image.name, stripped)
+    with image.image.open('rb') as source:
+        original = Image.open(source)
+        original.load()
+    picture = ImageOps.exif_transpose(original)
+
+    image.width, image.height = picture.size
+    longest_edge = max(picture.size)
+    rgb = flatten(picture)
+
+    variants = {}
+    for size, edge in VARIANT_SIZES.items():
+        if variants and edge > longest_edge:
+            break
+        resized = rgb.copy()
+        resized.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        entry = {'width': resized.width, 'height': resized.height}
+        for extension, (variant_format, options) in VARIANT_FORMATS.items():
+            entry[extension] = replace_file(
+                storage, variant_name(image, size, extension), encode(resized, variant_format, **options))
+        variants[size] = entry
+
+    image.variants = variants
+    image.save(update_fields=['image', 'width', 'height', 'variants'])
+
+
+def enqueue_images(images):
+    """
+    Queue processing jobs for the given images and hand them to the worker
+    pool once the current transaction commits.
+    """
+    jobs = ImageJob.objects.bulk_create([ImageJob(image=image) for image in images])
+    job_ids = [job.pk for job in jobs]
+    if None in job_ids:
+        # MySQL returns no primary keys from bulk inserts; find the jobs by image.
+        job_ids = list(
+            ImageJob.objects.filter(image__in=[image.pk for image in images], status=ImageJob.PENDING)
+            .values_list('pk', flat=True))
+    transaction.on_commit(lambda: submit_jobs(job_ids))
+    return jobs
+
+
+def get_executor():
+    global _executor
+    workers = getattr(settings, 'IMAGE_PROCESSING_WORKERS', 2)
+    if workers <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-worker')
+    return _executor
+
+
+def submit_jobs(job_ids):
+    executor = get_executor()
+    if executor is None:
+        return
+    for job_id in job_ids:
+        executor.submit(run_in_worker, job_id)
+
+
+def run_in_worker(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        # Worker threads get their own connection; do not leak it.
+        connection.close()
+
+
+def run_job(job_id):
+    """
+    Claim and run a pending job. Returns False if another worker claimed it
+    first or it no longer exists.
+    """
+    claimed = (
+        ImageJob.objects.filter(pk=job_id, status=ImageJob.PENDING)
+        .update(status=ImageJob.RUNNING, attempts=F('attempts') + 1, updated_at=timezone.now())
+    )
+    if not claimed:
+        return False
+
+    job = ImageJob.objects.select_related('image').get(pk=job_id)
+    try:
+        process_image(job.image)
+    except Exception as exc:
+        logger.exception("Processing image %s failed", job.image_id)
+        job.status = ImageJob.FAILED if job.attempts >= MAX_ATTEMPTS else ImageJob.PENDING
+        job.error = str(exc)
+    else:
+        job.status = ImageJob.DONE
+        job.error = ''
+    job.save(update_fields=['status', 'error', 'updated_at'])
+    return True
+
+
+def process_pending_jobs(limit=None):
+    """
+    Run pending jobs in the calling thread, oldest first, after requeueing
+    jobs left running by a dead worker. Returns the number of jobs run.
+    """
+    ImageJob.objects.filter(
+        status=ImageJob.RUNNING, updated_at__lt=timezone.now() - STALE_AFTER,
+    ).update(status=ImageJob.PENDING, updated_at=timezone.now())
+
+    job_ids = ImageJob.objects.filter(status=ImageJob.PENDING).order_by('created_at').values_list('pk', flat=True)
+    if limit is not None:
+        job_ids = job_ids[:limit]
+    return sum(run_job(job_id) for job_id in list(job_ids))
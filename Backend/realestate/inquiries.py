@@ -0,0 +1,140 @@
+"""
+Agent inquiry inbox.
+
+Every inquiry carries the agent of its property, copied from the house when
+it is created and moved along when the house changes agents, so an agent's
+inbox is one index range scan on (agent, status, created_at, id) instead of
+a join over all of the agent's houses. Agent.pending_inquiry_count and
+Agent.responded_inquiry_count are kept in step by realestate.signals, which
+makes the inbox counters a primary key lookup; the `recount_properties`
+management command repairs any drift.
+
+Agents answer or close many inquiries at once with bulk_update_inquiries:
+ownership of all of them is checked with one query and the change is one
+UPDATE ... WHERE id IN statement. Changes are announced to the agent and
+tenants through realestate.events.
+"""
+import uuid
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Value, When
+from django.utils import timezone
+
+from .events import publish_inquiry_events
+from .models import Agent, PropertyInquiry
+
+# Agent counter of each inquiry status that has one.
+STATUS_COUNTERS = {
+    'pending': 'pending_inquiry_count',
+    'responded': 'responded_inquiry_count',
+}
+
+# Inquiries a single bulk request may change.
+MAX_BULK_IDS = 500
+
+INBOX_FIELDS = (
+    'id', 'house_id', 'house__title', 'tenant_id', 'tenant__username',
+    'message', 'response', 'status', 'created_at', 'updated_at',
+)
+
+
+def adjust_inquiry_counts(deltas):
+    """
+    Apply {(agent_id, status): delta} to the agents' inquiry counters, with
+    one UPDATE per agent. Decrements never take a counter below zero.
+    """
+    changes = defaultdict(Counter)
+    for (agent_id, status), delta in deltas.items():
+        field = STATUS_COUNTERS.get(status)
+        if agent_id is not None and field is not None and delta:
+            changes[agent_id][field] += delta
+    for agent_id, fields in changes.items():
+        Agent.objects.filter(pk=agent_id).update(**{
+            field: Case(When(**{f'{field}__gte': -delta}, then=F(field) + delta), default=Value(0))
+            for field, delta in fields.items() if delta
+        })
+
+
+def reassign_inquiries(house_id, old_agent_id, new_agent_id):
+    """
+    Move the inquiries about a house, and their counts, to its new agent.
+    """
+    counts = (
+        PropertyInquiry.objects.filter(house_id=house_id).order_by()
+        .values_list('status').annotate(total=Count('pk'))
+    )
+    deltas = Counter()
+    for status, total in counts:
+        deltas[old_agent_id, status] -= total
+        deltas[new_agent_id, status] += total
+    PropertyInquiry.objects.filter(house_id=house_id).update(agent_id=new_agent_id)
+    adjust_inquiry_counts(deltas)
+
+
+def inbox_queryset(agent_id, status=None):
+    """
+    Return an agent's inquiries, newest first, with only the columns of a
+    compact inbox row.
+    """
+    inquiries = PropertyInquiry.objects.filter(agent_id=agent_id)
+    if status is not None:
+        inquiries = inquiries.filter(status=status)
+    return inquiries.select_related('house', 'tenant').only(*INBOX_FIELDS).order_by('-created_at')
+
+
+def inbox_counts(agent_id):
+    """
+    Return the pending and responded inquiry counters of an agent.
+    """
+    counts = Agent.objects.filter(pk=agent_id).values_list(*STATUS_COUNTERS.values()).first() or (0,) * len(STATUS_COUNTERS)
+    return dict(zip(STATUS_COUNTERS, counts))
+
+
+def bulk_update_inquiries(agent_id, ids, status, response=None):
+    """
+    Set the status, and the response when given, of the agent's inquiries
+    among `ids`. Returns {id: outcome}, where outcome is the new status for
+    updated inquiries, or "unchanged", "not_found" (unknown or malformed id)
+    or "forbidden" (another agent's inquiry).
+    """
+    results, wanted = {}, {}
+    for value in ids:
+        try:
+            wanted[uuid.UUID(str(value))] = str(value)
+        except ValueError:
+            results[str(value)] = 'not_found'
+
+    with transaction.atomic():
+        # Lock the rows so concurrent changes cannot skew the counters.
+        rows = {
+            pk: (owner, previous, house_id, tenant_id) for pk, owner, previous, house_id, tenant_id in
+            PropertyInquiry.objects.select_for_update().filter(pk__in=list(wanted)).order_by()
+            .values_list('pk', 'agent_id', 'status', 'house_id', 'tenant_id')
+        } if wanted else {}
+        deltas = Counter()
+        updated = []
+        for pk, value in wanted.items():
+            if pk not in rows:
+                results[value] = 'not_found'
+                continue
+            owner, previous, _, _ = rows[pk]
+            if str(owner) != str(agent_id):
+                results[value] = 'forbidden'
+            elif previous == status and response is None:
+                results[value] = 'unchanged'
+            else:
+                results[value] = status
+                updated.append(pk)
+                deltas[owner, previous] -= 1
+                deltas[owner, status] += 1
+
+        if updated:
+            changes = {'status': status, 'updated_at': timezone.now()}
+            if response is not None:
+                changes['response'] = response
+            PropertyInquiry.objects.filter(pk__in=updated).update(**changes)
+            adjust_inquiry_counts(deltas)
+            publish_inquiry_events(
+                (f'inquiry.{status}', pk, rows[pk][2], status, rows[pk][0], rows[pk][3]) for pk in updated)
+    return results
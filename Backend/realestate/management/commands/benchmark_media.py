@@ -0,0 +1,58 @@
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.views.static import serve
+
+from realestate.media import serve_media
+
+
+class Command(BaseCommand):
+    """
+    Compare in-process throughput of realestate.media.serve_media with
+    django.views.static.serve, the view behind static(), on a temporary file.
+
+    Only the Python side is measured (opening, headers, reading the body);
+    sendfile() and proxy delegation happen outside the view and make the
+    production path faster still.
+    """
+    help = "Benchmark media serving against django.views.static.serve"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=2 * 1024 * 1024, help="File size in bytes")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per scenario")
+
+    def handle(self, *args, **options):
+        size, count = options['size'], options['requests']
+        factory = RequestFactory()
+        with tempfile.TemporaryDirectory() as root:
+            name = 'benchmark.jpg'
+            with open(os.path.join(root, name), 'wb') as file:
+                file.write(os.urandom(size))
+            etag = serve_media(factory.get('/'), name, document_root=root)['ETag']
+
+            scenarios = [
+                ('static() full file', serve, {}),
+                ('serve_media full file', serve_media, {}),
+                ('serve_media 64 KiB range', serve_media, {'HTTP_RANGE': 'bytes=0-65535'}),
+                ('serve_media revalidation', serve_media, {'HTTP_IF_NONE_MATCH': etag}),
+            ]
+            for label, view, headers in scenarios:
+                elapsed, transferred = self.run(view, factory, name, root, headers, count)
+                self.stdout.write(
+                    f"{label:28} {count / elapsed:10.1f} req/s {transferred / elapsed / 1024 / 1024:10.1f} MiB/s")
+
+    def run(self, view, factory, name, root, headers, count):
+        transferred = 0
+        start = time.perf_counter()
+        for _ in range(count):
+            response = view(factory.get(f'/media/{name}', **headers), name, document_root=root)
+            if response.streaming:
+                for chunk in response.streaming_content:
+                    transferred += len(chunk)
+            else:
+                transferred += len(response.content)
+            response.close()
+        return time.perf_counter() - start, transferred
@@ -0,0 +1,87 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from realestate.models import House
+from realestate.recommendations import HouseVectorIndex, house_vector
+
+
+class Command(BaseCommand):
+    """
+    Measure recommendation latency on a synthetic catalogue: build a
+    HouseVectorIndex of random listings, then time top-k queries for random
+    sets of favorites. With --rebuild, also time a full rebuild() from the
+    database, after inserting the catalogue in a transaction that is rolled
+    back afterwards.
+    """
+    help = "Benchmark listing recommendations on a synthetic catalogue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--houses', type=int, default=100000, help="Listings in the catalogue")
+        parser.add_argument('--queries', type=int, default=200, help="Recommendation queries to time")
+        parser.add_argument('--favorites', type=int, default=10, help="Favorites per query")
+        parser.add_argument('--limit', type=int, default=10, help="Recommendations per query")
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Also time rebuilding the index from the database")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        words = [f'area{i}' for i in range(300)]
+        rows = [
+            (
+                uuid.UUID(int=rng.getrandbits(128)),
+                rng.randrange(12),
+                rng.choice(['for_rent', 'for_sale']),
+                round(rng.lognormvariate(7, 1.2), 2),
+                rng.randrange(1, 7),
+                rng.randrange(1, 4),
+                rng.randrange(20, 2000),
+                ' '.join(rng.sample(words, 2)),
+            )
+            for _ in range(options['houses'])
+        ]
+
+        start = time.perf_counter()
+        index = HouseVectorIndex()
+        for row in rows:
+            index.upsert(row[0], house_vector(row, rng.sample(range(40), rng.randrange(6))))
+        build = time.perf_counter() - start
+        self.stdout.write(f"built {len(index)} vectors in {build:.2f}s "
+                          f"({index.matrix[:index.size].nbytes / 1024 / 1024:.1f} MiB)")
+
+        ids = list(index.rows)
+        timings = []
+        for _ in range(options['queries']):
+            favorites = rng.sample(ids, options['favorites'])
+            start = time.perf_counter()
+            index.recommend(favorites, options['limit'])
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f"recommend: mean {statistics.mean(timings):.2f} ms, "
+            f"p50 {timings[len(timings) // 2]:.2f} ms, p95 {timings[int(len(timings) * 0.95)]:.2f} ms")
+
+        if options['rebuild']:
+            with transaction.atomic():
+                self.time_rebuild(rows)
+                transaction.set_rollback(True)
+
+    def time_rebuild(self, rows):
+        user = User.objects.create(username=f'benchmark-{uuid.uuid4().hex}')
+        # Without property types or features, which are not needed to time the load.
+        House.objects.bulk_create([
+            House(id=pk, title='Benchmark', description='', price=price, address='', location=location,
+                  property_status=status, bedrooms=bedrooms, bathrooms=bathrooms, area=area, created_by=user)
+            for pk, _, status, price, bedrooms, bathrooms, area, location in rows
+        ], batch_size=1000)
+
+        start = time.perf_counter()
+        index = HouseVectorIndex()
+        index.rebuild()
+        self.stdout.write(f"rebuild: {len(index)} listings from the database in {time.perf_counter() - start:.2f}s")
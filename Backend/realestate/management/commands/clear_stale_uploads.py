@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from realestate.models import ImageUpload
+from realestate.uploads import discard_upload
+
+
+class Command(BaseCommand):
+    """
+    Delete resumable uploads that have not received data for a while,
+    together with their partially received files.
+    """
+    help = "Delete resumable image uploads abandoned for longer than --hours"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=24,
+            help="Age after which an upload without new data is considered abandoned")
+
+    def handle(self, *args, **options):
+        stale = ImageUpload.objects.filter(updated_at__lt=timezone.now() - timedelta(hours=options['hours']))
+        count = 0
+        for upload in stale.iterator():
+            discard_upload(upload)
+            count += 1
+        stale.delete()
+        self.stdout.write(f"Deleted {count} stale upload(s)")
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from realestate.blobs import collect_garbage
+
+
+class Command(BaseCommand):
+    """
+    Garbage-collect content-addressed image files: recount references from
+    the image table and delete the files no image uses any more.
+    """
+    help = "Delete stored image files that no property image refers to"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Report what would be fixed and deleted without changing anything")
+        parser.add_argument(
+            '--grace-hours', type=int, default=24,
+            help="Keep unreferenced files stored more recently than this")
+
+    def handle(self, *args, **options):
+        fixed, deleted = collect_garbage(timedelta(hours=options['grace_hours']), dry_run=options['dry_run'])
+        fix, delete = ('would fix', 'would delete') if options['dry_run'] else ('fixed', 'deleted')
+        self.stdout.write(f"Image blobs: {fix} {fixed} reference count(s), {delete} {deleted} unreferenced file(s)")
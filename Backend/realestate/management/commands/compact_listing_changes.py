@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from realestate.sync import compact_changes
+
+
+class Command(BaseCommand):
+    """
+    Compact the delta sync change log: purge tombstones past the retention
+    period and repair entries for listings written without signals.
+    """
+    help = "Purge expired tombstones from the listing change log and repair missing entries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Report what would change without writing anything")
+
+    def handle(self, *args, **options):
+        result = compact_changes(dry_run=options['dry_run'])
+        fix, purge = ('would fix', 'would purge') if options['dry_run'] else ('fixed', 'purged')
+        self.stdout.write(
+            f"Listing changes: {fix} {result['missing']} missing and {result['orphaned']} orphaned "
+            f"entries, {purge} {result['expired']} expired tombstone(s)")
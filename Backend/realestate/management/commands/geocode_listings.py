@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from realestate.geocoding import geocode_house, get_geocoder
+from realestate.models import House
+
+
+class Command(BaseCommand):
+    """
+    Fill in the coordinates of listings saved without them, e.g. when
+    GEOCODE_ON_SAVE is off because the configured geocoder is a remote,
+    rate-limited service.
+    """
+    help = "Geocode listings that have no coordinates"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help="Geocode at most this many listings")
+        parser.add_argument('--delay', type=float, default=0, help="Seconds to wait between listings")
+        parser.add_argument('--dry-run', action='store_true', help="Report matches without saving them")
+
+    def handle(self, *args, **options):
+        geocoder = get_geocoder()
+        houses = House.objects.filter(latitude__isnull=True).order_by('created_at')
+        if options['limit'] is not None:
+            houses = houses[:options['limit']]
+
+        found = missed = 0
+        for house in houses:
+            if geocode_house(house, geocoder):
+                found += 1
+                if not options['dry_run']:
+                    # A full save keeps the geohash, change log and caches in step.
+                    house.save()
+            else:
+                missed += 1
+            if options['delay']:
+                time.sleep(options['delay'])
+        prefix = "Would geocode" if options['dry_run'] else "Geocoded"
+        self.stdout.write(f"{prefix} {found} listing(s), {missed} not found")
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from realestate.images import process_pending_jobs
+from realestate.models import ImageJob
+
+
+class Command(BaseCommand):
+    """
+    Run queued image processing jobs in this process, e.g. from cron or when
+    the in-process worker pool is disabled.
+    """
+    help = "Generate variants for property images with pending processing jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help="Maximum number of jobs to run")
+        parser.add_argument(
+            '--retry-failed', action='store_true',
+            help="Queue jobs that exhausted their attempts again before running")
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            retried = ImageJob.objects.filter(status=ImageJob.FAILED).update(status=ImageJob.PENDING, attempts=0)
+            self.stdout.write(f"Requeued {retried} failed job(s)")
+        processed = process_pending_jobs(limit=options['limit'])
+        self.stdout.write(f"Processed {processed} image job(s)")
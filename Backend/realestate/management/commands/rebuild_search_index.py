@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from realestate.models import House
+from realestate.search import index_house
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the listing full-text search index from scratch, e.g. after
+    importing data with signals disabled or changing the tokenizer.
+    """
+    help = "Rebuild the full-text search index for all property listings"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help="Number of listings loaded per query")
+
+    def handle(self, *args, **options):
+        houses = House.objects.only('pk', 'title', 'address', 'location', 'description').order_by()
+        indexed = 0
+        for house in houses.iterator(chunk_size=options['batch_size']):
+            index_house(house)
+            indexed += 1
+        self.stdout.write(f"Indexed {indexed} listing(s)")
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from realestate.similar import BATCH_SIZE, rebuild_similar_listings
+
+
+class Command(BaseCommand):
+    """
+    Recompute the similar listings of every property, e.g. after importing
+    data with signals disabled or changing the listing vectors.
+    """
+    help = "Rebuild the precomputed similar listings of all properties"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help="Number of listings scored per matrix product")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = rebuild_similar_listings(options['batch_size'])
+        self.stdout.write(f"Computed similar listings for {count} listing(s) in {time.perf_counter() - start:.2f}s")
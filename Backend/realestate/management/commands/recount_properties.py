@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+
+from realestate.models import Agent, PropertyType, Feature
+
+
+class Command(BaseCommand):
+    """
+    Recompute the denormalized property_count of agents, property types and
+    features from the listings table, and the pending and responded inquiry
+    counts of agents, and fix every row that has drifted.
+    """
+    help = "Recompute property and inquiry counters on agents, property types and features"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Report drifted counters without writing them")
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help="Number of rows written per UPDATE batch")
+
+    def handle(self, *args, **options):
+        counters = [
+            (Agent, 'property_count', Count('house')),
+            (PropertyType, 'property_count', Count('house')),
+            (Feature, 'property_count', Count('house')),
+            (Agent, 'pending_inquiry_count', Count('inquiries', filter=Q(inquiries__status='pending'))),
+            (Agent, 'responded_inquiry_count', Count('inquiries', filter=Q(inquiries__status='responded'))),
+        ]
+        for model, field, count in counters:
+            fixed = self.recount(model, field, count, options['dry_run'], options['batch_size'])
+            verb = 'would fix' if options['dry_run'] else 'fixed'
+            self.stdout.write(f"{model._meta.verbose_name_plural} {field}: {verb} {fixed} counter(s)")
+
+    def recount(self, model, field, count, dry_run, batch_size):
+        """
+        Compare each stored counter with a single grouped COUNT and bulk
+        update the rows that disagree.
+        """
+        with transaction.atomic():
+            rows = (
+                model.objects.annotate(actual_count=count)
+                .only('pk', field)
+                .order_by()
+            )
+            drifted = []
+            for obj in rows.iterator(chunk_size=batch_size):
+                if getattr(obj, field) != obj.actual_count:
+                    setattr(obj, field, obj.actual_count)
+                    drifted.append(obj)
+
+            if drifted and not dry_run:
+                model.objects.bulk_update(drifted, [field], batch_size=batch_size)
+        return len(drifted)
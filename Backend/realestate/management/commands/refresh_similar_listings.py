@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from realestate.similar import REFRESH_BATCH_SIZE, refresh_queued_listings
+
+
+class Command(BaseCommand):
+    """
+    Recompute the similar listings affected by queued property changes.
+    Run it from cron, e.g. every minute.
+    """
+    help = "Refresh the similar listings of properties queued since the last run"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=REFRESH_BATCH_SIZE,
+            help="Number of queued properties refreshed together")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = refresh_queued_listings(options['batch_size'])
+        self.stdout.write(f"Refreshed similar listings for {count} queued listing(s) in {time.perf_counter() - start:.2f}s")
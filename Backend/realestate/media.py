@@ -0,0 +1,191 @@
+"""
+Serving of uploaded media in production.
+
+`serve_media` streams files from MEDIA_ROOT with FileResponse. WSGI servers
+that provide wsgi.file_wrapper (gunicorn's sync workers, uWSGI) send them
+with sendfile(); ASGI has no such extension, so under the uvicorn workers of
+start.sh each file is read in STREAM_BLOCK_SIZE blocks from a thread and
+MEDIA_SENDFILE_BACKEND should be set in production. It answers conditional
+requests (ETag, Last-Modified) and single byte ranges, which browsers and
+mobile clients use to resume downloads.
+
+Content-addressed files (see realestate.storage) never change under the
+same name and are marked immutable for a year; everything else gets
+MEDIA_CACHE_MAX_AGE. With MEDIA_SENDFILE_BACKEND set, the view only checks
+the request and hands the transfer itself to the reverse proxy through
+X-Accel-Redirect (nginx) or X-Sendfile (Apache, lighttpd).
+"""
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+# Names written by ContentAddressedStorage: <prefix>/<ab>/<sha256 digest>.<ext>
+CONTENT_ADDRESSED_RE = re.compile(r'(^|/)([0-9a-f]{2})/\2[0-9a-f]{62}(\.\w+)?$')
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+class FileRange:
+    """
+    Read-only view of `length` bytes of a file starting at `start`, so
+    FileResponse (and wsgi.file_wrapper) stream only the requested range.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def is_content_addressed(path):
+    return bool(CONTENT_ADDRESSED_RE.search(path))
+
+
+def file_etag(stat):
+    return quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+
+
+def parse_range(header, size):
+    """
+    Return (start, end) inclusive for a single-range Range header, None to
+    serve the whole file (no header, or several ranges), or False if the
+    range cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def if_range_matches(request, etag, mtime):
+    """
+    Return True if the Range header applies: no If-Range, or If-Range names
+    the current representation (strong ETag or exact Last-Modified date).
+    """
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and int(mtime) == date
+
+
+def set_cache_headers(response, path, etag, mtime):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    response['Accept-Ranges'] = 'bytes'
+    if is_content_addressed(path):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'MEDIA_CACHE_MAX_AGE', 3600))
+
+
+def delegated_response(path, fullpath, content_type):
+    """
+    Return an empty response telling the reverse proxy which file to send.
+    """
+    backend = settings.MEDIA_SENDFILE_BACKEND
+    response = HttpResponse(content_type=content_type)
+    if backend == 'nginx':
+        prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + path
+    elif backend == 'apache':
+        response['X-Sendfile'] = fullpath
+    else:
+        raise ValueError(f'Unknown MEDIA_SENDFILE_BACKEND {backend!r}')
+    return response
+
+
+def serve_media(request, path, document_root=None):
+    """
+    Serve a file below MEDIA_ROOT (or document_root).
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(document_root or settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Invalid path')
+    try:
+        stat = os.stat(fullpath)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404('File not found')
+    if not os.path.isfile(fullpath):
+        raise Http404('Directory indexes are not allowed here.')
+
+    etag = file_etag(stat)
+    mtime = stat.st_mtime
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(mtime))
+    if response is not None:
+        set_cache_headers(response, path, etag, mtime)
+        return response
+
+    if getattr(settings, 'MEDIA_SENDFILE_BACKEND', ''):
+        # The proxy handles ranges and streaming itself.
+        response = delegated_response(path, fullpath, content_type)
+        set_cache_headers(response, path, etag, mtime)
+        return response
+
+    size = stat.st_size
+    byte_range = parse_range(request.headers.get('Range'), size) if if_range_matches(request, etag, mtime) else None
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        set_cache_headers(response, path, etag, mtime)
+        return response
+
+    file = open(fullpath, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(FileRange(file, start, end - start + 1), content_type=content_type, status=206)
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response.block_size = STREAM_BLOCK_SIZE
+    if encoding:
+        response['Content-Encoding'] = encoding
+    set_cache_headers(response, path, etag, mtime)
+    return response
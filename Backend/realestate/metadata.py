@@ -0,0 +1,226 @@
+"""
+Lossless removal of EXIF and XMP metadata from image files.
+
+Camera photos carry serial numbers and GPS positions in their metadata.
+strip_metadata copies a JPEG segment by segment, or a PNG or WebP chunk by
+chunk, leaving the metadata out. The pixels are never decoded, so the cost
+is one read of the file and the compressed image data is kept byte for
+byte. Only the EXIF orientation survives, rewritten as a minimal EXIF
+block, so rotated photos are still displayed upright.
+"""
+import struct
+import tempfile
+import zlib
+
+from django.core.files import File
+from PIL import Image
+
+CHUNK_SIZE = 64 * 1024
+
+ORIENTATION = 0x0112
+
+JPEG_EXIF_PREFIX = b'Exif\x00\x00'
+JPEG_SOI = b'\xff\xd8'
+# Markers without a length: TEM and RST0-7. Scanning stops at SOS and EOI.
+JPEG_STANDALONE = {0x01} | set(range(0xD0, 0xD8))
+JPEG_SOS, JPEG_EOI = 0xDA, 0xD9
+# APP1 holds EXIF and XMP, APP13 Photoshop/IPTC records.
+JPEG_METADATA = {0xE1, 0xED}
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_TEXT_CHUNKS = {b'tEXt', b'zTXt', b'iTXt'}
+PNG_METADATA_KEYWORDS = {
+    b'XML:com.adobe.xmp', b'Raw profile type exif', b'Raw profile type APP1',
+    b'Raw profile type iptc', b'Raw profile type xmp',
+}
+
+WEBP_EXIF_FLAG = 0x08
+WEBP_XMP_FLAG = 0x04
+
+
+def orientation_tiff(orientation):
+    """
+    Return a big-endian TIFF header with a single IFD holding the orientation.
+    """
+    return b'MM\x00\x2a' + struct.pack('>IHHHIHHI', 8, 1, ORIENTATION, 3, 1, orientation, 0, 0)
+
+
+def read_orientation(data):
+    """
+    Return the orientation recorded in EXIF data, or 1 when there is none.
+    """
+    exif = Image.Exif()
+    try:
+        exif.load(data)
+        orientation = int(exif.get(ORIENTATION, 1))
+    except Exception:
+        return 1
+    return orientation if 1 <= orientation <= 8 else 1
+
+
+def jpeg_edits(content):
+    edits = []
+    position = 2
+    content.seek(position)
+    while True:
+        header = content.read(4)
+        if len(header) < 2 or header[0] != 0xFF:
+            break
+        marker = header[1]
+        if marker == 0xFF:
+            # Fill byte before a marker.
+            position += 1
+            content.seek(position)
+            continue
+        if marker in (JPEG_SOS, JPEG_EOI) or len(header) < 4:
+            break
+        if marker in JPEG_STANDALONE:
+            position += 2
+            content.seek(position)
+            continue
+        length = int.from_bytes(header[2:4], 'big')
+        if marker in JPEG_METADATA:
+            data = content.read(length - 2)
+            replacement = b''
+            if marker == 0xE1 and data.startswith(JPEG_EXIF_PREFIX):
+                orientation = read_orientation(data)
+                if orientation != 1:
+                    payload = JPEG_EXIF_PREFIX + orientation_tiff(orientation)
+                    replacement = b'\xff\xe1' + (len(payload) + 2).to_bytes(2, 'big') + payload
+            if replacement != header + data:
+                edits.append((position, length + 2, replacement))
+        position += 2 + length
+        content.seek(position)
+    return edits
+
+
+def png_keyword(content, length):
+    return content.read(min(length, 80)).split(b'\x00', 1)[0]
+
+
+def png_edits(content):
+    edits = []
+    position = len(PNG_SIGNATURE)
+    content.seek(position)
+    while True:
+        header = content.read(8)
+        if len(header) < 8:
+            break
+        length, kind = int.from_bytes(header[:4], 'big'), header[4:]
+        if kind == b'eXIf':
+            data = content.read(length)
+            orientation = read_orientation(data)
+            replacement = b''
+            if orientation != 1:
+                tiff = orientation_tiff(orientation)
+                replacement = (
+                    len(tiff).to_bytes(4, 'big') + b'eXIf' + tiff + zlib.crc32(b'eXIf' + tiff).to_bytes(4, 'big'))
+            if tiff_differs(data, orientation):
+                edits.append((position, length + 12, replacement))
+        elif kind in PNG_TEXT_CHUNKS and png_keyword(content, length) in PNG_METADATA_KEYWORDS:
+            edits.append((position, length + 12, b''))
+        elif kind == b'IEND':
+            break
+        position += length + 12
+        content.seek(position)
+    return edits
+
+
+def tiff_differs(data, orientation):
+    return orientation == 1 or data != orientation_tiff(orientation)
+
+
+def webp_edits(content):
+    chunks = []
+    flags_position = flags = None
+    keeps_exif = False
+    position = 12
+    content.seek(position)
+    while True:
+        header = content.read(8)
+        if len(header) < 8:
+            break
+        kind, length = header[:4], int.from_bytes(header[4:], 'little')
+        padded = length + (length & 1)
+        if kind == b'VP8X':
+            flags_position = position + 8
+            flags = content.read(1)[0]
+        elif kind == b'EXIF':
+            data = content.read(length)
+            orientation = read_orientation(data)
+            keeps_exif = orientation != 1
+            if tiff_differs(data, orientation):
+                replacement = b''
+                if keeps_exif:
+                    tiff = orientation_tiff(orientation)
+                    replacement = b'EXIF' + len(tiff).to_bytes(4, 'little') + tiff
+                chunks.append((position, padded + 8, replacement))
+        elif kind == b'XMP ':
+            chunks.append((position, padded + 8, b''))
+        position += padded + 8
+        content.seek(position)
+    if not chunks:
+        return []
+
+    content.seek(4)
+    riff_size = int.from_bytes(content.read(4), 'little')
+    riff_size += sum(len(replacement) - length for _, length, replacement in chunks)
+    edits = [(4, 4, riff_size.to_bytes(4, 'little'))]
+    if flags_position is not None:
+        flags &= ~WEBP_XMP_FLAG
+        if not keeps_exif:
+            flags &= ~WEBP_EXIF_FLAG
+        edits.append((flags_position, 1, bytes([flags])))
+    return edits + chunks
+
+
+def metadata_edits(content):
+    """
+    Return the (offset, length, replacement) edits removing the metadata of
+    an image file, in file order; none when there is nothing to remove or
+    the file is not a JPEG, PNG or WebP image.
+    """
+    content.seek(0)
+    head = content.read(12)
+    if head.startswith(JPEG_SOI):
+        return jpeg_edits(content)
+    if head.startswith(PNG_SIGNATURE):
+        return png_edits(content)
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return webp_edits(content)
+    return []
+
+
+def copy_bytes(source, target, count=None):
+    while count is None or count > 0:
+        chunk = source.read(CHUNK_SIZE if count is None else min(CHUNK_SIZE, count))
+        if not chunk:
+            break
+        target.write(chunk)
+        if count is not None:
+            count -= len(chunk)
+
+
+def strip_metadata(content):
+    """
+    Return a copy of an image file without its EXIF and XMP metadata, as a
+    File to be closed by the caller, or None when it has none to remove.
+    """
+    try:
+        edits = metadata_edits(content)
+    finally:
+        content.seek(0)
+    if not edits:
+        return None
+
+    target = tempfile.TemporaryFile()
+    position = 0
+    for offset, length, replacement in edits:
+        copy_bytes(content, target, offset - position)
+        target.write(replacement)
+        position = offset + length
+        content.seek(position)
+    copy_bytes(content, target)
+    content.seek(0)
+    target.seek(0)
+    return File(target, name=content.name)
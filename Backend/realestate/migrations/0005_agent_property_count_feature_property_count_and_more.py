@@ -0,0 +1,72 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:16
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_property_counts(apps, schema_editor):
+    House = apps.get_model("realestate", "House")
+    Agent = apps.get_model("realestate", "Agent")
+    PropertyType = apps.get_model("realestate", "PropertyType")
+    Feature = apps.get_model("realestate", "Feature")
+    Through = House.features.through
+
+    def count_of(queryset, field):
+        return Coalesce(
+            Subquery(
+                queryset.filter(**{field: OuterRef("pk")})
+                .order_by()
+                .values(field)
+                .annotate(total=Count("pk"))
+                .values("total")[:1]
+            ),
+            0,
+        )
+
+    Agent.objects.update(property_count=count_of(House.objects.all(), "agent"))
+    PropertyType.objects.update(
+        property_count=count_of(House.objects.all(), "property_type")
+    )
+    Feature.objects.update(property_count=count_of(Through.objects.all(), "feature"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("realestate", "0004_alter_propertyimage_image"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="agent",
+            name="property_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Number of properties listed by this agent (maintained automatically)",
+                verbose_name="Number of Properties",
+            ),
+        ),
+        migrations.AddField(
+            model_name="feature",
+            name="property_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Number of properties with this feature (maintained automatically)",
+                verbose_name="Number of Properties",
+            ),
+        ),
+        migrations.AddField(
+            model_name="propertytype",
+            name="property_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Number of properties of this type (maintained automatically)",
+                verbose_name="Number of Properties",
+            ),
+        ),
+        migrations.RunPython(populate_property_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("realestate", "0005_agent_property_count_feature_property_count_and_more"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="house",
+            index=models.Index(fields=["created_at", "id"], name="house_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="house",
+            index=models.Index(fields=["price", "id"], name="house_price_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="house",
+            index=models.Index(fields=["area", "id"], name="house_area_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="house",
+            index=models.Index(
+                fields=["property_status", "created_at"],
+                name="house_status_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="house",
+            index=models.Index(
+                fields=["property_status", "price", "created_at"],
+                name="house_status_price_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="house",
+            index=models.Index(
+                fields=["property_type", "created_at"], name="house_type_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="house",
+            index=models.Index(
+                fields=["agent", "created_at"], name="house_agent_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="house",
+            index=models.Index(
+                fields=["created_by", "created_at"], name="house_creator_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="house",
+            index=models.Index(
+                fields=["bedrooms", "bathrooms"], name="house_rooms_idx"
+            ),
+        ),
+    ]
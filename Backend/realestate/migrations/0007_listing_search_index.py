@@ -0,0 +1,95 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:19
+
+import math
+import re
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Frozen copy of realestate.search as of this migration, so later changes to
+# the tokenizer or weights do not change what this migration does.
+FIELD_WEIGHTS = {
+    "title": 3.0,
+    "location": 2.0,
+    "address": 2.0,
+    "description": 1.0,
+}
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return [token[:64] for token in TOKEN_RE.findall(text.lower()) if len(token) >= 2]
+
+
+def term_weights(house):
+    weights = Counter()
+    for field, field_weight in FIELD_WEIGHTS.items():
+        for term, count in Counter(tokenize(getattr(house, field))).items():
+            weights[term] += field_weight * (1 + math.log(count))
+    return weights
+
+
+def index_existing_houses(apps, schema_editor):
+    House = apps.get_model("realestate", "House")
+    ListingSearchTerm = apps.get_model("realestate", "ListingSearchTerm")
+    for house in House.objects.order_by().iterator(chunk_size=500):
+        ListingSearchTerm.objects.bulk_create(
+            [
+                ListingSearchTerm(house=house, term=term, weight=weight)
+                for term, weight in term_weights(house).items()
+            ]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("realestate", "0006_house_listing_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ListingSearchTerm",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "term",
+                    models.CharField(help_text="Normalized search term", max_length=64),
+                ),
+                (
+                    "weight",
+                    models.FloatField(
+                        help_text="Relevance weight of the term for this property"
+                    ),
+                ),
+                (
+                    "house",
+                    models.ForeignKey(
+                        help_text="The property containing the term",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_terms",
+                        to="realestate.house",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Listing Search Term",
+                "verbose_name_plural": "Listing Search Terms",
+                "indexes": [
+                    models.Index(fields=["term", "house"], name="search_term_idx")
+                ],
+            },
+        ),
+        migrations.RunPython(index_existing_houses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("realestate", "0007_listing_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="feature",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, help_text="When the feature was last updated"
+            ),
+        ),
+        migrations.AddField(
+            model_name="propertytype",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, help_text="When the property type was last updated"
+            ),
+        ),
+    ]
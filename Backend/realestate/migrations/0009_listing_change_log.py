@@ -0,0 +1,63 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:28
+
+from django.db import migrations, models
+
+
+def log_existing_houses(apps, schema_editor):
+    House = apps.get_model("realestate", "House")
+    ListingChange = apps.get_model("realestate", "ListingChange")
+    house_ids = House.objects.order_by("created_at").values_list("pk", flat=True)
+    ListingChange.objects.bulk_create(
+        (ListingChange(house_id=pk, action="upsert") for pk in house_ids.iterator()),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("realestate", "0008_catalogue_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ListingChange",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                (
+                    "house_id",
+                    models.UUIDField(
+                        db_index=True, help_text="The property that changed"
+                    ),
+                ),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[
+                            ("upsert", "Created or updated"),
+                            ("delete", "Deleted"),
+                        ],
+                        help_text="Kind of change",
+                        max_length=6,
+                    ),
+                ),
+                (
+                    "changed_at",
+                    models.DateTimeField(
+                        auto_now_add=True, help_text="When the change happened"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Listing Change",
+                "verbose_name_plural": "Listing Changes",
+                "indexes": [
+                    models.Index(
+                        fields=["action", "changed_at"],
+                        name="listing_change_action_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(log_existing_houses, migrations.RunPython.noop),
+    ]
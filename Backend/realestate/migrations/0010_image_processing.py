@@ -0,0 +1,107 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("realestate", "0009_listing_change_log"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="propertyimage",
+            name="height",
+            field=models.PositiveIntegerField(
+                blank=True,
+                editable=False,
+                help_text="Height of the image in pixels",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="propertyimage",
+            name="variants",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                help_text="Resized variants by size name, filled in by realestate.images",
+            ),
+        ),
+        migrations.AddField(
+            model_name="propertyimage",
+            name="width",
+            field=models.PositiveIntegerField(
+                blank=True,
+                editable=False,
+                help_text="Width of the image in pixels",
+                null=True,
+            ),
+        ),
+        migrations.CreateModel(
+            name="ImageJob",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        help_text="Processing status",
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveSmallIntegerField(
+                        default=0, help_text="Number of times processing was started"
+                    ),
+                ),
+                (
+                    "error",
+                    models.TextField(
+                        blank=True, help_text="Error raised by the last failed attempt"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, help_text="When the job was queued"
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        auto_now=True, help_text="When the job last changed status"
+                    ),
+                ),
+                (
+                    "image",
+                    models.ForeignKey(
+                        help_text="The image to process",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="jobs",
+                        to="realestate.propertyimage",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Image Job",
+                "verbose_name_plural": "Image Jobs",
+                "ordering": ["created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "created_at"], name="image_job_status_idx"
+                    )
+                ],
+            },
+        ),
+    ]
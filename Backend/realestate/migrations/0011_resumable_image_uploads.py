@@ -0,0 +1,95 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:32
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("realestate", "0010_image_processing"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImageUpload",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "filename",
+                    models.CharField(
+                        help_text="Original name of the file", max_length=255
+                    ),
+                ),
+                (
+                    "length",
+                    models.PositiveBigIntegerField(
+                        help_text="Total size of the file in bytes"
+                    ),
+                ),
+                (
+                    "offset",
+                    models.PositiveBigIntegerField(
+                        default=0, help_text="Number of bytes received so far"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, help_text="When the upload was started"
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        auto_now=True, help_text="When data was last received"
+                    ),
+                ),
+                (
+                    "house",
+                    models.ForeignKey(
+                        help_text="The property the image is uploaded for",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="uploads",
+                        to="realestate.house",
+                    ),
+                ),
+                (
+                    "image",
+                    models.OneToOneField(
+                        blank=True,
+                        help_text="The image created once the upload completed",
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="upload",
+                        to="realestate.propertyimage",
+                    ),
+                ),
+                (
+                    "uploaded_by",
+                    models.ForeignKey(
+                        help_text="User sending the file",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="image_uploads",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Image Upload",
+                "verbose_name_plural": "Image Uploads",
+                "ordering": ["-created_at"],
+            },
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:34
+
+import django.utils.timezone
+import realestate.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("realestate", "0011_resumable_image_uploads"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="propertyimage",
+            name="image",
+            field=models.ImageField(
+                help_text="Image file for the property",
+                max_length=255,
+                storage=realestate.models.property_image_storage,
+                upload_to="property_images/",
+            ),
+        ),
+        migrations.CreateModel(
+            name="ImageBlob",
+            fields=[
+                (
+                    "digest",
+                    models.CharField(
+                        help_text="SHA-256 of the file content",
+                        max_length=64,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        help_text="Storage name of the file",
+                        max_length=255,
+                        unique=True,
+                    ),
+                ),
+                (
+                    "size",
+                    models.PositiveBigIntegerField(help_text="File size in bytes"),
+                ),
+                (
+                    "ref_count",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Number of image references to the file"
+                    ),
+                ),
+                (
+                    "stored_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        help_text="When the file was stored, or last reused while unreferenced",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Image Blob",
+                "verbose_name_plural": "Image Blobs",
+                "indexes": [
+                    models.Index(
+                        fields=["ref_count", "stored_at"], name="image_blob_refs_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("realestate", "0012_content_addressed_images"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userprofile",
+            name="token_version",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Bumped to revoke the user's tokens, e.g. when their role changes",
+            ),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("realestate", "0013_userprofile_token_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SimilarListing",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                (
+                    "rank",
+                    models.PositiveSmallIntegerField(
+                        help_text="Position among the neighbours, 0 being the closest"
+                    ),
+                ),
+                (
+                    "score",
+                    models.FloatField(
+                        help_text="Cosine similarity of the two properties"
+                    ),
+                ),
+                (
+                    "house",
+                    models.ForeignKey(
+                        help_text="The property the neighbour belongs to",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similar_listings",
+                        to="realestate.house",
+                    ),
+                ),
+                (
+                    "similar",
+                    models.ForeignKey(
+                        help_text="A property similar to it",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similar_to",
+                        to="realestate.house",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Similar Listing",
+                "verbose_name_plural": "Similar Listings",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("house", "rank"), name="similar_listing_rank_uniq"
+                    )
+                ],
+            },
+        ),
+    ]
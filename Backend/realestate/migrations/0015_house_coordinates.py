@@ -0,0 +1,62 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:49
+
+import django.core.validators
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("realestate", "0014_similar_listings"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="house",
+            name="geohash",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                help_text="Geohash of the coordinates, for map queries (see realestate.geo)",
+                max_length=12,
+            ),
+        ),
+        migrations.AddField(
+            model_name="house",
+            name="latitude",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=6,
+                help_text="Latitude in degrees",
+                max_digits=9,
+                null=True,
+                validators=[
+                    django.core.validators.MinValueValidator(Decimal('-90')),
+                    django.core.validators.MaxValueValidator(Decimal('90')),
+                ],
+            ),
+        ),
+        migrations.AddField(
+            model_name="house",
+            name="longitude",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=6,
+                help_text="Longitude in degrees",
+                max_digits=9,
+                null=True,
+                validators=[
+                    django.core.validators.MinValueValidator(Decimal('-180')),
+                    django.core.validators.MaxValueValidator(Decimal('180')),
+                ],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="house",
+            index=models.Index(fields=["geohash"], name="house_geohash_idx"),
+        ),
+    ]
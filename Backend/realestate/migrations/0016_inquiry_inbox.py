@@ -0,0 +1,92 @@
+# Generated by Django 5.1.6 on 2026-10-18 15:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_inquiry_agents(apps, schema_editor):
+    House = apps.get_model("realestate", "House")
+    Agent = apps.get_model("realestate", "Agent")
+    PropertyInquiry = apps.get_model("realestate", "PropertyInquiry")
+
+    PropertyInquiry.objects.update(
+        agent=Subquery(House.objects.filter(pk=OuterRef("house")).values("agent")[:1])
+    )
+
+    def count_of(status):
+        return Coalesce(
+            Subquery(
+                PropertyInquiry.objects.filter(agent=OuterRef("pk"), status=status)
+                .order_by()
+                .values("agent")
+                .annotate(total=Count("pk"))
+                .values("total")[:1]
+            ),
+            0,
+        )
+
+    Agent.objects.update(
+        pending_inquiry_count=count_of("pending"),
+        responded_inquiry_count=count_of("responded"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("realestate", "0015_house_coordinates"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="agent",
+            name="pending_inquiry_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Number of inquiries awaiting a response (maintained automatically)",
+                verbose_name="Pending Inquiries",
+            ),
+        ),
+        migrations.AddField(
+            model_name="agent",
+            name="responded_inquiry_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Number of inquiries responded to (maintained automatically)",
+                verbose_name="Responded Inquiries",
+            ),
+        ),
+        migrations.AddField(
+            model_name="propertyinquiry",
+            name="agent",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                help_text="Agent of the property, copied from it for the agent's inbox (maintained automatically)",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="inquiries",
+                to="realestate.agent",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="propertyinquiry",
+            index=models.Index(
+                fields=["agent", "status", "created_at", "id"],
+                name="inquiry_agent_status_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="propertyinquiry",
+            index=models.Index(
+                fields=["agent", "created_at", "id"], name="inquiry_agent_created_idx"
+            ),
+        ),
+        migrations.RunPython(populate_inquiry_agents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("realestate", "0016_inquiry_inbox"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="house",
+            name="favorite_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Number of times the listing was favorited (maintained automatically)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="house",
+            name="inquiry_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Number of inquiries about the listing (maintained automatically)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="house",
+            name="popularity",
+            field=models.FloatField(
+                default=0,
+                editable=False,
+                help_text="Time-decayed engagement score, comparable between listings only (maintained automatically)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="house",
+            name="view_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Number of times the listing was viewed (maintained automatically)",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="house",
+            index=models.Index(
+                fields=["popularity", "id"], name="house_popularity_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,192 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:08
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("realestate", "0017_listing_engagement"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SavedSearch",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        blank=True,
+                        help_text="Name given to the search by the user",
+                        max_length=100,
+                    ),
+                ),
+                (
+                    "property_status",
+                    models.CharField(
+                        blank=True,
+                        choices=[("for_sale", "For Sale"), ("for_rent", "For Rent")],
+                        help_text="For sale or for rent, either if empty",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "min_price",
+                    models.DecimalField(
+                        blank=True,
+                        decimal_places=2,
+                        help_text="Lowest price in USD",
+                        max_digits=12,
+                        null=True,
+                    ),
+                ),
+                (
+                    "max_price",
+                    models.DecimalField(
+                        blank=True,
+                        decimal_places=2,
+                        help_text="Highest price in USD",
+                        max_digits=12,
+                        null=True,
+                    ),
+                ),
+                (
+                    "bedrooms",
+                    models.PositiveIntegerField(
+                        blank=True, help_text="Minimum number of bedrooms", null=True
+                    ),
+                ),
+                (
+                    "bathrooms",
+                    models.PositiveIntegerField(
+                        blank=True, help_text="Minimum number of bathrooms", null=True
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, help_text="When the search was saved"
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        auto_now=True, help_text="When the search was last changed"
+                    ),
+                ),
+                (
+                    "agent",
+                    models.ForeignKey(
+                        blank=True,
+                        help_text="Agent of the property, any if empty",
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="realestate.agent",
+                    ),
+                ),
+                (
+                    "property_type",
+                    models.ForeignKey(
+                        blank=True,
+                        help_text="Type of property, any if empty",
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="realestate.propertytype",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        help_text="User who saved the search",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="saved_searches",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Saved Search",
+                "verbose_name_plural": "Saved Searches",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.CreateModel(
+            name="SavedSearchMatch",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, help_text="When the listing matched"
+                    ),
+                ),
+                (
+                    "house",
+                    models.ForeignKey(
+                        help_text="Matching property",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_matches",
+                        to="realestate.house",
+                    ),
+                ),
+                (
+                    "search",
+                    models.ForeignKey(
+                        help_text="Saved search the listing matched first",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="matches",
+                        to="realestate.savedsearch",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        help_text="Owner of the search, copied from it for the feed",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_matches",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Saved Search Match",
+                "verbose_name_plural": "Saved Search Matches",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="savedsearch",
+            index=models.Index(fields=["updated_at"], name="savedsearch_updated_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="savedsearchmatch",
+            index=models.Index(
+                fields=["user", "created_at", "id"], name="searchmatch_user_created_idx"
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="savedsearchmatch",
+            unique_together={("user", "house")},
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("realestate", "0018_saved_searches"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="agent",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                help_text="When the agent's profile, user or property count last changed; versions its cached representation",
+            ),
+            preserve_default=False,
+        ),
+    ]
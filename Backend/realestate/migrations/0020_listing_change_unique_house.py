@@ -0,0 +1,38 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:23
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def drop_duplicate_changes(apps, schema_editor):
+    """
+    Keep only the latest change of each house, which concurrent writers
+    could record twice.
+    """
+    ListingChange = apps.get_model("realestate", "ListingChange")
+    duplicated = (
+        ListingChange.objects.order_by().values("house_id")
+        .annotate(total=Count("pk"), latest=Max("pk")).filter(total__gt=1)
+    )
+    for row in duplicated:
+        ListingChange.objects.filter(house_id=row["house_id"], pk__lt=row["latest"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("realestate", "0019_agent_updated_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_changes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="listingchange",
+            name="house_id",
+            field=models.UUIDField(help_text="The property that changed", unique=True),
+        ),
+        migrations.AddIndex(
+            model_name="listingchange",
+            index=models.Index(fields=["changed_at"], name="listing_change_time_idx"),
+        ),
+    ]
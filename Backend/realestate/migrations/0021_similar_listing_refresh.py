@@ -0,0 +1,36 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("realestate", "0020_listing_change_unique_house"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SimilarListingRefresh",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                (
+                    "house_id",
+                    models.UUIDField(
+                        help_text="The property whose neighbours may have changed",
+                        unique=True,
+                    ),
+                ),
+                (
+                    "queued_at",
+                    models.DateTimeField(
+                        auto_now_add=True, help_text="When the refresh was queued"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Similar Listing Refresh",
+                "verbose_name_plural": "Similar Listing Refreshes",
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("realestate", "0021_similar_listing_refresh"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="house",
+            name="coordinates_approximate",
+            field=models.BooleanField(
+                default=False,
+                editable=False,
+                help_text="Whether the coordinates are the geocoded centre of the town, neighbourhood or street",
+            ),
+        ),
+    ]
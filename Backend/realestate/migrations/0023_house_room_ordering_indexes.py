@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("realestate", "0022_house_coordinates_approximate"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="house",
+            index=models.Index(fields=["bedrooms", "id"], name="house_bedrooms_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="house",
+            index=models.Index(fields=["bathrooms", "id"], name="house_bathrooms_idx"),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("realestate", "0023_house_room_ordering_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="propertyimage",
+            options={
+                "ordering": ["house", "created_at", "id"],
+                "verbose_name": "Property Image",
+                "verbose_name_plural": "Property Images",
+            },
+        ),
+        migrations.AddField(
+            model_name="propertyimage",
+            name="created_at",
+            field=models.DateTimeField(
+                auto_now_add=True,
+                default=django.utils.timezone.now,
+                help_text="When the image was uploaded",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name="propertyimage",
+            index=models.Index(
+                fields=["house", "created_at", "id"], name="property_image_order_idx"
+            ),
+        ),
+    ]
@@ -1,10 +1,33 @@
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.files.storage import storages
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
 import uuid
+from decimal import Decimal
 
 
-class PropertyType(models.Model):
+class PropertyCounterMixin:
+    """
+    Keep saves of existing rows from overwriting the denormalized counters
+    named in `counter_fields`, which are updated in place (by
+    realestate.signals and realestate.engagement) and may be stale on the
+    instance being saved.
+    """
+    counter_fields = ('property_count',)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class PropertyType(PropertyCounterMixin, models.Model):
     """
     Model representing a type of property.
 
@@ -14,6 +37,11 @@ class PropertyType(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=100, help_text="Name of the property type")
 
+    property_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Number of Properties',
+        help_text="Number of properties of this type (maintained automatically)")
+    updated_at = models.DateTimeField(auto_now=True, help_text="When the property type was last updated")
+
     # Could add additional fields like:
     # description = models.TextField(blank=True, null=True, help_text="Description of this property type")
     # icon = models.URLField(blank=True, null=True, help_text="URL to an icon representing this property type")
@@ -27,7 +55,7 @@ class PropertyType(models.Model):
         verbose_name_plural = 'Property Types'
 
 
-class Feature(models.Model):
+class Feature(PropertyCounterMixin, models.Model):
     """
     Model representing a feature that properties can have.
 
@@ -37,6 +65,11 @@ class Feature(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=100, help_text="Name of the feature")
 
+    property_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Number of Properties',
+        help_text="Number of properties with this feature (maintained automatically)")
+    updated_at = models.DateTimeField(auto_now=True, help_text="When the feature was last updated")
+
     # Could add additional fields like:
     # description = models.TextField(blank=True, null=True, help_text="Description of this feature")
     # icon = models.URLField(blank=True, null=True, help_text="URL to an icon representing this feature")
@@ -51,7 +84,7 @@ class Feature(models.Model):
         verbose_name_plural = 'Features'
 
 
-class Agent(models.Model):
+class Agent(PropertyCounterMixin, models.Model):
     """
     Model representing a real estate agent.
 
@@ -86,6 +119,23 @@ class Agent(models.Model):
     specialization = models.CharField(max_length=255, blank=True, null=True, 
                                      help_text="Area of specialization (e.g., residential, commercial, luxury)")
 
+    # Denormalized statistics
+    property_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Number of Properties',
+        help_text="Number of properties listed by this agent (maintained automatically)")
+    pending_inquiry_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Pending Inquiries',
+        help_text="Number of inquiries awaiting a response (maintained automatically)")
+    responded_inquiry_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Responded Inquiries',
+        help_text="Number of inquiries responded to (maintained automatically)")
+
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        help_text="When the agent's profile, user or property count last changed; versions its cached representation")
+
+    counter_fields = ('property_count', 'pending_inquiry_count', 'responded_inquiry_count')
+
     def __str__(self):
         return self.name
 
@@ -112,10 +162,47 @@ class Agent(models.Model):
         """
         Return the number of properties associated with this agent.
         """
-        return self.get_properties().count()
+        return self.property_count
 
 
-class House(models.Model):
+class HouseQuerySet(models.QuerySet):
+    """
+    QuerySet for property listings.
+    """
+
+    @staticmethod
+    def listing_prefetches(fields=None):
+        """
+        Return the prefetch lookups for the relations HouseSerializer renders:
+        one query each for property types, images, features and agents (with
+        their user), regardless of how many houses are serialized.
+
+        `fields` is the set of serializer field names that will be rendered;
+        relations that are not among them are skipped. None includes all.
+        """
+        lookups = [name for name in ('property_type', 'images', 'features') if fields is None or name in fields]
+        if fields is None or 'agent' in fields:
+            lookups.append(Prefetch('agent', queryset=Agent.objects.select_related('user')))
+        return lookups
+
+    @staticmethod
+    def cover_image_prefetch():
+        """
+        Return a prefetch loading only the first image of each house into
+        `cover_images`, in the same order as `house.images.all()`.
+        """
+        return Prefetch(
+            'images', queryset=PropertyImage.objects.order_by(*PropertyImage.HOUSE_ORDERING)[:1],
+            to_attr='cover_images')
+
+    def for_listing(self, fields=None):
+        """
+        Load the relations HouseSerializer renders in a constant number of queries.
+        """
+        return self.prefetch_related(*self.listing_prefetches(fields))
+
+
+class House(PropertyCounterMixin, models.Model):
     """
     Model representing a real estate property listing.
 
@@ -138,6 +225,18 @@ class House(models.Model):
     address = models.CharField(max_length=255, help_text="Physical address of the property")
     location = models.CharField(max_length=255, blank=True, null=True, 
                                help_text="General location area (e.g., neighborhood, district)")
+    latitude = models.DecimalField(
+        max_digits=9, decimal_places=6, null=True, blank=True,
+        validators=[MinValueValidator(Decimal('-90')), MaxValueValidator(Decimal('90'))], help_text="Latitude in degrees")
+    longitude = models.DecimalField(
+        max_digits=9, decimal_places=6, null=True, blank=True,
+        validators=[MinValueValidator(Decimal('-180')), MaxValueValidator(Decimal('180'))], help_text="Longitude in degrees")
+    coordinates_approximate = models.BooleanField(
+        default=False, editable=False,
+        help_text="Whether the coordinates are the geocoded centre of the town, neighbourhood or street")
+    geohash = models.CharField(
+        max_length=12, blank=True, default='', editable=False,
+        help_text="Geohash of the coordinates, for map queries (see realestate.geo)")
 
     # Property details
     property_status = models.CharField(
@@ -166,13 +265,61 @@ class House(models.Model):
     status = models.CharField(max_length=20, default='active', 
                              help_text="Status of the listing (active, pending, sold, etc.)")
 
+    # Engagement, written behind by realestate.engagement
+    view_count = models.PositiveIntegerField(
+        default=0, editable=False, help_text="Number of times the listing was viewed (maintained automatically)")
+    favorite_count = models.PositiveIntegerField(
+        default=0, editable=False, help_text="Number of times the listing was favorited (maintained automatically)")
+    inquiry_count = models.PositiveIntegerField(
+        default=0, editable=False, help_text="Number of inquiries about the listing (maintained automatically)")
+    popularity = models.FloatField(
+        default=0, editable=False,
+        help_text="Time-decayed engagement score, comparable between listings only (maintained automatically)")
+
+    counter_fields = ('view_count', 'favorite_count', 'inquiry_count', 'popularity')
+
+    objects = HouseQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        """
+        Save inside a transaction so the listing counters updated by the
+        signal handlers commit or roll back together with the house.
+        """
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'Property'
         verbose_name_plural = 'Properties'
+        # Composite indexes matching the filter + sort combinations used by
+        # HouseViewSet.get_queryset and the keyset pagination (sort value, id).
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='house_created_idx'),
+            models.Index(fields=['price', 'id'], name='house_price_idx'),
+            models.Index(fields=['area', 'id'], name='house_area_idx'),
+            models.Index(fields=['bedrooms', 'id'], name='house_bedrooms_idx'),
+            models.Index(fields=['bathrooms', 'id'], name='house_bathrooms_idx'),
+            models.Index(fields=['property_status', 'created_at'], name='house_status_created_idx'),
+            models.Index(fields=['property_status', 'price', 'created_at'], name='house_status_price_idx'),
+            models.Index(fields=['property_type', 'created_at'], name='house_type_created_idx'),
+            models.Index(fields=['agent', 'created_at'], name='house_agent_created_idx'),
+            models.Index(fields=['created_by', 'created_at'], name='house_creator_created_idx'),
+            models.Index(fields=['bedrooms', 'bathrooms'], name='house_rooms_idx'),
+            models.Index(fields=['geohash'], name='house_geohash_idx'),
+            models.Index(fields=['popularity', 'id'], name='house_popularity_idx'),
+        ]
+
+
+def property_image_storage():
+    return storages['property_images']
 
 
 class PropertyImage(models.Model):
@@ -186,7 +333,18 @@ class PropertyImage(models.Model):
     house = models.ForeignKey(
         House, on_delete=models.CASCADE, related_name='images',
         help_text="The property this image belongs to")
-    image = models.ImageField(upload_to="property_images/", help_text="Image file for the property")
+    image = models.ImageField(
+        upload_to="property_images/", storage=property_image_storage, max_length=255,
+        help_text="Image file for the property")
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False, help_text="Width of the image in pixels")
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False, help_text="Height of the image in pixels")
+    variants = models.JSONField(
+        default=dict, blank=True, editable=False,
+        help_text="Resized variants by size name, filled in by realestate.images")
+    created_at = models.DateTimeField(auto_now_add=True, help_text="When the image was uploaded")
+
+    # Images of a property in upload order, the first being its cover.
+    HOUSE_ORDERING = ('created_at', 'id')
 
     # Could add additional fields like:
     # is_primary = models.BooleanField(default=False, help_text="Whether this is the main image for the property")
@@ -197,9 +355,233 @@ class PropertyImage(models.Model):
         return f"Image for {self.house.title}"
 
     class Meta:
-        ordering = ['house']
+        ordering = ['house', 'created_at', 'id']
         verbose_name = 'Property Image'
         verbose_name_plural = 'Property Images'
+        indexes = [
+            models.Index(fields=['house', 'created_at', 'id'], name='property_image_order_idx'),
+        ]
+
+
+class ImageBlob(models.Model):
+    """
+    Model representing one unique image file in content-addressed storage.
+
+    Files are stored once under their SHA-256 digest however many property
+    images (originals or variants) use them. `ref_count` is maintained by
+    realestate.blobs, from the PropertyImage signal handlers, as images are
+    saved and deleted; blobs that drop to zero are removed by the
+    `collect_image_blobs` management command.
+    """
+    digest = models.CharField(max_length=64, primary_key=True, help_text="SHA-256 of the file content")
+    name = models.CharField(max_length=255, unique=True, help_text="Storage name of the file")
+    size = models.PositiveBigIntegerField(help_text="File size in bytes")
+    ref_count = models.PositiveIntegerField(default=0, help_text="Number of image references to the file")
+    stored_at = models.DateTimeField(
+        default=timezone.now, help_text="When the file was stored, or last reused while unreferenced")
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = 'Image Blob'
+        verbose_name_plural = 'Image Blobs'
+        indexes = [
+            models.Index(fields=['ref_count', 'stored_at'], name='image_blob_refs_idx'),
+        ]
+
+
+class ImageUpload(models.Model):
+    """
+    Model representing a resumable upload of a property image.
+
+    The client declares the file length up front and sends the bytes in as
+    many requests as it needs; `offset` is how much has been received so
+    far. Once complete, the file becomes a PropertyImage of `house`.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    house = models.ForeignKey(
+        House, on_delete=models.CASCADE, related_name='uploads',
+        help_text="The property the image is uploaded for")
+    uploaded_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='image_uploads',
+        help_text="User sending the file")
+    filename = models.CharField(max_length=255, help_text="Original name of the file")
+    length = models.PositiveBigIntegerField(help_text="Total size of the file in bytes")
+    offset = models.PositiveBigIntegerField(default=0, help_text="Number of bytes received so far")
+    image = models.OneToOneField(
+        PropertyImage, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload',
+        help_text="The image created once the upload completed")
+    created_at = models.DateTimeField(auto_now_add=True, help_text="When the upload was started")
+    updated_at = models.DateTimeField(auto_now=True, help_text="When data was last received")
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.length})"
+
+    @property
+    def is_complete(self):
+        return self.offset == self.length
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Image Upload'
+        verbose_name_plural = 'Image Uploads'
+
+
+class ImageJob(models.Model):
+    """
+    Model representing a queued request to process a property image.
+
+    Jobs are created when an image is uploaded and picked up by the worker
+    pool in realestate.images (or the `process_images` management command),
+    which generates the resized variants off the request path. Failed jobs
+    are retried up to MAX_ATTEMPTS times.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    image = models.ForeignKey(
+        PropertyImage, on_delete=models.CASCADE, related_name='jobs',
+        help_text="The image to process")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, help_text="Processing status")
+    attempts = models.PositiveSmallIntegerField(default=0, help_text="Number of times processing was started")
+    error = models.TextField(blank=True, help_text="Error raised by the last failed attempt")
+    created_at = models.DateTimeField(auto_now_add=True, help_text="When the job was queued")
+    updated_at = models.DateTimeField(auto_now=True, help_text="When the job last changed status")
+
+    def __str__(self):
+        return f"{self.status} job for image {self.image_id}"
+
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = 'Image Job'
+        verbose_name_plural = 'Image Jobs'
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='image_job_status_idx'),
+        ]
+
+
+class ListingSearchTerm(models.Model):
+    """
+    Model representing one entry of the listing full-text search index.
+
+    Each row maps a normalized term to a property that contains it, with a
+    weight reflecting where (title, location, address, description) and how
+    often the term occurs. Rows are maintained by realestate.search whenever
+    a property is saved and removed with the property.
+    """
+    house = models.ForeignKey(
+        House, on_delete=models.CASCADE, related_name='search_terms',
+        help_text="The property containing the term")
+    term = models.CharField(max_length=64, help_text="Normalized search term")
+    weight = models.FloatField(help_text="Relevance weight of the term for this property")
+
+    def __str__(self):
+        return f"{self.term} -> {self.house_id}"
+
+    class Meta:
+        verbose_name = 'Listing Search Term'
+        verbose_name_plural = 'Listing Search Terms'
+        indexes = [
+            models.Index(fields=['term', 'house'], name='search_term_idx'),
+        ]
+
+
+class SimilarListing(models.Model):
+    """
+    Model representing one entry of a property's precomputed nearest neighbours.
+
+    Each property has up to SIMILAR_LISTINGS_COUNT rows, ranked from the most
+    similar one (rank 0). Rows are maintained by realestate.similar when
+    properties change and rebuilt by the `rebuild_similar_listings`
+    management command.
+    """
+    id = models.BigAutoField(primary_key=True)
+    house = models.ForeignKey(
+        House, on_delete=models.CASCADE, related_name='similar_listings',
+        help_text="The property the neighbour belongs to")
+    similar = models.ForeignKey(
+        House, on_delete=models.CASCADE, related_name='similar_to',
+        help_text="A property similar to it")
+    rank = models.PositiveSmallIntegerField(help_text="Position among the neighbours, 0 being the closest")
+    score = models.FloatField(help_text="Cosine similarity of the two properties")
+
+    def __str__(self):
+        return f"{self.house_id} ~ {self.similar_id} (#{self.rank})"
+
+    class Meta:
+        verbose_name = 'Similar Listing'
+        verbose_name_plural = 'Similar Listings'
+        constraints = [
+            models.UniqueConstraint(fields=['house', 'rank'], name='similar_listing_rank_uniq'),
+        ]
+
+
+class SimilarListingRefresh(models.Model):
+    """
+    Model representing a property whose similar listings must be recomputed.
+
+    Rows are queued by realestate.similar in the transaction that changes a
+    property, at most one per property, and drained by the
+    `refresh_similar_listings` management command.
+    """
+    id = models.BigAutoField(primary_key=True)
+    # Not a foreign key: properties are queued from pre_delete, while a bulk
+    # delete may be removing them too. Deleted ones are skipped.
+    house_id = models.UUIDField(unique=True, help_text="The property whose neighbours may have changed")
+    queued_at = models.DateTimeField(auto_now_add=True, help_text="When the refresh was queued")
+
+    def __str__(self):
+        return f"refresh {self.house_id}"
+
+    class Meta:
+        verbose_name = 'Similar Listing Refresh'
+        verbose_name_plural = 'Similar Listing Refreshes'
+
+
+class ListingChange(models.Model):
+    """
+    Model representing the latest change to a property, for delta sync.
+
+    Only the most recent change of each property is kept, so the log holds
+    at most one row per live property plus tombstones for deleted ones. The
+    auto-incrementing id orders changes and backs the sync tokens handed to
+    clients. Tombstones are purged after LISTING_CHANGES_RETENTION_DAYS by
+    the `compact_listing_changes` management command.
+    """
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    ACTION_CHOICES = [
+        (UPSERT, 'Created or updated'),
+        (DELETE, 'Deleted'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    # Not a foreign key: tombstones outlive the property they refer to.
+    house_id = models.UUIDField(unique=True, help_text="The property that changed")
+    action = models.CharField(max_length=6, choices=ACTION_CHOICES, help_text="Kind of change")
+    changed_at = models.DateTimeField(auto_now_add=True, help_text="When the change happened")
+
+    def __str__(self):
+        return f"{self.action} {self.house_id}"
+
+    class Meta:
+        verbose_name = 'Listing Change'
+        verbose_name_plural = 'Listing Changes'
+        indexes = [
+            models.Index(fields=['action', 'changed_at'], name='listing_change_action_idx'),
+            # Finding the first change too young to be trusted (see realestate.sync).
+            models.Index(fields=['changed_at'], name='listing_change_time_idx'),
+        ]
 
 
 class UserProfile(models.Model):
@@ -223,6 +605,9 @@ class UserProfile(models.Model):
         help_text="User account associated with this profile")
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='tenant',
                            help_text="User's role in the system")
+    token_version = models.PositiveIntegerField(
+        default=0, editable=False,
+        help_text="Bumped to revoke the user's tokens, e.g. when their role changes")
 
     # Contact information
     phone_number = models.CharField(max_length=20, blank=True,
@@ -334,6 +719,9 @@ class PropertyInquiry(models.Model):
     house = models.ForeignKey(
         House, on_delete=models.CASCADE, related_name='inquiries',
         help_text="Property that the inquiry is about")
+    agent = models.ForeignKey(
+        Agent, on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='inquiries',
+        help_text="Agent of the property, copied from it for the agent's inbox (maintained automatically)")
     message = models.TextField(help_text="Inquiry message from the tenant")
     response = models.TextField(blank=True, null=True, help_text="Response from the agent")
     status = models.CharField(
@@ -346,6 +734,12 @@ class PropertyInquiry(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Property Inquiry'
         verbose_name_plural = 'Property Inquiries'
+        indexes = [
+            # Agent inbox, newest first, all inquiries or those of one status,
+            # matching the keyset pagination (created_at, id).
+            models.Index(fields=['agent', 'status', 'created_at', 'id'], name='inquiry_agent_status_idx'),
+            models.Index(fields=['agent', 'created_at', 'id'], name='inquiry_agent_created_idx'),
+        ]
 
     def __str__(self):
         return f"Inquiry from {self.tenant.username} about {self.house.title}"
@@ -355,3 +749,78 @@ class PropertyInquiry(models.Model):
         Return the agent associated with the property.
         """
         return self.house.agent
+
+
+class SavedSearch(models.Model):
+    """
+    Model representing a listing search saved by a user.
+
+    The criteria mirror the listing filters. New and changed listings are
+    matched against every saved search (see realestate.saved_searches) and
+    the matches make up the user's "new for you" feed.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='saved_searches',
+        help_text="User who saved the search")
+    name = models.CharField(max_length=100, blank=True, help_text="Name given to the search by the user")
+    property_type = models.ForeignKey(
+        PropertyType, on_delete=models.CASCADE, null=True, blank=True,
+        help_text="Type of property, any if empty")
+    property_status = models.CharField(
+        max_length=20, choices=House.PROPERTY_STATUS_CHOICES, blank=True,
+        help_text="For sale or for rent, either if empty")
+    min_price = models.DecimalField(
+        max_digits=12, decimal_places=2, null=True, blank=True, help_text="Lowest price in USD")
+    max_price = models.DecimalField(
+        max_digits=12, decimal_places=2, null=True, blank=True, help_text="Highest price in USD")
+    bedrooms = models.PositiveIntegerField(null=True, blank=True, help_text="Minimum number of bedrooms")
+    bathrooms = models.PositiveIntegerField(null=True, blank=True, help_text="Minimum number of bathrooms")
+    agent = models.ForeignKey(
+        Agent, on_delete=models.CASCADE, null=True, blank=True,
+        help_text="Agent of the property, any if empty")
+    created_at = models.DateTimeField(auto_now_add=True, help_text="When the search was saved")
+    updated_at = models.DateTimeField(auto_now=True, help_text="When the search was last changed")
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Saved Search'
+        verbose_name_plural = 'Saved Searches'
+        indexes = [
+            # Picking up searches changed since an index was last synced.
+            models.Index(fields=['updated_at'], name='savedsearch_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name or 'Search'} of {self.user.username}"
+
+
+class SavedSearchMatch(models.Model):
+    """
+    A listing matching one of a user's saved searches, recorded when the
+    listing is created or changed. A listing is recorded once per user.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='search_matches',
+        help_text="Owner of the search, copied from it for the feed")
+    search = models.ForeignKey(
+        SavedSearch, on_delete=models.CASCADE, related_name='matches',
+        help_text="Saved search the listing matched first")
+    house = models.ForeignKey(
+        House, on_delete=models.CASCADE, related_name='search_matches',
+        help_text="Matching property")
+    created_at = models.DateTimeField(auto_now_add=True, help_text="When the listing matched")
+
+    class Meta:
+        unique_together = ('user', 'house')
+        ordering = ['-created_at']
+        verbose_name = 'Saved Search Match'
+        verbose_name_plural = 'Saved Search Matches'
+        indexes = [
+            # "New for you" feed, newest first, matching the keyset pagination.
+            models.Index(fields=['user', 'created_at', 'id'], name='searchmatch_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.house.title} for {self.user.username}"
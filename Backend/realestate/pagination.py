@@ -0,0 +1,187 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class ListingCursorPagination(BasePagination):
+    """
+    Keyset (cursor) pagination for property listings.
+
+    Pages are addressed by the (sort value, id) of the last row seen instead of
+    an OFFSET, so every page costs the same index range scan as the first one.
+    The sort column is taken from the queryset ordering (e.g. the one applied by
+    OrderingFilter, or an annotation such as the search rank), falling back to
+    '-created_at'. The primary key is always
+    used as the tie-breaker so rows sharing a price or bedroom count are never
+    skipped or repeated between pages.
+
+    Cursors are opaque base64 tokens; clients should only follow the `next`
+    and `previous` links returned in the response.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    default_ordering = '-created_at'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.page_size = getattr(settings, 'LISTINGS_PAGE_SIZE', 20)
+        self.max_page_size = getattr(settings, 'LISTINGS_MAX_PAGE_SIZE', 100)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+
+        field_name = self.ordering.lstrip('-')
+        self.field_name = field_name
+        self.is_annotation = field_name in queryset.query.annotations
+        if self.is_annotation:
+            self.field = queryset.query.annotations[field_name].output_field
+        else:
+            self.field = queryset.model._meta.get_field(field_name)
+        self.pk_field = queryset.model._meta.pk
+        descending = self.ordering.startswith('-')
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['reverse'])
+
+        # Walking backwards flips the sort so the rows nearest the cursor come first.
+        sort_descending = descending != reverse
+        prefix = '-' if sort_descending else ''
+        queryset = queryset.order_by(prefix + field_name, prefix + 'pk')
+
+        if cursor is not None:
+            queryset = queryset.filter(self.cursor_filter(field_name, cursor['value'], cursor['pk'], sort_descending))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.page = rows
+        if reverse:
+            self.has_next = cursor is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+        return rows
+
+    def cursor_filter(self, field_name, value, pk, descending):
+        """
+        Return the condition selecting the rows after (value, pk) in the sort
+        order. The redundant bound on the sort column alone lets the database
+        turn it into an index range instead of scanning the whole index.
+        """
+        lookup = 'lt' if descending else 'gt'
+        return Q(**{f'{field_name}__{lookup}e': value}) & (
+            Q(**{f'{field_name}__{lookup}': value}) | Q(**{field_name: value, f'pk__{lookup}': pk})
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        page_size = request.query_params.get(self.page_size_query_param)
+        if page_size:
+            try:
+                page_size = int(page_size)
+            except ValueError:
+                return self.page_size
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        return self.page_size
+
+    def get_ordering(self, queryset):
+        """
+        Return the leading ordering term of the queryset if it names a concrete
+        field or an annotation, otherwise the default ordering.
+        """
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        if ordering:
+            term = ordering[0]
+            if isinstance(term, str) and term.lstrip('-') not in ('pk', 'id', '?'):
+                if term.lstrip('-') in queryset.query.annotations:
+                    return term
+                try:
+                    queryset.model._meta.get_field(term.lstrip('-'))
+                    return term
+                except FieldDoesNotExist:
+                    pass
+        return self.default_ordering
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, instance, reverse):
+        payload = {
+            'o': self.ordering,
+            'v': self.get_cursor_value(instance),
+            'pk': str(instance.pk),
+            'r': int(reverse),
+        }
+        token = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('ascii'))
+        return replace_query_param(self.base_url, self.cursor_query_param, token.decode('ascii'))
+
+    def get_cursor_value(self, instance):
+        if self.is_annotation:
+            # Annotation output fields are not bound to the model, read the attribute directly.
+            return str(getattr(instance, self.field_name))
+        return self.field.value_to_string(instance)
+
+    def decode_cursor(self, request):
+        """
+        Decode the cursor from the request, if any.
+
+        A cursor issued for a different sort order is ignored and the first
+        page is returned, so changing the ordering never errors out.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii'))
+            if payload['o'] != self.ordering:
+                self.base_url = remove_query_param(self.base_url, self.cursor_query_param)
+                return None
+            value = self.field.to_python(payload['v'])
+            pk = self.pk_field.to_python(payload['pk'])
+            reverse = bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return {'value': value, 'pk': pk, 'reverse': reverse}
@@ -0,0 +1,187 @@
+"""
+Cache of authenticated principals.
+
+Authenticating a token by the database costs a query for the user, and the
+role checks in the views used to add one for the profile and one for the
+agent. Here a user id is resolved to a bundle of the user's fields (without
+the password hash), role, agent id and token version, loaded with a single
+query and cached at two levels: a small LRU in each process with a short
+TTL, in front of the shared PRINCIPAL_CACHE.
+
+Saving or deleting a User, UserProfile or Agent drops the user's bundle from
+the shared cache and from this process's LRU (see realestate.signals).
+Other processes may keep serving their LRU copy for up to
+PRINCIPAL_CACHE_LOCAL_TIMEOUT seconds.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+
+
+class LocalLRU:
+    """
+    Thread-safe, size-bounded mapping whose entries expire after a TTL.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_local = None
+_local_lock = threading.Lock()
+_stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def principal_cache_enabled():
+    return getattr(settings, 'PRINCIPAL_CACHE_ENABLED', True)
+
+
+def get_shared_cache():
+    return caches[getattr(settings, 'PRINCIPAL_CACHE', 'default')]
+
+
+def get_local_cache():
+    global _local
+    with _local_lock:
+        if _local is None:
+            _local = LocalLRU(getattr(settings, 'PRINCIPAL_CACHE_LOCAL_SIZE', 1024))
+    return _local
+
+
+def cache_key(user_id):
+    return f'principal:{user_id}'
+
+
+def user_fields():
+    """
+    Return the attnames of the user fields kept in a bundle, in model order.
+    """
+    return [field.attname for field in get_user_model()._meta.concrete_fields if field.attname != 'password']
+
+
+def load_principal(user_id):
+    """
+    Return the principal bundle of a user from the database, or None.
+    """
+    user = (
+        get_user_model().objects.filter(pk=user_id)
+        .select_related('profile', 'agent_profile').defer('password').first()
+    )
+    if user is None:
+        return None
+    profile = getattr(user, 'profile', None)
+    agent = getattr(user, 'agent_profile', None)
+    return {
+        'user': {name: getattr(user, name) for name in user_fields()},
+        'role': profile.role if profile else None,
+        'agent_id': str(agent.pk) if agent else None,
+        'token_version': profile.token_version if profile else 0,
+    }
+
+
+def count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def get_principal(user_id):
+    """
+    Return the principal bundle of a user, from the local LRU, the shared
+    cache or the database, in that order. Returns None for unknown users.
+    """
+    key = cache_key(user_id)
+    local = get_local_cache()
+    bundle = local.get(key)
+    if bundle is not None:
+        count('local_hits')
+        return bundle
+
+    shared = get_shared_cache()
+    bundle = shared.get(key)
+    if bundle is not None:
+        count('shared_hits')
+    else:
+        count('misses')
+        bundle = load_principal(user_id)
+        if bundle is None:
+            return None
+        shared.set(key, bundle, timeout=getattr(settings, 'PRINCIPAL_CACHE_TIMEOUT', 60))
+    local.set(key, bundle, getattr(settings, 'PRINCIPAL_CACHE_LOCAL_TIMEOUT', 5))
+    return bundle
+
+
+def build_user(bundle):
+    """
+    Return a user instance from a bundle, with the password deferred.
+    """
+    values = bundle['user']
+    names = [name for name in user_fields() if name in values]
+    return get_user_model().from_db('default', names, [values[name] for name in names])
+
+
+def invalidate_principals(user_ids):
+    """
+    Drop the cached bundles of the given users, now and again when the
+    current transaction commits, so a request reading the old rows in the
+    meantime cannot put a stale bundle back.
+    """
+    keys = [cache_key(user_id) for user_id in user_ids if user_id is not None]
+    if not keys:
+        return
+
+    def drop():
+        local = get_local_cache()
+        for key in keys:
+            local.delete(key)
+        get_shared_cache().delete_many(keys)
+
+    drop()
+    transaction.on_commit(drop)
+
+
+def principal_cache_stats():
+    """
+    Return this process's principal cache counters and hit ratio.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = sum(stats.values())
+    hits = stats['local_hits'] + stats['shared_hits']
+    stats['enabled'] = principal_cache_enabled()
+    stats['hit_ratio'] = round(hits / lookups, 4) if lookups else None
+    return stats
@@ -0,0 +1,351 @@
+"""
+Content-based listing recommendations.
+
+Every house is represented by a fixed-length vector made of weighted blocks
+(property type, listing status, price band, bedrooms, bathrooms, area band,
+features and location words), held in one NumPy matrix per process. Values
+without a natural order (types, features, words) are hashed into their
+block, so new catalogue entries never change the layout. Rows are
+normalized, which makes cosine similarity a single matrix-vector product.
+
+A tenant's profile is the mean of the vectors of their favorites; candidates
+are scored against it in one pass and the best ones picked with
+argpartition, a few milliseconds for 100k listings (see the
+`benchmark_recommendations` management command).
+
+The matrix follows the ListingChange log (see realestate.sync): before
+answering, the index applies the changes recorded since the last one it
+has seen. It is first built when the server starts (see
+`warm_up_index`), and every RECOMMENDATION_INDEX_MAX_AGE seconds a new one
+is built from scratch in a background thread and swapped in, so no request
+waits for a full load (about 4 s for 100k listings). Results are cached per
+user for RECOMMENDATIONS_CACHE_TIMEOUT seconds and dropped when the user's
+favorites change.
+"""
+import logging
+import math
+import re
+import threading
+import time
+import zlib
+from bisect import bisect_right
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .models import Favorite, House, ListingChange
+from .sync import stable_change_id
+
+logger = logging.getLogger(__name__)
+
+# (name, width, weight) of each block of a house vector.
+BLOCKS = (
+    ('property_type', 8, 1.0),
+    ('property_status', 4, 0.8),
+    ('price', 12, 1.0),
+    ('bedrooms', 6, 0.7),
+    ('bathrooms', 4, 0.5),
+    ('area', 10, 0.5),
+    ('features', 24, 0.6),
+    ('location', 28, 1.0),
+)
+
+
+def block_offsets(blocks):
+    offsets, offset = {}, 0
+    for name, width, _ in blocks:
+        offsets[name] = offset
+        offset += width
+    return offsets, offset
+
+
+OFFSETS, DIMENSIONS = block_offsets(BLOCKS)
+WIDTHS = {name: width for name, width, _ in BLOCKS}
+WEIGHTS = {name: weight for name, _, weight in BLOCKS}
+
+# Upper edges of the price and area bands; both grow geometrically.
+PRICE_BANDS = [100 * 2 ** i for i in range(11)]
+AREA_BANDS = [25 * 2 ** i for i in range(9)]
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+HOUSE_FIELDS = ('id', 'property_type_id', 'property_status', 'price', 'bedrooms', 'bathrooms', 'area', 'location')
+
+DEFAULT_LIMIT = 5
+MAX_LIMIT = 50
+
+
+def bucket(value, block):
+    """
+    Return a stable slot for a value in the given block.
+    """
+    return zlib.crc32(str(value).encode()) % WIDTHS[block]
+
+
+def put(vector, block, slots):
+    """
+    Spread the weight of a block evenly over the given slots.
+    """
+    slots = list(slots)
+    if not slots:
+        return
+    offset = OFFSETS[block]
+    weight = WEIGHTS[block] / math.sqrt(len(slots))
+    for slot in slots:
+        vector[offset + slot] += weight
+
+
+def band_slots(value, edges):
+    """
+    Return the band of a value plus its neighbours, so close values in
+    adjacent bands still overlap.
+    """
+    band = bisect_right(edges, value)
+    return [slot for slot in (band - 1, band, band, band + 1) if 0 <= slot <= len(edges)]
+
+
+def house_vector(row, feature_ids=()):
+    """
+    Return the normalized vector of a house from a HOUSE_FIELDS row and the
+    ids of its features.
+    """
+    _, property_type_id, property_status, price, bedrooms, bathrooms, area, location = row
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    if property_type_id is not None:
+        put(vector, 'property_type', [bucket(property_type_id, 'property_type')])
+    put(vector, 'property_status', [bucket(property_status, 'property_status')])
+    put(vector, 'price', band_slots(float(price or 0), PRICE_BANDS))
+    put(vector, 'bedrooms', [min(bedrooms, WIDTHS['bedrooms'] - 1)])
+    put(vector, 'bathrooms', [min(bathrooms, WIDTHS['bathrooms'] - 1)])
+    put(vector, 'area', band_slots(area or 0, AREA_BANDS))
+    put(vector, 'features', {bucket(pk, 'features') for pk in feature_ids})
+    put(vector, 'location', {bucket(word, 'location') for word in WORD_RE.findall((location or '').lower())})
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def load_vectors(house_ids=None):
+    """
+    Return {house_id: vector} for the given houses (all when None), in two queries.
+    """
+    houses = House.objects.all()
+    features = House.features.through.objects.all()
+    if house_ids is not None:
+        houses = houses.filter(pk__in=house_ids)
+        features = features.filter(house_id__in=house_ids)
+    feature_ids = defaultdict(list)
+    for house_id, feature_id in features.values_list('house_id', 'feature_id'):
+        feature_ids[house_id].append(feature_id)
+    return {row[0]: house_vector(row, feature_ids[row[0]]) for row in houses.values_list(*HOUSE_FIELDS)}
+
+
+class HouseVectorIndex:
+    """
+    Matrix of house vectors with row bookkeeping for incremental updates.
+    """
+
+    def __init__(self, capacity=1024):
+        self.lock = threading.RLock()
+        # Held while loading every house, so a cold index is loaded once.
+        self.build_lock = threading.Lock()
+        self.rebuilding = False
+        self.reset(capacity)
+
+    def reset(self, capacity):
+        self.matrix = np.zeros((capacity, DIMENSIONS), dtype=np.float32)
+        self.live = np.zeros(capacity, dtype=bool)
+        self.ids = [None] * capacity
+        self.rows = {}
+        self.free = []
+        self.size = 0
+        self.change_id = 0
+        self.built_at = 0.0
+
+    def grow(self):
+        capacity = len(self.ids) * 2
+        matrix = np.zeros((capacity, DIMENSIONS), dtype=np.float32)
+        matrix[:self.size] = self.matrix[:self.size]
+        live = np.zeros(capacity, dtype=bool)
+        live[:self.size] = self.live[:self.size]
+        self.matrix, self.live = matrix, live
+        self.ids.extend([None] * (capacity - len(self.ids)))
+
+    def upsert(self, house_id, vector):
+        with self.lock:
+            row = self.rows.get(house_id)
+            if row is None:
+                if self.free:
+                    row = self.free.pop()
+                else:
+                    if self.size == len(self.ids):
+                        self.grow()
+                    row = self.size
+                    self.size += 1
+                self.rows[house_id] = row
+                self.ids[row] = house_id
+            self.matrix[row] = vector
+            self.live[row] = True
+
+    def remove(self, house_id):
+        with self.lock:
+            row = self.rows.pop(house_id, None)
+            if row is not None:
+                self.live[row] = False
+                self.matrix[row] = 0
+                self.ids[row] = None
+                self.free.append(row)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def recommend(self, favorite_ids, limit=DEFAULT_LIMIT, exclude=()):
+        """
+        Return up to `limit` house ids most similar to the mean vector of
+        the favorites, best first, leaving out favorites and `exclude`.
+        """
+        with self.lock:
+            rows = [self.rows[pk] for pk in favorite_ids if pk in self.rows]
+            if not rows:
+                return []
+            profile = self.matrix[rows].mean(axis=0)
+            norm = np.linalg.norm(profile)
+            if not norm:
+                return []
+            scores = self.matrix[:self.size] @ (profile / norm)
+            scores[~self.live[:self.size]] = -np.inf
+            scores[rows] = -np.inf
+            for pk in exclude:
+                if pk in self.rows:
+                    scores[self.rows[pk]] = -np.inf
+
+            candidates = int(np.count_nonzero(np.isfinite(scores)))
+            limit = min(limit, candidates)
+            if limit <= 0:
+                return []
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            top = top[np.argsort(-scores[top], kind='stable')]
+            return [self.ids[row] for row in top]
+
+    def rebuild(self):
+        """
+        Load every house into a new matrix and swap it in, replacing the
+        current contents. Lookups keep using the current matrix meanwhile.
+        """
+        # Read the log position first: changes made while loading are applied again later.
+        change_id = stable_change_id()
+        vectors = load_vectors()
+        fresh = HouseVectorIndex(max(1024, 1 << max(len(vectors) - 1, 0).bit_length()))
+        for house_id, vector in vectors.items():
+            fresh.upsert(house_id, vector)
+        with self.lock:
+            self.matrix, self.live, self.ids = fresh.matrix, fresh.live, fresh.ids
+            self.rows, self.free, self.size = fresh.rows, fresh.free, fresh.size
+            self.change_id = change_id
+            self.built_at = time.monotonic()
+
+    def rebuild_in_background(self):
+        """
+        Start rebuilding in a daemon thread, unless a rebuild is running.
+        """
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+        threading.Thread(target=self.run_rebuild, name='recommendation-index', daemon=True).start()
+
+    def run_rebuild(self):
+        try:
+            with self.build_lock:
+                self.rebuild()
+        except Exception:
+            logger.exception("Rebuilding the recommendation index failed")
+        finally:
+            self.rebuilding = False
+            # The thread got its own connection; do not leak it.
+            connection.close()
+
+    def sync(self):
+        """
+        Apply the listing changes recorded since the last sync with one
+        indexed range query. An index that was never built is loaded first;
+        one older than RECOMMENDATION_INDEX_MAX_AGE keeps answering while a
+        new one is built in the background.
+        """
+        if not self.built_at:
+            with self.build_lock:
+                if not self.built_at:
+                    self.rebuild()
+                    return
+        if time.monotonic() - self.built_at > getattr(settings, 'RECOMMENDATION_INDEX_MAX_AGE', 3600):
+            self.rebuild_in_background()
+        with self.lock:
+            changes = list(
+                ListingChange.objects.filter(pk__gt=self.change_id).order_by('pk')
+                .values_list('pk', 'house_id', 'action')
+            )
+            if not changes:
+                return
+            upserts = [house_id for _, house_id, action in changes if action == ListingChange.UPSERT]
+            vectors = load_vectors(upserts) if upserts else {}
+            for _, house_id, action in changes:
+                if action == ListingChange.DELETE or house_id not in vectors:
+                    self.remove(house_id)
+                else:
+                    self.upsert(house_id, vectors[house_id])
+            # Stop at the first young change, which is applied again next time.
+            self.change_id = max(self.change_id, min(changes[-1][0], stable_change_id()))
+
+
+_index = HouseVectorIndex()
+
+
+def get_index():
+    """
+    Return this process's house vector index, brought up to date.
+    """
+    _index.sync()
+    return _index
+
+
+def reset_index():
+    """
+    Drop the in-process index; it is rebuilt on next use.
+    """
+    global _index
+    _index = HouseVectorIndex()
+
+
+def warm_up_index():
+    """
+    Build this process's index in the background, so the first
+    recommendations do not wait for it. Called when the server starts.
+    """
+    if getattr(settings, 'RECOMMENDATION_INDEX_WARM_UP', True) and not _index.built_at:
+        _index.rebuild_in_background()
+
+
+def cache_key(user_id):
+    return f'recommendations:{user_id}'
+
+
+def recommended_house_ids(user, limit=DEFAULT_LIMIT):
+    """
+    Return the ids of up to `limit` houses recommended to a user, best
+    first, from the per-user cache when possible. Empty without favorites.
+    """
+    key = cache_key(user.pk)
+    cached = cache.get(key)
+    if cached is not None and cached['limit'] >= limit:
+        return cached['ids'][:limit]
+
+    favorite_ids = list(Favorite.objects.filter(user=user).values_list('house_id', flat=True))
+    ids = get_index().recommend(favorite_ids, limit) if favorite_ids else []
+    cache.set(key, {'limit': limit, 'ids': ids}, timeout=getattr(settings, 'RECOMMENDATIONS_CACHE_TIMEOUT', 300))
+    return ids
+
+
+def invalidate_recommendations(user_id):
+    cache.delete(cache_key(user_id))
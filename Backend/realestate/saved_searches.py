@@ -0,0 +1,282 @@
+"""
+Saved searches and the "new for you" feed.
+
+When a listing is created or changed it is matched against every saved
+search without running any of them as a query. Each process keeps a
+predicate index of the saved searches: they are bucketed by property type
+and status, an empty criterion falling in the "any" bucket, and each bucket
+holds a centered interval tree over the searches' price ranges. Matching a
+listing looks up at most four buckets (its type or any, its status or any),
+stabs their trees with its price, and checks the remaining minimums
+(bedrooms, bathrooms) and agent on the few searches found. Matches are
+stored as SavedSearchMatch rows, once per user and listing, when the
+listing's transaction commits.
+
+The index costs one aggregate query per match to notice searches saved or
+deleted by other processes, loads only the searches changed since, and is
+rebuilt from scratch every SAVED_SEARCH_INDEX_MAX_AGE seconds.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+
+from .models import House, SavedSearch, SavedSearchMatch
+
+# Searches a single user may save.
+MAX_SAVED_SEARCHES = 50
+
+SEARCH_FIELDS = (
+    'id', 'user_id', 'property_type_id', 'property_status', 'min_price', 'max_price',
+    'bedrooms', 'bathrooms', 'agent_id',
+)
+HOUSE_FIELDS = (
+    'id', 'created_by_id', 'property_type_id', 'property_status', 'price',
+    'bedrooms', 'bathrooms', 'agent_id', 'status',
+)
+
+LOWEST = float('-inf')
+HIGHEST = float('inf')
+
+
+class IntervalTree:
+    """
+    Static centered interval tree answering which (low, high, key)
+    intervals contain a point, in O(log n + matches).
+    """
+
+    def __init__(self, intervals):
+        self.root = self.build(list(intervals))
+
+    def build(self, intervals):
+        if not intervals:
+            return None
+        endpoints = sorted(point for low, high, _ in intervals for point in (low, high))
+        center = endpoints[len(endpoints) // 2]
+        left = [interval for interval in intervals if interval[1] < center]
+        right = [interval for interval in intervals if interval[0] > center]
+        overlapping = [interval for interval in intervals if interval[0] <= center <= interval[1]]
+        by_low = sorted(overlapping, key=lambda interval: interval[0])
+        by_high = sorted(overlapping, key=lambda interval: interval[1], reverse=True)
+        return (center, by_low, by_high, self.build(left), self.build(right))
+
+    def stab(self, point):
+        """
+        Return the keys of the intervals containing point.
+        """
+        keys = []
+        node = self.root
+        while node is not None:
+            center, by_low, by_high, left, right = node
+            if point < center:
+                for low, _, key in by_low:
+                    if low > point:
+                        break
+                    keys.append(key)
+                node = left
+            elif point > center:
+                for _, high, key in by_high:
+                    if high < point:
+                        break
+                    keys.append(key)
+                node = right
+            else:
+                keys.extend(key for _, _, key in by_low)
+                node = None
+        return keys
+
+
+class PriceBucket:
+    """
+    The price ranges of the searches sharing a type and status, with the
+    interval tree over them rebuilt on the first lookup after a change.
+    """
+
+    def __init__(self):
+        self.ranges = {}
+        self.tree = None
+
+    def add(self, search_id, low, high):
+        self.ranges[search_id] = (LOWEST if low is None else low, HIGHEST if high is None else high)
+        self.tree = None
+
+    def discard(self, search_id):
+        self.ranges.pop(search_id, None)
+        self.tree = None
+
+    def stab(self, price):
+        if self.tree is None:
+            self.tree = IntervalTree((low, high, search_id) for search_id, (low, high) in self.ranges.items())
+        return self.tree.stab(price)
+
+
+class SavedSearchIndex:
+    """
+    Predicate index of the saved searches of every user.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        self.searches = {}
+        self.buckets = {}
+        self.state = None
+        self.built_at = 0.0
+
+    def bucket_key(self, row):
+        return row[2], row[3] or None
+
+    def upsert(self, row):
+        with self.lock:
+            self.remove(row[0])
+            self.searches[row[0]] = row
+            self.buckets.setdefault(self.bucket_key(row), PriceBucket()).add(row[0], row[4], row[5])
+
+    def remove(self, search_id):
+        with self.lock:
+            row = self.searches.pop(search_id, None)
+            if row is None:
+                return
+            key = self.bucket_key(row)
+            bucket = self.buckets[key]
+            bucket.discard(search_id)
+            if not bucket.ranges:
+                del self.buckets[key]
+
+    def __len__(self):
+        return len(self.searches)
+
+    def matches(self, house):
+        """
+        Return the saved searches a HOUSE_FIELDS row matches, as SEARCH_FIELDS rows.
+        """
+        _, owner_id, type_id, status, price, bedrooms, bathrooms, agent_id, _ = house
+        found = []
+        with self.lock:
+            for key in {(type_id, status), (type_id, None), (None, status), (None, None)}:
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    continue
+                for search_id in bucket.stab(price):
+                    search = self.searches[search_id]
+                    if (search[1] != owner_id
+                            and (search[6] is None or bedrooms >= search[6])
+                            and (search[7] is None or bathrooms >= search[7])
+                            and (search[8] is None or search[8] == agent_id)):
+                        found.append(search)
+        return found
+
+    def rebuild(self):
+        state = current_state()
+        rows = list(SavedSearch.objects.values_list(*SEARCH_FIELDS))
+        with self.lock:
+            self.reset()
+            for row in rows:
+                self.upsert(row)
+            self.state = state
+            self.built_at = time.monotonic()
+
+    def sync(self):
+        """
+        Rebuild when too old or out of step, otherwise load the searches
+        changed since the last sync.
+        """
+        with self.lock:
+            if not self.built_at or time.monotonic() - self.built_at > getattr(settings, 'SAVED_SEARCH_INDEX_MAX_AGE', 3600):
+                self.rebuild()
+                return
+            state = current_state()
+            if state == self.state:
+                return
+            last = self.state['last']
+            changed = SavedSearch.objects.all()
+            if last is not None:
+                # Searches saved in the same instant as the last one seen are loaded again.
+                changed = changed.filter(updated_at__gte=last)
+            for row in changed.values_list(*SEARCH_FIELDS):
+                self.upsert(row)
+            if len(self.searches) != state['total']:
+                # Searches were deleted elsewhere.
+                self.rebuild()
+                return
+            self.state = state
+
+
+def current_state():
+    return SavedSearch.objects.aggregate(total=Count('pk'), last=Max('updated_at'))
+
+
+_index = SavedSearchIndex()
+
+
+def get_index():
+    """
+    Return this process's saved search index, brought up to date.
+    """
+    _index.sync()
+    return _index
+
+
+def reset_index():
+    """
+    Drop the in-process index; it is rebuilt on next use.
+    """
+    global _index
+    _index = SavedSearchIndex()
+
+
+def match_houses(house_ids):
+    """
+    Record the saved searches the given listings now match, and return the
+    number of (user, listing) matches found. Only active listings match,
+    and never a search of the listing's own creator.
+    """
+    houses = House.objects.filter(pk__in=house_ids, status='active').values_list(*HOUSE_FIELDS)
+    index = None
+    found = {}
+    for house in houses:
+        index = index or get_index()
+        for search in index.matches(house):
+            found.setdefault((search[1], house[0]), set()).add(search[0])
+    if not found:
+        return 0
+
+    # Credit each match to the user's oldest matching search. Searches
+    # deleted since the index last synced are left out.
+    ordered = (
+        SavedSearch.objects.filter(pk__in={pk for ids in found.values() for pk in ids})
+        .order_by('created_at', 'pk').values_list('pk', flat=True)
+    )
+    position = {pk: i for i, pk in enumerate(ordered)}
+    matches = []
+    for (user_id, house_id), ids in found.items():
+        ids = [pk for pk in ids if pk in position]
+        if ids:
+            search_id = min(ids, key=position.__getitem__)
+            matches.append(SavedSearchMatch(user_id=user_id, search_id=search_id, house_id=house_id))
+    # Listings a user was already told about keep their place in the feed.
+    SavedSearchMatch.objects.bulk_create(matches, ignore_conflicts=True)
+    return len(matches)
+
+
+def schedule_match(house_ids):
+    """
+    Match the given listings once the current transaction commits.
+    """
+    house_ids = list(house_ids)
+    if house_ids:
+        transaction.on_commit(lambda: match_houses(house_ids))
+
+
+def feed_queryset(user, search_id=None):
+    """
+    Return the active listings matched for a user, newest match first.
+    """
+    matches = SavedSearchMatch.objects.filter(user=user, house__status='active')
+    if search_id is not None:
+        matches = matches.filter(search_id=search_id)
+    return matches.order_by('-created_at')
@@ -0,0 +1,211 @@
+"""
+Full-text search over property listings.
+
+Listings are indexed into ListingSearchTerm, an inverted index of
+(term, house, weight) rows stored in the regular database, so the same
+ranking, prefix matching and typo tolerance work on MySQL in production and
+SQLite in tests. Every lookup is a range scan on the (term, house) index;
+nothing falls back to LIKE '%...%' over the listings table.
+"""
+import math
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, FloatField, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Length
+
+from .models import ListingSearchTerm
+
+# Relative importance of a term depending on the field it appears in.
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'location': 2.0,
+    'address': 2.0,
+    'description': 1.0,
+}
+
+# Score multipliers per kind of match between a query token and an indexed term.
+EXACT_MATCH = 1.0
+PREFIX_MATCH = 0.7
+FUZZY_MATCH = 0.5
+
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 8
+MIN_FUZZY_LENGTH = 4
+MAX_FUZZY_CANDIDATES = 2000
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """
+    Split text into lowercase search terms, ignoring one-letter tokens.
+    """
+    if not text:
+        return []
+    return [
+        token[:MAX_TERM_LENGTH]
+        for token in TOKEN_RE.findall(text.lower())
+        if len(token) >= MIN_TERM_LENGTH
+    ]
+
+
+def term_weights(house):
+    """
+    Return {term: weight} for a house. Repeated terms add up sub-linearly so
+    a keyword-stuffed description cannot outrank a matching title.
+    """
+    weights = Counter()
+    for field, field_weight in FIELD_WEIGHTS.items():
+        for term, count in Counter(tokenize(getattr(house, field))).items():
+            weights[term] += field_weight * (1 + math.log(count))
+    return weights
+
+
+def index_house(house):
+    """
+    Replace the search index rows of a single house.
+    """
+    with transaction.atomic():
+        ListingSearchTerm.objects.filter(house=house).delete()
+        ListingSearchTerm.objects.bulk_create([
+            ListingSearchTerm(house=house, term=term, weight=weight)
+            for term, weight in term_weights(house).items()
+        ])
+
+
+def prefix_upper_bound(prefix):
+    """
+    Return the smallest string greater than every string starting with prefix,
+    so prefix lookups become an index range scan (term >= prefix AND term < bound).
+    """
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def within_edit_distance(a, b, limit):
+    """
+    Return True if the optimal string alignment distance between a and b
+    (Levenshtein distance counting a swap of adjacent letters as one edit)
+    is at most limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return False
+    before = None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            distance = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            )
+            if before is not None and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                distance = min(distance, before[j - 2] + 1)
+            current.append(distance)
+        # A transposition reaches back two rows, so stop only when both are over.
+        if min(current) > limit and min(previous) > limit:
+            return False
+        before, previous = previous, current
+    return previous[-1] <= limit
+
+
+def candidate_terms(prefix, token, limit, cap=None):
+    """
+    Return the distinct indexed terms starting with prefix whose length is
+    within limit of the token's, read through the term index.
+    """
+    candidates = (
+        ListingSearchTerm.objects
+        .filter(term__gte=prefix, term__lt=prefix_upper_bound(prefix))
+        .annotate(length=Length('term'))
+        .filter(length__gte=len(token) - limit, length__lte=len(token) + limit)
+        .order_by('term')
+        .values_list('term', flat=True)
+        .distinct()
+    )
+    return candidates[:cap] if cap else candidates
+
+
+def fuzzy_terms(token):
+    """
+    Return indexed terms within a small edit distance of token.
+
+    Candidates must share the token's first letter and have a length within
+    the edit distance of its own. Terms sharing the first two letters are
+    all considered; those differing in the second letter only up to
+    MAX_FUZZY_CANDIDATES, so the lookup stays bounded for common letters.
+    Typos in the first letter are not caught.
+    """
+    if len(token) < MIN_FUZZY_LENGTH:
+        return []
+    limit = 1 if len(token) < 8 else 2
+    candidates = set(candidate_terms(token[:2], token, limit))
+    candidates.update(candidate_terms(token[0], token, limit, MAX_FUZZY_CANDIDATES))
+    return sorted(term for term in candidates if term != token and within_edit_distance(token, term, limit))
+
+
+def weighted(multiplier):
+    return F('weight') * Value(multiplier)
+
+
+def token_conditions(token):
+    """
+    Return (condition, score expression) matching a query token against the
+    index: exact term, then prefix, then close misspellings.
+    """
+    exact = Q(term=token)
+    prefix = Q(term__gt=token, term__lt=prefix_upper_bound(token))
+    condition = exact | prefix
+    whens = [
+        When(exact, then=weighted(EXACT_MATCH)),
+        When(prefix, then=weighted(PREFIX_MATCH)),
+    ]
+
+    typos = fuzzy_terms(token)
+    if typos:
+        fuzzy = Q(term__in=typos)
+        condition |= fuzzy
+        whens.append(When(fuzzy, then=weighted(FUZZY_MATCH)))
+
+    return condition, Case(*whens, default=Value(0.0), output_field=FloatField())
+
+
+def search_houses(queryset, query):
+    """
+    Restrict a House queryset to listings matching every token of query and
+    annotate them with `search_rank`, ordered best match first. A query with
+    no searchable terms leaves the queryset unchanged.
+    """
+    tokens = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not tokens:
+        return queryset
+
+    any_token = Q()
+    score = Value(0.0)
+    matched = {}
+    for i, token in enumerate(tokens):
+        condition, token_score = token_conditions(token)
+        any_token |= condition
+        score = score + token_score
+        matched[f'matched_{i}'] = Max(Case(When(condition, then=Value(1)), default=Value(0),
+                                           output_field=IntegerField()))
+
+    matches = (
+        ListingSearchTerm.objects
+        .filter(any_token)
+        .order_by()
+        .values('house_id')
+        .annotate(score=Sum(score, output_field=FloatField()), **matched)
+        .filter(**{name: 1 for name in matched})
+    )
+    rank = matches.filter(house_id=OuterRef('pk')).values('score')[:1]
+
+    return (
+        queryset
+        .filter(pk__in=matches.values('house_id'))
+        .annotate(search_rank=Subquery(rank, output_field=FloatField()))
+        .order_by('-search_rank', '-created_at')
+    )
@@ -1,11 +1,63 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.models import User
-from .models import House, PropertyType, Feature, PropertyImage, Agent, UserProfile, Favorite, PropertyInquiry
+from django.core.exceptions import ValidationError as DjangoValidationError
+from .images import VARIANT_FORMATS
+from .models import (HouseQuerySet, House, PropertyType, Feature, PropertyImage, ImageUpload, Agent, UserProfile, Favorite,
+                     PropertyInquiry, SavedSearch, SavedSearchMatch)
+from .uploads import add_images, validate_image_file
 from django.contrib.auth.password_validation import validate_password
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import ROLE_CLAIM, RoleRefreshToken, check_token_version, token_version
 
 
-class PropertyTypeSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """
+    Serializer mixin that lets clients choose which fields are rendered.
+
+    `fields` limits the output to the named fields, and `expand` adds fields
+    listed in Meta.expandable_fields, which are left out by default. Omitted
+    fields are removed before serialization, so method fields and nested
+    serializers that are not requested are never evaluated.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        expandable = set(getattr(self.Meta, 'expandable_fields', ()))
+        if fields:
+            keep = set(fields) | set(expand or ())
+        else:
+            keep = set(self.fields) - (expandable - set(expand or ()))
+        for name in set(self.fields) - keep:
+            self.fields.pop(name)
+
+    def get_prefetch_lookups(self):
+        """
+        Return the prefetch_related() lookups needed by the rendered fields.
+        """
+        return []
+
+
+class StreamedImageField(serializers.FileField):
+    """
+    Image upload field validated from the image header only.
+
+    Unlike ImageField, the file is never fully decoded: uploads received
+    through realestate.uploads.ImageUploadHandler were checked while they
+    streamed in, and other files have their first chunks inspected.
+    """
+
+    def to_internal_value(self, data):
+        file = super().to_internal_value(data)
+        try:
+            validate_image_file(file)
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError(exc.messages)
+        return file
+
+
+class PropertyTypeSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
 
     class Meta:
@@ -13,7 +65,7 @@ class PropertyTypeSerializer(serializers.ModelSerializer):
         fields = ['id', 'name']
 
 
-class FeatureSerializer(serializers.ModelSerializer):
+class FeatureSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
 
     class Meta:
@@ -22,22 +74,52 @@ class FeatureSerializer(serializers.ModelSerializer):
 
 
 
-class PropertyImageSerializer(serializers.ModelSerializer):
+class PropertyImageSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Serializer for property images.
+
+    `variants` maps each generated size to its dimensions and WebP/JPEG URLs,
+    and `srcset` gives the same URLs as ready-made srcset strings per format.
+    Both are empty until the image has been processed.
+    """
     id = serializers.UUIDField(read_only=True)
     image = serializers.SerializerMethodField()
+    variants = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = PropertyImage
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'width', 'height', 'variants', 'srcset']
+        read_only_fields = ['width', 'height']
 
-    def get_image(self, obj):
+    def build_url(self, obj, name):
+        url = obj.image.storage.url(name)
         request = self.context.get('request', None)
         if request is not None:
-            return request.build_absolute_uri(obj.image.url)
-        return obj.image.url
+            return request.build_absolute_uri(url)
+        return url
+
+    def get_image(self, obj):
+        return self.build_url(obj, obj.image.name)
+
+    def get_variants(self, obj):
+        return {
+            size: {key: self.build_url(obj, value) if key in VARIANT_FORMATS else value
+                   for key, value in variant.items()}
+            for size, variant in obj.variants.items()
+        }
+
+    def get_srcset(self, obj):
+        return {
+            extension: ', '.join(
+                f"{self.build_url(obj, variant[extension])} {variant['width']}w"
+                for variant in obj.variants.values()
+            )
+            for extension in VARIANT_FORMATS
+        } if obj.variants else {}
 
 
-class AgentSerializer(serializers.ModelSerializer):
+class AgentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for the Agent model.
 
@@ -46,7 +128,7 @@ class AgentSerializer(serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
     user_id = serializers.PrimaryKeyRelatedField(source='user', read_only=True)
     username = serializers.CharField(source='user.username', read_only=True)
-    property_count = serializers.SerializerMethodField()
+    property_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Agent
@@ -56,14 +138,29 @@ class AgentSerializer(serializers.ModelSerializer):
             'years_of_experience', 'specialization', 'property_count'
         ]
 
-    def get_property_count(self, obj):
-        """
-        Get the number of properties associated with this agent.
-        """
-        return House.objects.filter(agent=obj).count()
 
+class ImageUploadSerializer(serializers.ModelSerializer):
+    """
+    Serializer for resumable image uploads. `image` is set once all bytes
+    have been received.
+    """
+    id = serializers.UUIDField(read_only=True)
+    house_id = serializers.PrimaryKeyRelatedField(queryset=House.objects.all(), source='house')
+    image = PropertyImageSerializer(read_only=True)
+
+    class Meta:
+        model = ImageUpload
+        fields = ['id', 'house_id', 'filename', 'length', 'offset', 'image', 'created_at']
+        read_only_fields = ['offset', 'image', 'created_at']
+
+    def validate_length(self, value):
+        max_size = settings.RESUMABLE_UPLOAD_MAX_SIZE
+        if not 0 < value <= max_size:
+            raise serializers.ValidationError(f"Length must be between 1 and {max_size} bytes.")
+        return value
 
-class HouseSerializer(serializers.ModelSerializer):
+
+class HouseSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
     property_type = PropertyTypeSerializer(read_only=True)
     property_type_id = serializers.PrimaryKeyRelatedField(
@@ -73,7 +170,7 @@ class HouseSerializer(serializers.ModelSerializer):
     ), source='features', many=True, write_only=True, required=False)
     images = PropertyImageSerializer(many=True, read_only=True)
     uploaded_images = serializers.ListField(
-        child=serializers.ImageField(max_length=1000000, allow_empty_file=False, use_url=False),
+        child=StreamedImageField(max_length=1000000, allow_empty_file=False, use_url=False),
         write_only=True,
         required=False
     )
@@ -83,18 +180,59 @@ class HouseSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = House
-        fields = ['id', 'title', 'description', 'price', 'address', 'location', 'property_status', 'bedrooms', 'bathrooms', 'area', 'property_type',
+        fields = ['id', 'title', 'description', 'price', 'address', 'location', 'latitude', 'longitude', 'coordinates_approximate', 'property_status', 'bedrooms', 'bathrooms', 'area', 'property_type',
                   'property_type_id', 'features', 'feature_ids', 'images', 'uploaded_images', 'agent', 'agent_id', 'created_by', 'created_at', 'updated_at', 'status']
-        read_only_fields = ['created_by', 'created_at', 'updated_at',
+        read_only_fields = ['created_by', 'created_at', 'updated_at', 'coordinates_approximate',
                             'images', 'features', 'property_type', 'agent']
 
     def create(self, validated_data):
         uploaded_images = validated_data.pop('uploaded_images', [])
         house = super().create(validated_data)
-        for image in uploaded_images:
-            PropertyImage.objects.create(house=house, image=image)
+        add_images(house, uploaded_images)
         return house
 
+    def get_prefetch_lookups(self):
+        return HouseQuerySet.listing_prefetches(set(self.fields))
+
+
+class HouseListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Compact serializer for listing cards.
+
+    Renders only what a property card shows, with the cover image as the sole
+    entry of `images`. The description, features and full agent profile can
+    be requested with `?expand=description,features,agent`.
+    """
+    id = serializers.UUIDField(read_only=True)
+    property_type = PropertyTypeSerializer(read_only=True)
+    images = serializers.SerializerMethodField()
+    features = FeatureSerializer(many=True, read_only=True)
+    agent = AgentSerializer(read_only=True)
+
+    class Meta:
+        model = House
+        fields = ['id', 'title', 'description', 'price', 'address', 'location', 'latitude', 'longitude',
+                  'coordinates_approximate', 'property_status', 'bedrooms', 'bathrooms', 'area', 'property_type', 'features', 'images', 'agent', 'agent_id', 'created_at',
+                  'status']
+        expandable_fields = ['description', 'features', 'agent']
+        read_only_fields = fields
+
+    def get_images(self, obj):
+        """
+        Return the cover image, using the prefetched `cover_images` when available.
+        """
+        images = getattr(obj, 'cover_images', None)
+        if images is None:
+            images = obj.images.all()[:1]
+        return PropertyImageSerializer(images, many=True, context=self.context).data
+
+    def get_prefetch_lookups(self):
+        fields = set(self.fields)
+        lookups = HouseQuerySet.listing_prefetches(fields - {'images'})
+        if 'images' in fields:
+            lookups.append(HouseQuerySet.cover_image_prefetch())
+        return lookups
+
 
 class UserProfileSerializer(serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
@@ -113,7 +251,7 @@ class UserSerializer(serializers.ModelSerializer):
                   'first_name', 'last_name', 'profile']
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
+class FavoriteSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
     house = HouseSerializer(read_only=True)
     house_id = serializers.PrimaryKeyRelatedField(
@@ -172,7 +310,7 @@ class RegisterSerializer(serializers.ModelSerializer):
         )
         return user
 
-class PropertyInquirySerializer(serializers.ModelSerializer):
+class PropertyInquirySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Serializer for the PropertyInquiry model.
 
@@ -200,13 +338,68 @@ class PropertyInquirySerializer(serializers.ModelSerializer):
         agent = obj.get_agent()
         return agent.name if agent else "No Agent"
 
+
+class InquiryInboxSerializer(serializers.ModelSerializer):
+    """
+    Compact representation of an inquiry for the agent inbox: the property
+    and tenant are reduced to their id and title or username, all read from
+    the single inbox query.
+    """
+    house_title = serializers.CharField(source='house.title', read_only=True)
+    tenant_username = serializers.CharField(source='tenant.username', read_only=True)
+
+    class Meta:
+        model = PropertyInquiry
+        fields = [
+            'id', 'house_id', 'house_title', 'tenant_id', 'tenant_username',
+            'message', 'response', 'status', 'created_at', 'updated_at',
+        ]
+        read_only_fields = fields
+
+
+class SavedSearchSerializer(serializers.ModelSerializer):
+    id = serializers.UUIDField(read_only=True)
+    property_type_id = serializers.PrimaryKeyRelatedField(
+        queryset=PropertyType.objects.all(), source='property_type', required=False, allow_null=True)
+    agent_id = serializers.PrimaryKeyRelatedField(
+        queryset=Agent.objects.all(), source='agent', required=False, allow_null=True)
+
+    class Meta:
+        model = SavedSearch
+        fields = [
+            'id', 'name', 'property_type_id', 'property_status', 'min_price', 'max_price',
+            'bedrooms', 'bathrooms', 'agent_id', 'created_at', 'updated_at',
+        ]
+        read_only_fields = ['created_at', 'updated_at']
+
+    def validate(self, attrs):
+        min_price = attrs.get('min_price', getattr(self.instance, 'min_price', None))
+        max_price = attrs.get('max_price', getattr(self.instance, 'max_price', None))
+        if min_price is not None and max_price is not None and min_price > max_price:
+            raise serializers.ValidationError({'max_price': 'Must not be lower than min_price.'})
+        return attrs
+
+
+class SavedSearchMatchSerializer(serializers.ModelSerializer):
+    """
+    Entry of the "new for you" feed: a listing card and the saved search it matched.
+    """
+    house = HouseListSerializer(read_only=True)
+
+    class Meta:
+        model = SavedSearchMatch
+        fields = ['id', 'search_id', 'house', 'created_at']
+        read_only_fields = fields
+
 # Custom token serializers for role-based authentication
 
 class AutoDetectRoleTokenObtainPairSerializer(TokenObtainPairSerializer):
     """
     Custom token serializer that automatically detects the user's role.
-    Adds the role to the token data.
+    Adds the role to the token data and, with the agent id, to the token claims.
     """
+    token_class = RoleRefreshToken
+
     def validate(self, attrs):
         # First validate credentials using the parent class
         data = super().validate(attrs)
@@ -223,6 +416,8 @@ class TenantTokenObtainPairSerializer(TokenObtainPairSerializer):
     Custom token serializer for tenants.
     Validates that the user has a 'tenant' role before issuing a token.
     """
+    token_class = RoleRefreshToken
+
     def validate(self, attrs):
         # First validate credentials using the parent class
         data = super().validate(attrs)
@@ -244,6 +439,8 @@ class AgentTokenObtainPairSerializer(TokenObtainPairSerializer):
     Custom token serializer for agents.
     Validates that the user has an 'agent' role before issuing a token.
     """
+    token_class = RoleRefreshToken
+
     def validate(self, attrs):
         # First validate credentials using the parent class
         data = super().validate(attrs)
@@ -260,4 +457,16 @@ class AgentTokenObtainPairSerializer(TokenObtainPairSerializer):
 
         return data
 
+class VersionedTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Token refresh serializer rejecting refresh tokens revoked by a role change.
+    """
+    token_class = RoleRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if ROLE_CLAIM in refresh:
+            check_token_version(refresh, token_version(refresh[api_settings.USER_ID_CLAIM]))
+        return super().validate(attrs)
+
 # Add other serializers as needed for additional models
@@ -0,0 +1,457 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import touch_listings
+from .geo import encode as geohash_encode
+from .geocoding import geocode_house
+from .engagement import record_engagement_on_commit
+from .events import publish_inquiry_events
+from .images import enqueue_images
+from .inquiries import adjust_inquiry_counts, reassign_inquiries
+from .authentication import invalidate_tokens
+from .models import (House, PropertyType, Feature, Agent, PropertyImage, ListingChange, UserProfile, Favorite, SimilarListing,
+                     PropertyInquiry)
+from .principals import invalidate_principals
+from .recommendations import invalidate_recommendations
+from .saved_searches import schedule_match
+from .similar import schedule_refresh
+from .search import FIELD_WEIGHTS, index_house
+from .suggest import expire_index, schedule_update
+from .blobs import adjust_blob_references, blob_names, update_blob_references
+from .sync import record_changes
+
+
+def adjust_property_count(model, pks, delta):
+    """
+    Add `delta` to the property_count of the given rows with a single UPDATE.
+
+    Decrements never take a counter below zero; any drift this hides is
+    repaired by the `recount_properties` management command. Models with an
+    `updated_at` field have it bumped too, since the count is part of their
+    representation and of its ETag.
+    """
+    pks = [pk for pk in pks if pk is not None]
+    if not pks or not delta:
+        return
+    queryset = model.objects.filter(pk__in=pks)
+    if delta < 0:
+        queryset = queryset.filter(property_count__gte=-delta)
+    changes = {'property_count': F('property_count') + delta}
+    if any(field.name == 'updated_at' for field in model._meta.concrete_fields):
+        changes['updated_at'] = timezone.now()
+    queryset.update(**changes)
+
+
+@receiver(pre_save, sender=House)
+def remember_house_counter_keys(sender, instance, raw=False, **kwargs):
+    """
+    Remember the agent and property type a house had before this save, so
+    post_save can move it between counters when either changes, and its
+    address, location and coordinates, so it can be geocoded again.
+    """
+    instance._previous_counter_keys = instance._previous_position = None
+    if raw or instance._state.adding:
+        return
+    previous = (
+        House.objects.filter(pk=instance.pk)
+        .values_list('agent_id', 'property_type_id', 'address', 'location', 'latitude', 'longitude').first()
+    )
+    if previous is not None:
+        instance._previous_counter_keys, instance._previous_position = previous[:2], previous[2:]
+
+
+@receiver(pre_save, sender=House)
+def locate_house(sender, instance, raw=False, **kwargs):
+    """
+    Geocode houses saved without coordinates, or whose address or location
+    changed while their coordinates were not, and keep the geohash in step
+    with the coordinates. Coordinates set explicitly are never approximate.
+    """
+    previous = getattr(instance, '_previous_position', None)
+    position = (instance.latitude, instance.longitude)
+    if not raw:
+        if None not in position and position != getattr(instance, '_geocoded_position', None) \
+                and (previous is None or position != tuple(previous[2:])):
+            instance.coordinates_approximate = False
+        elif previous is not None and (instance.address, instance.location) != tuple(previous[:2]):
+            # The old coordinates belong to the old address.
+            instance.latitude = instance.longitude = None
+
+    missing = instance.latitude is None or instance.longitude is None
+    if missing and not raw:
+        instance.coordinates_approximate = False
+        if getattr(settings, 'GEOCODE_ON_SAVE', True):
+            missing = not geocode_house(instance)
+    instance.geohash = '' if missing else geohash_encode(instance.latitude, instance.longitude)
+
+
+@receiver(post_save, sender=House)
+def update_house_counters(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+
+    previous = getattr(instance, '_previous_counter_keys', None)
+    if created or previous is None:
+        adjust_property_count(Agent, [instance.agent_id], 1)
+        adjust_property_count(PropertyType, [instance.property_type_id], 1)
+        return
+
+    old_agent_id, old_property_type_id = previous
+    if old_agent_id != instance.agent_id:
+        adjust_property_count(Agent, [old_agent_id], -1)
+        adjust_property_count(Agent, [instance.agent_id], 1)
+        reassign_inquiries(instance.pk, old_agent_id, instance.agent_id)
+    if old_property_type_id != instance.property_type_id:
+        adjust_property_count(PropertyType, [old_property_type_id], -1)
+        adjust_property_count(PropertyType, [instance.property_type_id], 1)
+
+
+@receiver(post_save, sender=House)
+def update_search_index(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Re-index the searchable text of a house, unless the save only touched
+    fields that are not searched.
+    """
+    if raw:
+        return
+    if update_fields is not None and not set(update_fields) & set(FIELD_WEIGHTS):
+        return
+    index_house(instance)
+
+
+@receiver(pre_delete, sender=House)
+def remember_house_features(sender, instance, **kwargs):
+    """
+    Feature links are removed by cascade, which does not send m2m_changed,
+    so capture them before the house goes away.
+    """
+    instance._feature_ids = list(instance.features.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=House)
+def release_house_counters(sender, instance, **kwargs):
+    adjust_property_count(Agent, [instance.agent_id], -1)
+    adjust_property_count(PropertyType, [instance.property_type_id], -1)
+    adjust_property_count(Feature, getattr(instance, '_feature_ids', []), -1)
+
+
+@receiver(m2m_changed, sender=House.features.through)
+def update_feature_counters(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keep Feature.property_count in step with House.features, from either side
+    of the relation. Only links that actually exist are counted on removal.
+    """
+    own_field, other_field = ('feature_id', 'house_id') if reverse else ('house_id', 'feature_id')
+
+    if action in ('pre_remove', 'pre_clear'):
+        links = sender.objects.filter(**{own_field: instance.pk})
+        if action == 'pre_remove':
+            links = links.filter(**{f'{other_field}__in': pk_set})
+        instance._removed_link_ids = list(links.values_list(other_field, flat=True))
+        return
+
+    if action == 'post_add':
+        linked, delta = pk_set or set(), 1
+    elif action in ('post_remove', 'post_clear'):
+        linked, delta = getattr(instance, '_removed_link_ids', []), -1
+    else:
+        return
+
+    if reverse:
+        adjust_property_count(Feature, [instance.pk], delta * len(linked))
+    else:
+        adjust_property_count(Feature, linked, delta)
+
+
+@receiver(post_save, sender=House)
+def record_house_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record_changes([instance.pk])
+
+
+@receiver(post_delete, sender=House)
+def record_house_deletion(sender, instance, **kwargs):
+    record_changes([instance.pk], ListingChange.DELETE)
+
+
+@receiver(post_save, sender=PropertyImage)
+def queue_image_processing(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """
+    Queue variant generation for new images and for full saves, which may
+    have replaced the file. The pipeline itself saves with update_fields.
+    """
+    if not raw and (created or update_fields is None):
+        enqueue_images([instance])
+
+
+@receiver(pre_save, sender=PropertyImage)
+def remember_image_blobs(sender, instance, raw=False, **kwargs):
+    instance._previous_blob_names = []
+    if raw or instance._state.adding:
+        return
+    previous = PropertyImage.objects.filter(pk=instance.pk).only('image', 'variants').first()
+    if previous is not None:
+        instance._previous_blob_names = blob_names(previous)
+
+
+@receiver(post_save, sender=PropertyImage)
+def update_image_blob_references(sender, instance, raw=False, **kwargs):
+    if not raw:
+        update_blob_references(getattr(instance, '_previous_blob_names', []), blob_names(instance))
+
+
+@receiver(post_delete, sender=PropertyImage)
+def release_image_blobs(sender, instance, **kwargs):
+    adjust_blob_references(blob_names(instance), -1)
+
+
+# Listing fragment cache invalidation. Cached fragments are keyed on
+# House.updated_at, so anything rendered as part of a house bumps it. The
+# agent is cached on its own, keyed on Agent.updated_at.
+
+@receiver(post_save, sender=PropertyImage)
+@receiver(post_delete, sender=PropertyImage)
+def touch_image_listing(sender, instance, raw=False, **kwargs):
+    if not raw:
+        touch_listings(House.objects.filter(pk=instance.house_id))
+
+
+@receiver(m2m_changed, sender=House.features.through)
+def touch_feature_listings(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        house_ids = [instance.pk]
+    elif action == 'post_add':
+        house_ids = pk_set or []
+    else:
+        # Captured by update_feature_counters before the links were removed.
+        house_ids = getattr(instance, '_removed_link_ids', [])
+    if house_ids:
+        touch_listings(House.objects.filter(pk__in=house_ids))
+
+
+@receiver(post_save, sender=Feature)
+@receiver(pre_delete, sender=Feature)
+def touch_listings_with_feature(sender, instance, raw=False, **kwargs):
+    if not raw:
+        touch_listings(House.objects.filter(features=instance))
+
+
+@receiver(post_save, sender=PropertyType)
+@receiver(pre_delete, sender=PropertyType)
+def touch_listings_of_type(sender, instance, raw=False, **kwargs):
+    if not raw:
+        touch_listings(House.objects.filter(property_type=instance))
+
+
+@receiver(pre_delete, sender=Agent)
+def touch_listings_of_agent(sender, instance, **kwargs):
+    """
+    The agent's listings lose their agent.
+    """
+    touch_listings(House.objects.filter(agent=instance))
+
+
+@receiver(post_save, sender=User)
+def touch_agent_of_user(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    The agent's username is rendered with the agent. Logins only update
+    last_login and are ignored.
+    """
+    if raw or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    Agent.objects.filter(user=instance).update(updated_at=timezone.now())
+
+
+@receiver(pre_save, sender=UserProfile)
+def remember_profile_role(sender, instance, raw=False, **kwargs):
+    instance._previous_role = None
+    if raw or instance._state.adding:
+        return
+    instance._previous_role = UserProfile.objects.filter(pk=instance.pk).values_list('role', flat=True).first()
+
+
+@receiver(post_save, sender=UserProfile)
+def revoke_tokens_on_role_change(sender, instance, raw=False, **kwargs):
+    """
+    Tokens carry the role they were issued for; revoke them when it changes.
+    """
+    previous = getattr(instance, '_previous_role', None)
+    if raw or previous is None or previous == instance.role:
+        return
+    invalidate_tokens([instance.user_id])
+    # Keep a later full save of this instance from writing the old version back.
+    instance.refresh_from_db(fields=['token_version'])
+
+
+@receiver(pre_save, sender=User)
+def remember_user_active(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._was_active = None
+    if raw or instance._state.adding or (update_fields is not None and 'is_active' not in update_fields):
+        return
+    instance._was_active = User.objects.filter(pk=instance.pk).values_list('is_active', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def revoke_tokens_on_deactivation(sender, instance, raw=False, **kwargs):
+    if not raw and getattr(instance, '_was_active', None) and not instance.is_active:
+        invalidate_tokens([instance.pk])
+
+
+@receiver(post_delete, sender=Agent)
+def revoke_tokens_of_agent(sender, instance, **kwargs):
+    """
+    Tokens of the agent's user carry the deleted agent id.
+    """
+    invalidate_tokens([instance.user_id])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_user_principal(sender, instance, raw=False, **kwargs):
+    invalidate_principals([instance.pk])
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_save, sender=Agent)
+@receiver(post_delete, sender=Agent)
+def drop_cached_principal(sender, instance, raw=False, **kwargs):
+    """
+    Cached principals include the role, token version and agent id.
+    """
+    invalidate_principals([instance.user_id])
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def drop_cached_recommendations(sender, instance, raw=False, **kwargs):
+    invalidate_recommendations(instance.user_id)
+
+
+@receiver(post_save, sender=House)
+def refresh_similar_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_refresh([instance.pk])
+
+
+@receiver(pre_delete, sender=House)
+def refresh_similar_on_delete(sender, instance, **kwargs):
+    """
+    Lists containing the house lose it by cascade; refill them.
+    """
+    schedule_refresh(SimilarListing.objects.filter(similar=instance).values_list('house_id', flat=True))
+
+
+@receiver(m2m_changed, sender=House.features.through)
+def refresh_similar_on_features(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        schedule_refresh([instance.pk])
+    elif action == 'post_add':
+        schedule_refresh(pk_set or [])
+    else:
+        schedule_refresh(getattr(instance, '_removed_link_ids', []))
+
+
+@receiver(post_save, sender=House)
+def update_suggestions_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_update(upserts=[instance.pk])
+
+
+@receiver(post_delete, sender=House)
+def update_suggestions_on_delete(sender, instance, **kwargs):
+    schedule_update(deletes=[instance.pk])
+
+
+@receiver(post_save, sender=PropertyType)
+@receiver(post_delete, sender=PropertyType)
+def expire_suggestions(sender, instance, raw=False, **kwargs):
+    """
+    Property type names are completed too; renaming or deleting one
+    rebuilds the index.
+    """
+    if not raw:
+        transaction.on_commit(expire_index)
+
+
+@receiver(pre_save, sender=PropertyInquiry)
+def assign_inquiry_agent(sender, instance, raw=False, **kwargs):
+    """
+    Copy the agent of the property onto new inquiries and those moved to
+    another property, and remember the status and agent an inquiry had so
+    post_save can move it between counters.
+    """
+    instance._previous_inbox_keys = None
+    if raw:
+        return
+    if instance._state.adding:
+        instance.agent_id = instance.house.agent_id
+        return
+    previous = PropertyInquiry.objects.filter(pk=instance.pk).values_list('status', 'agent_id', 'house_id').first()
+    if previous is None:
+        return
+    instance._previous_inbox_keys = previous[:2]
+    if previous[2] != instance.house_id:
+        instance.agent_id = instance.house.agent_id
+
+
+@receiver(post_save, sender=PropertyInquiry)
+def update_inquiry_counters(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    current = (instance.status, instance.agent_id)
+    previous = getattr(instance, '_previous_inbox_keys', None)
+    if created or previous is None:
+        adjust_inquiry_counts({(instance.agent_id, instance.status): 1})
+    elif previous != current:
+        adjust_inquiry_counts({(previous[1], previous[0]): -1, (instance.agent_id, instance.status): 1})
+
+
+@receiver(post_save, sender=PropertyInquiry)
+def publish_inquiry_change(sender, instance, created, raw=False, **kwargs):
+    """
+    Notify the agent and tenant: "inquiry.created", "inquiry.<status>" when
+    the status changed, "inquiry.updated" otherwise.
+    """
+    if raw:
+        return
+    previous = getattr(instance, '_previous_inbox_keys', None)
+    if created:
+        kind = 'inquiry.created'
+    elif previous is not None and previous[0] != instance.status:
+        kind = f'inquiry.{instance.status}'
+    else:
+        kind = 'inquiry.updated'
+    publish_inquiry_events([
+        (kind, instance.pk, instance.house_id, instance.status, instance.agent_id, instance.tenant_id),
+    ])
+
+
+@receiver(post_delete, sender=PropertyInquiry)
+def release_inquiry_counters(sender, instance, **kwargs):
+    adjust_inquiry_counts({(instance.agent_id, instance.status): -1})
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=PropertyInquiry)
+def record_listing_engagement(sender, instance, created, raw=False, **kwargs):
+    """
+    Count new favorites and inquiries towards the listing's popularity.
+    """
+    if created and not raw:
+        record_engagement_on_commit(instance.house_id, 'favorite' if sender is Favorite else 'inquiry')
+
+
+@receiver(post_save, sender=House)
+def match_saved_searches(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_match([instance.pk])
@@ -0,0 +1,190 @@
+"""
+Precomputed "similar listings".
+
+Each house's nearest neighbours, by cosine similarity of the vectors used
+for recommendations (see realestate.recommendations), are stored in
+SimilarListing, so showing them is one indexed join on (house, rank).
+
+Neighbours are computed in batches of matrix products over the listing
+matrix. Changing a house only queues it (a SimilarListingRefresh row) in
+the writer's transaction; `manage.py refresh_similar_listings`, run from
+cron, drains the queue and recomputes the lists that may be affected: the
+changed houses' own, those that contained a changed house, and those of
+the closest houses whose current last neighbour is further away than a
+changed house now is. `manage.py rebuild_similar_listings` recomputes every
+list.
+"""
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .models import House, SimilarListing, SimilarListingRefresh
+from .recommendations import HouseVectorIndex, get_index
+
+BATCH_SIZE = 128
+
+# Houses closest to a changed house whose lists are checked for it.
+CANDIDATES = 200
+
+# Queued houses refreshed together.
+REFRESH_BATCH_SIZE = 500
+
+
+def neighbour_count():
+    return getattr(settings, 'SIMILAR_LISTINGS_COUNT', 10)
+
+
+def nearest_neighbours(index, house_ids, k, batch_size=BATCH_SIZE):
+    """
+    Yield (house_id, [(neighbour_id, score), ...]) for the given houses,
+    closest first, scoring them against every live row in batches.
+    """
+    size = index.size
+    matrix = index.matrix[:size]
+    dead = ~index.live[:size]
+    k = min(k, int(index.live[:size].sum()) - 1)
+    rows = [index.rows[pk] for pk in house_ids if pk in index.rows]
+    for start in range(0, len(rows), batch_size):
+        chunk = np.array(rows[start:start + batch_size])
+        scores = matrix[chunk] @ matrix.T
+        scores[:, dead] = -np.inf
+        scores[np.arange(len(chunk)), chunk] = -np.inf
+        if k <= 0:
+            for row in chunk:
+                yield index.ids[row], []
+            continue
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        for row, neighbours, neighbour_scores in zip(chunk, top, top_scores):
+            yield index.ids[row], [(index.ids[n], float(score)) for n, score in zip(neighbours, neighbour_scores)]
+
+
+def store_neighbours(results, replace=True):
+    """
+    Write the neighbour lists, replacing the stored lists of those houses.
+
+    Replacing locks the houses first, in primary key order, so refreshes of
+    the same lists running at once take turns instead of colliding on
+    (house, rank) or deadlocking; the last one wins. Houses deleted in the
+    meantime are skipped.
+    """
+    results = list(results)
+    with transaction.atomic():
+        if replace:
+            existing = set(
+                House.objects.select_for_update().filter(pk__in=[house_id for house_id, _ in results])
+                .order_by('pk').values_list('pk', flat=True))
+            results = [(house_id, neighbours) for house_id, neighbours in results if house_id in existing]
+            SimilarListing.objects.filter(house_id__in=existing).delete()
+        SimilarListing.objects.bulk_create([
+            SimilarListing(house_id=house_id, similar_id=similar_id, rank=rank, score=score)
+            for house_id, neighbours in results
+            for rank, (similar_id, score) in enumerate(neighbours)
+        ], batch_size=1000)
+    return len(results)
+
+
+def affected_houses(index, house_ids, k):
+    """
+    Return the houses whose neighbour lists may change when the given
+    houses change.
+    """
+    affected = set(house_ids)
+    affected.update(SimilarListing.objects.filter(similar_id__in=house_ids).values_list('house_id', flat=True))
+
+    size = index.size
+    candidates = {}
+    for pk in house_ids:
+        row = index.rows.get(pk)
+        if row is None:
+            continue
+        scores = index.matrix[:size] @ index.matrix[row]
+        scores[~index.live[:size]] = -np.inf
+        scores[row] = -np.inf
+        count = min(CANDIDATES, size)
+        for n in np.argpartition(-scores, count - 1)[:count]:
+            if np.isfinite(scores[n]):
+                house_id = index.ids[n]
+                candidates[house_id] = max(candidates.get(house_id, -np.inf), float(scores[n]))
+    if candidates:
+        # Score of each candidate's current last neighbour, one indexed lookup per list.
+        thresholds = dict(
+            SimilarListing.objects.filter(house_id__in=list(candidates), rank=k - 1).values_list('house_id', 'score')
+        )
+        affected.update(pk for pk, score in candidates.items() if pk not in thresholds or score > thresholds[pk])
+    return affected
+
+
+def refresh_similar_listings(house_ids):
+    """
+    Recompute the neighbour lists affected by changes to the given houses.
+    """
+    house_ids = list(house_ids)
+    if not house_ids:
+        return 0
+    index = get_index()
+    k = neighbour_count()
+    with index.lock:
+        affected = affected_houses(index, house_ids, k)
+        results = list(nearest_neighbours(index, [pk for pk in affected if pk in index.rows], k))
+    return store_neighbours(results)
+
+
+def schedule_refresh(house_ids):
+    """
+    Queue the given houses for `refresh_queued_listings`, with a single
+    INSERT in the current transaction. Houses already queued stay queued.
+    """
+    house_ids = [pk for pk in house_ids if pk is not None]
+    if house_ids and getattr(settings, 'SIMILAR_LISTINGS_AUTO_REFRESH', True):
+        SimilarListingRefresh.objects.bulk_create(
+            [SimilarListingRefresh(house_id=pk) for pk in house_ids], ignore_conflicts=True)
+
+
+def refresh_queued_listings(batch_size=REFRESH_BATCH_SIZE):
+    """
+    Drain the refresh queue, oldest first, `batch_size` houses at a time.
+    Returns the number of houses taken off the queue.
+
+    Houses are dequeued before their lists are computed, so a house changed
+    during a refresh is queued again and picked up by the next run.
+    """
+    total = 0
+    while True:
+        house_ids = list(
+            SimilarListingRefresh.objects.order_by('pk').values_list('house_id', flat=True)[:batch_size])
+        if not house_ids:
+            return total
+        SimilarListingRefresh.objects.filter(house_id__in=house_ids).delete()
+        try:
+            refresh_similar_listings(house_ids)
+        except Exception:
+            SimilarListingRefresh.objects.bulk_create(
+                [SimilarListingRefresh(house_id=pk) for pk in house_ids], ignore_conflicts=True)
+            raise
+        total += len(house_ids)
+
+
+def rebuild_similar_listings(batch_size=BATCH_SIZE):
+    """
+    Recompute every neighbour list from a freshly loaded listing matrix.
+    Returns the number of houses processed.
+    """
+    index = HouseVectorIndex()
+    index.rebuild()
+    with transaction.atomic():
+        SimilarListingRefresh.objects.all().delete()
+        SimilarListing.objects.all().delete()
+        return store_neighbours(
+            nearest_neighbours(index, list(index.rows), neighbour_count(), batch_size), replace=False)
+
+
+def similar_houses(house_id, limit=None):
+    """
+    Return the stored neighbours of a house, closest first, in one query.
+    """
+    houses = House.objects.filter(similar_to__house_id=house_id).order_by('similar_to__rank')
+    return houses[:limit] if limit else houses
@@ -0,0 +1,86 @@
+"""
+Content-addressed storage for property images.
+
+Files are named after the SHA-256 digest of their content, so the same photo
+uploaded to several listings (or uploaded again when a listing is edited) is
+written to disk once, and a second upload of known content skips the write
+entirely. Because a name always refers to the same bytes, blob URLs never
+go stale and can be cached forever. Images are stripped of their EXIF and
+XMP metadata, losslessly (see realestate.metadata), before they are hashed,
+so no file carrying a camera serial number or GPS position is ever written
+or served.
+
+Each stored file has an ImageBlob row whose ref_count tracks how many
+property images use it (see realestate.blobs). Blobs are shared, so they are
+never deleted when an image goes away; the `collect_image_blobs` management
+command removes the ones nothing refers to.
+"""
+import hashlib
+import os
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+
+from .metadata import strip_metadata
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def content_digest(content):
+    """
+    Return the hex SHA-256 digest and size of a file, reading it in chunks.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    content.seek(0)
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+    content.seek(0)
+    return digest.hexdigest(), size
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage saving each unique file once, under its digest.
+    """
+    content_addressed = True
+    prefix = 'property_images'
+
+    def _save(self, name, content):
+        stripped = strip_metadata(content)
+        if stripped is None:
+            return self.save_blob(name, content)
+        with stripped:
+            return self.save_blob(name, stripped)
+
+    def save_blob(self, name, content):
+        # Looked up lazily: this storage is created while the models module loads.
+        ImageBlob = apps.get_model('realestate', 'ImageBlob')
+        digest, size = content_digest(content)
+        blob = ImageBlob.objects.filter(digest=digest).first()
+        if blob is not None and self.exists(blob.name):
+            # Restart the grace period of an unreferenced blob being reused.
+            ImageBlob.objects.filter(digest=digest, ref_count=0).update(stored_at=timezone.now())
+            return blob.name
+
+        extension = os.path.splitext(name)[1].lower()
+        blob_name = f'{self.prefix}/{digest[:2]}/{digest}{extension}'
+        if not self.exists(blob_name):
+            blob_name = super()._save(blob_name, content)
+        if blob is None:
+            blob, _ = ImageBlob.objects.get_or_create(digest=digest, defaults={'name': blob_name, 'size': size})
+            return blob.name
+        # The file had gone missing and was written again.
+        ImageBlob.objects.filter(digest=digest).update(name=blob_name)
+        return blob_name
+
+    def delete(self, name):
+        """
+        Blobs may be shared between images, so deleting a name is a no-op.
+        Unreferenced blobs are removed with purge() by collect_image_blobs.
+        """
+
+    def purge(self, name):
+        super().delete(name)
@@ -0,0 +1,329 @@
+"""
+Search box autocomplete.
+
+Completions come from the distinct locations, addresses and property type
+names of the listings, each weighted by the number of listings carrying it.
+They are held per process in a sorted array of (key, entry) pairs, one key
+for every word an entry's text starts at, so "ju" completes both "Juba" and
+"Munuki, Juba". A lookup is two bisections and a scan of the matching slice,
+a fraction of a millisecond, and costs no database query.
+
+Saves and deletes update the index of the process handling them once the
+transaction commits. Other processes apply the ListingChange log (see
+realestate.sync) at most every SUGGEST_INDEX_SYNC_INTERVAL seconds, and
+every index is rebuilt from scratch every SUGGEST_INDEX_MAX_AGE seconds,
+off the lock: lookups keep using the old contents until the new ones are
+swapped in.
+"""
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import House, ListingChange
+from .search import prefix_upper_bound
+from .sync import stable_change_id
+
+KINDS = ('location', 'address', 'property_type')
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Words of an entry it can be completed from.
+MAX_KEY_WORDS = 6
+
+MAX_QUERY_LENGTH = 64
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+
+# Prefixes matching more keys than this keep a table of their best entries,
+# with a margin over MAX_LIMIT for entries whose counts drop later.
+SCAN_LIMIT = 256
+HOT_CANDIDATES = 64
+
+HOUSE_FIELDS = ('id', 'location', 'address', 'property_type__name')
+
+
+def normalize(text):
+    """
+    Return the lowercase words of a text joined by single spaces.
+    """
+    return ' '.join(WORD_RE.findall((text or '').lower()))
+
+
+def house_entries(row):
+    """
+    Return {(kind, normalized text): display text} for a HOUSE_FIELDS row.
+    """
+    entries = {}
+    for kind, text in zip(KINDS, row[1:]):
+        key = normalize(text)
+        if key:
+            entries[(kind, key)] = ' '.join(text.split())
+    return entries
+
+
+def entry_keys(entry):
+    """
+    Return the lookup keys of an entry: its text from each of its first
+    MAX_KEY_WORDS words on.
+    """
+    words = entry[1].split(' ')
+    return [' '.join(words[i:]) for i in range(min(len(words), MAX_KEY_WORDS))]
+
+
+def load_rows(house_ids=None):
+    houses = House.objects.all()
+    if house_ids is not None:
+        houses = houses.filter(pk__in=house_ids)
+    return houses.values_list(*HOUSE_FIELDS)
+
+
+class SuggestionIndex:
+    """
+    Sorted array of completion keys with per-entry listing counts.
+
+    Prefixes matching more than SCAN_LIMIT keys, such as the first letters
+    of a word most addresses contain, are "hot": the first lookup scans
+    them once and keeps their best HOT_CANDIDATES entries, so such a lookup
+    ranks a few dozen candidates instead of scanning thousands of keys
+    again. New entries are added to those tables in place; removing an
+    entry drops the tables holding it, to be rescanned on the next lookup.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        # Held while rebuilding, so only one thread loads the houses.
+        self.build_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.keys = []
+        self.counts = Counter()
+        self.display = {}
+        self.houses = {}
+        self.hot = {}
+        self.change_id = 0
+        self.built_at = 0.0
+        self.synced_at = 0.0
+
+    def hot_prefixes(self, entry):
+        """
+        Return the hot prefixes an entry matches.
+        """
+        if not self.hot:
+            return []
+        prefixes = {key[:end] for key in entry_keys(entry) for end in range(1, len(key) + 1)}
+        return [prefix for prefix in prefixes if prefix in self.hot]
+
+    def add(self, entry, display):
+        self.counts[entry] += 1
+        if self.counts[entry] == 1:
+            self.display[entry] = display
+            for key in entry_keys(entry):
+                insort(self.keys, (key, entry))
+        for prefix in self.hot_prefixes(entry):
+            candidates = self.hot[prefix]
+            if entry in candidates:
+                continue
+            if len(candidates) < HOT_CANDIDATES:
+                candidates.add(entry)
+                continue
+            weakest = min(candidates, key=self.rank)
+            if self.rank(entry) < self.rank(weakest):
+                candidates.discard(weakest)
+                candidates.add(entry)
+
+    def discard(self, entry):
+        self.counts[entry] -= 1
+        if self.counts[entry] > 0:
+            return
+        del self.counts[entry]
+        del self.display[entry]
+        for key in entry_keys(entry):
+            position = bisect_left(self.keys, (key, entry))
+            if position < len(self.keys) and self.keys[position] == (key, entry):
+                del self.keys[position]
+        # The next best entries were left out of the table; scan again.
+        for prefix in self.hot_prefixes(entry):
+            del self.hot[prefix]
+
+    def rank(self, entry):
+        return -self.counts[entry], len(entry[1]), entry
+
+    def upsert(self, row):
+        """
+        Count a house under its current entries, replacing its previous ones.
+        """
+        entries = house_entries(row)
+        with self.lock:
+            previous = self.houses.get(row[0], ())
+            for entry in previous:
+                if entry not in entries:
+                    self.discard(entry)
+            for entry, display in entries.items():
+                if entry not in previous:
+                    self.add(entry, display)
+            self.houses[row[0]] = tuple(entries)
+
+    def remove(self, house_id):
+        with self.lock:
+            for entry in self.houses.pop(house_id, ()):
+                self.discard(entry)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def candidates(self, prefix):
+        """
+        Return the entries with a key starting with prefix, or the best of
+        them for hot prefixes.
+        """
+        candidates = self.hot.get(prefix)
+        if candidates is not None:
+            return candidates
+        start = bisect_left(self.keys, (prefix,))
+        end = bisect_left(self.keys, (prefix_upper_bound(prefix),), start)
+        entries = {entry for _, entry in self.keys[start:end]}
+        if end - start > SCAN_LIMIT:
+            entries = set(heapq.nsmallest(HOT_CANDIDATES, entries, key=self.rank))
+            self.hot[prefix] = entries
+        return entries
+
+    def suggest(self, query, limit=DEFAULT_LIMIT):
+        """
+        Return up to `limit` completions of a query, the most common first,
+        as {'text', 'kind', 'count'} dicts.
+        """
+        prefix = normalize(query[:MAX_QUERY_LENGTH])
+        if query[-1:].isspace() and prefix:
+            prefix += ' '
+        if not prefix:
+            return []
+        with self.lock:
+            best = heapq.nsmallest(limit, self.candidates(prefix), key=self.rank)
+            return [
+                {'text': self.display[entry], 'kind': entry[0], 'count': self.counts[entry]}
+                for entry in best
+            ]
+
+    def rebuild(self):
+        """
+        Load every house, replacing the current contents. The houses are
+        loaded and sorted without holding the lock, which is only taken to
+        swap the new contents in.
+        """
+        # Read the log position first: changes made while loading are applied again later.
+        change_id = stable_change_id()
+        houses, counts, display = {}, Counter(), {}
+        for row in load_rows():
+            entries = house_entries(row)
+            houses[row[0]] = tuple(entries)
+            for entry, text in entries.items():
+                counts[entry] += 1
+                display.setdefault(entry, text)
+        # One sort instead of an insertion per key.
+        keys = sorted((key, entry) for entry in counts for key in entry_keys(entry))
+        with self.lock:
+            self.reset()
+            self.keys, self.counts, self.display, self.houses = keys, counts, display, houses
+            self.change_id = change_id
+            self.built_at = self.synced_at = time.monotonic()
+
+    def sync(self):
+        """
+        Rebuild when too old, otherwise apply the listing changes recorded
+        since the last sync, checking the log at most every
+        SUGGEST_INDEX_SYNC_INTERVAL seconds. While one thread rebuilds an
+        old index the others keep using it; only an index that was never
+        built makes them wait.
+        """
+        now = time.monotonic()
+        built_at = self.built_at
+        if not built_at or now - built_at > getattr(settings, 'SUGGEST_INDEX_MAX_AGE', 3600):
+            if self.build_lock.acquire(blocking=not built_at):
+                try:
+                    # Another thread may have rebuilt it while this one waited.
+                    if self.built_at == built_at:
+                        self.rebuild()
+                finally:
+                    self.build_lock.release()
+            return
+        with self.lock:
+            if now - self.synced_at < getattr(settings, 'SUGGEST_INDEX_SYNC_INTERVAL', 10):
+                return
+            self.synced_at = now
+            changes = list(
+                ListingChange.objects.filter(pk__gt=self.change_id).order_by('pk')
+                .values_list('pk', 'house_id', 'action')
+            )
+            if not changes:
+                return
+            self.apply(
+                [house_id for _, house_id, action in changes if action == ListingChange.UPSERT],
+                [house_id for _, house_id, action in changes if action == ListingChange.DELETE])
+            # Stop at the first young change, which is applied again next time.
+            self.change_id = max(self.change_id, min(changes[-1][0], stable_change_id()))
+
+    def apply(self, upserts, deletes=()):
+        """
+        Bring the given houses up to date with one query.
+        """
+        rows = {row[0]: row for row in load_rows(upserts)} if upserts else {}
+        with self.lock:
+            for house_id in set(upserts) | set(deletes):
+                if house_id in rows:
+                    self.upsert(rows[house_id])
+                else:
+                    self.remove(house_id)
+
+
+_index = SuggestionIndex()
+
+
+def get_index():
+    """
+    Return this process's suggestion index, brought up to date.
+    """
+    _index.sync()
+    return _index
+
+
+def reset_index():
+    """
+    Drop the in-process index; it is rebuilt on next use.
+    """
+    global _index
+    _index = SuggestionIndex()
+
+
+def suggest(query, limit=DEFAULT_LIMIT):
+    return get_index().suggest(query, limit)
+
+
+def schedule_update(upserts=(), deletes=()):
+    """
+    Apply changes to houses to this process's index once the current
+    transaction commits. An index that has not been built yet is left alone.
+    """
+    upserts, deletes = list(upserts), list(deletes)
+    if not upserts and not deletes:
+        return
+
+    def update():
+        index = _index
+        if index.built_at:
+            index.apply(upserts, deletes)
+
+    transaction.on_commit(update)
+
+
+def expire_index():
+    """
+    Rebuild this process's index on next use, e.g. after a property type is renamed.
+    """
+    _index.built_at = 0.0
@@ -0,0 +1,165 @@
+"""
+Delta sync for property listings.
+
+Every change to a listing is recorded in ListingChange, replacing the
+previous entry for the same house, so the log stays roughly the size of the
+listings table. Clients read the log in id order from the last sync token
+they received and get back the listings that were created or updated plus
+the ids of the ones that were deleted.
+
+A sync token carries the last change id the client has seen and the time
+its sync started. Tombstones are only purged once they are older than the
+retention period, and tokens older than that are rejected with 410 Gone, so
+a client holding a valid token can never miss a deletion.
+
+Change ids are assigned inside the writer's transaction, so a change can
+commit after one with a higher id has already been read. Ids are only
+trusted once LISTING_CHANGES_COMMIT_LAG seconds old (see stable_change_id):
+readers still get younger changes, but their position does not move past
+the first young one, so those changes are read again until they are old
+enough for any earlier transaction to have committed.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound
+
+from .models import House, ListingChange
+
+
+class SyncTokenExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = 'Sync token expired, fetch all listings again without a token.'
+    default_code = 'sync_token_expired'
+
+
+def retention_cutoff(now=None):
+    """
+    Return the time before which tombstones may be purged.
+    """
+    days = getattr(settings, 'LISTING_CHANGES_RETENTION_DAYS', 30)
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def record_changes(house_ids, action=ListingChange.UPSERT):
+    """
+    Record a change for each of the given houses, replacing their previous entries.
+    """
+    house_ids = list(dict.fromkeys(pk for pk in house_ids if pk is not None))
+    if not house_ids:
+        return
+    for attempt in range(3):
+        try:
+            with transaction.atomic():
+                ListingChange.objects.filter(house_id__in=house_ids).delete()
+                ListingChange.objects.bulk_create([ListingChange(house_id=pk, action=action) for pk in house_ids])
+            return
+        except IntegrityError:
+            # A concurrent writer recorded one of the houses in between.
+            if attempt == 2:
+                raise
+
+
+def stable_change_id(now=None):
+    """
+    Return the highest change id below which every change is at least
+    LISTING_CHANGES_COMMIT_LAG seconds old, and so committed.
+    """
+    cutoff = (now or timezone.now()) - timedelta(seconds=getattr(settings, 'LISTING_CHANGES_COMMIT_LAG', 10))
+    first_young = ListingChange.objects.filter(changed_at__gt=cutoff).aggregate(first=Min('pk'))['first']
+    if first_young is not None:
+        return first_young - 1
+    return ListingChange.objects.aggregate(last=Max('pk'))['last'] or 0
+
+
+def encode_token(change_id, started_at):
+    payload = {'c': change_id, 't': int(started_at.timestamp())}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('ascii')).decode('ascii')
+
+
+def decode_token(token):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('ascii'))
+        change_id = int(payload['c'])
+        started_at = datetime.fromtimestamp(int(payload['t']), tz=dt_timezone.utc)
+    except (TypeError, ValueError, KeyError, OverflowError, UnicodeError, binascii.Error):
+        raise NotFound('Invalid sync token')
+    return change_id, started_at
+
+
+def listing_changes(token, limit):
+    """
+    Return up to `limit` changes after the given sync token (or all live
+    listings when token is None) as a dict with the changed `houses` in log
+    order, `deleted` house ids, the `next` token and `has_more`.
+    """
+    now = timezone.now()
+    since, started_at = 0, now
+    if token:
+        since, started_at = decode_token(token)
+        if started_at < retention_cutoff(now):
+            raise SyncTokenExpired()
+
+    changes = ListingChange.objects.filter(pk__gt=since).order_by('pk')
+    if not token:
+        # A full sync has nothing to delete locally.
+        changes = changes.filter(action=ListingChange.UPSERT)
+    rows = list(changes[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    stable_id = max(stable_change_id(now), since)
+    if has_more and rows[-1].pk > stable_id:
+        # End the page at the stable position; the young changes follow on
+        # the next one. A page of young changes only is returned empty, its
+        # token kept at `since`, until they are old enough to be committed.
+        rows = [row for row in rows if row.pk <= stable_id]
+
+    upserts = [row.house_id for row in rows if row.action == ListingChange.UPSERT]
+    houses = House.objects.in_bulk(upserts)
+
+    last_id = rows[-1].pk if rows else since
+    if not has_more:
+        # Young changes are served again next time.
+        last_id = min(last_id, stable_id)
+    # While catching up the token keeps the time the sync started; once the
+    # client is current, later changes are all newer than now.
+    return {
+        'houses': [houses[pk] for pk in upserts if pk in houses],
+        'deleted': [row.house_id for row in rows if row.action == ListingChange.DELETE],
+        'next': encode_token(last_id, started_at if has_more else now),
+        'has_more': has_more,
+    }
+
+
+def compact_changes(now=None, dry_run=False):
+    """
+    Bring the change log back in line with the listings table and purge
+    expired tombstones. Returns a dict of how many rows each step touched.
+
+    Houses written without signals (bulk_create, raw SQL) get an upsert
+    entry, upserts of houses deleted the same way become tombstones, and
+    tombstones older than the retention period are removed.
+    """
+    live = set(House.objects.values_list('pk', flat=True))
+    logged = dict(ListingChange.objects.values_list('house_id', 'action'))
+
+    missing = [pk for pk in live if logged.get(pk) != ListingChange.UPSERT]
+    orphaned = [pk for pk, action in logged.items() if action == ListingChange.UPSERT and pk not in live]
+    expired = ListingChange.objects.filter(action=ListingChange.DELETE, changed_at__lt=retention_cutoff(now))
+
+    result = {'missing': len(missing), 'orphaned': len(orphaned)}
+    if dry_run:
+        result['expired'] = expired.count()
+        return result
+
+    record_changes(missing, ListingChange.UPSERT)
+    record_changes(orphaned, ListingChange.DELETE)
+    result['expired'] = expired.delete()[0]
+    return result
@@ -1,3 +1,1971 @@
-from django.test import TestCase
+import asyncio
+import base64
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from random import Random
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from asgiref.sync import sync_to_async
+from django.test import TestCase, override_settings
+from PIL import Image
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from .cache import fragment_cache_stats
+from .engagement import get_buffer, flush_engagement, popularity_increment
+from .events import LocalBroker, RESYNC, RedisBroker, check_worker_setup, get_broker, reset_broker
+from .images import process_image, process_pending_jobs
+from .inquiries import inbox_queryset
+from .models import (House, PropertyType, Feature, PropertyImage, Agent, UserProfile, Favorite, PropertyInquiry,
+                     ListingChange, ImageJob, ImageUpload, ImageBlob, SavedSearch, SavedSearchMatch, SimilarListing,
+                     SimilarListingRefresh)
+from .pagination import ListingCursorPagination
+from .serializers import HouseListSerializer
+from .sync import record_changes
+from .recommendations import get_index, reset_index
+from .search import MAX_FUZZY_CANDIDATES
+from .similar import store_neighbours
+from . import saved_searches, suggest
+from .views import HouseViewSet
+
+
+class ListingQueryCountTests(TestCase):
+    """
+    Serializing listings must cost a constant number of queries, however many
+    houses, agents, images and features are on the page.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.property_type = PropertyType.objects.create(name='Apartment')
+        self.features = [Feature.objects.create(name=name) for name in ('Garden', 'Garage')]
+        self.tenant = User.objects.create_user(username='tenant', password='secret')
+        UserProfile.objects.create(user=self.tenant, role='tenant')
+
+    def create_houses(self, count):
+        for i in range(count):
+            user = User.objects.create(username=f'agent{House.objects.count()}')
+            agent = Agent.objects.create(user=user, name=user.username, phone='123')
+            house = House.objects.create(
+                title=f'House {i}', description='Nice house', price=1000 + i, address='Main Street',
+                property_status='for_rent', property_type=self.property_type, agent=agent, created_by=user)
+            house.features.set(self.features)
+            PropertyImage.objects.create(house=house, image=f'property_images/{house.id}.jpg')
+            Favorite.objects.create(user=self.tenant, house=house)
+            PropertyInquiry.objects.create(tenant=self.tenant, house=house, message='Is it available?')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assert_flat_query_count(self, url):
+        self.create_houses(2)
+        small = self.count_queries(url)
+        self.create_houses(8)
+        large = self.count_queries(url)
+        self.assertEqual(small, large)
+
+    def test_listings(self):
+        self.assert_flat_query_count('/api/properties/listings/')
+
+    def test_favorites(self):
+        self.client.force_authenticate(self.tenant)
+        self.assert_flat_query_count('/api/properties/favorites/')
+
+    def test_inquiries(self):
+        self.client.force_authenticate(self.tenant)
+        self.assert_flat_query_count('/api/properties/inquiries/')
+
+    def test_agents(self):
+        self.assert_flat_query_count('/api/properties/agents/')
+
+    def test_cover_is_first_uploaded_image(self):
+        self.create_houses(1)
+        house = House.objects.get()
+        PropertyImage.objects.filter(house=house).delete()
+        # Ids ordered against upload times.
+        now = timezone.now()
+        for i, pk in enumerate((uuid.UUID(int=2), uuid.UUID(int=1))):
+            PropertyImage.objects.create(id=pk, house=house, image=f'property_images/{i}.jpg')
+            PropertyImage.objects.filter(pk=pk).update(created_at=now - timedelta(days=2 - i))
+
+        listing = self.client.get('/api/properties/listings/').json()['results'][0]
+        detail = self.client.get(f'/api/properties/listings/{house.id}/').json()
+        fallback = HouseListSerializer(House.objects.get(), context={'request': None}).data
+        self.assertEqual(listing['images'][0]['id'], str(uuid.UUID(int=2)))
+        self.assertEqual(detail['images'][0]['id'], str(uuid.UUID(int=2)))
+        self.assertEqual(fallback['images'][0]['id'], str(uuid.UUID(int=2)))
+
+
+class PropertyCounterTests(TestCase):
+    """
+    Denormalized property_count columns follow house and feature changes.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='agent')
+        self.agent = Agent.objects.create(user=self.user, name='Agent', phone='123')
+        self.other_agent = Agent.objects.create(user=User.objects.create(username='other'), name='Other', phone='456')
+        self.apartment = PropertyType.objects.create(name='Apartment')
+        self.villa = PropertyType.objects.create(name='Villa')
+        self.garden = Feature.objects.create(name='Garden')
+        self.pool = Feature.objects.create(name='Pool')
+
+    def create_house(self):
+        return House.objects.create(
+            title='House', description='Nice house', price=1000, address='Main Street',
+            property_status='for_sale', property_type=self.apartment, agent=self.agent, created_by=self.user)
+
+    def assert_counts(self, expected):
+        for obj, count in expected.items():
+            obj.refresh_from_db()
+            self.assertEqual(obj.property_count, count, obj)
+
+    def test_counters_follow_house_lifecycle(self):
+        house = self.create_house()
+        house.features.set([self.garden, self.pool])
+        self.assert_counts({self.agent: 1, self.apartment: 1, self.garden: 1, self.pool: 1})
+
+        house.agent = self.other_agent
+        house.property_type = self.villa
+        house.save()
+        house.features.remove(self.pool, self.pool)
+        self.assert_counts({self.agent: 0, self.other_agent: 1, self.apartment: 0, self.villa: 1, self.pool: 0})
+
+        self.pool.house_set.add(house)
+        self.garden.house_set.clear()
+        self.assert_counts({self.garden: 0, self.pool: 1})
+
+        house.delete()
+        self.assert_counts({self.other_agent: 0, self.villa: 0, self.pool: 0})
+
+    def test_recount_command_repairs_drift(self):
+        house = self.create_house()
+        house.features.add(self.garden)
+        Agent.objects.update(property_count=7)
+        Feature.objects.update(property_count=0)
+
+        call_command('recount_properties', stdout=StringIO())
+
+        self.assert_counts({self.agent: 1, self.other_agent: 0, self.garden: 1, self.pool: 0, self.apartment: 1})
+
+
+class ListingIndexTests(TestCase):
+    """
+    Every documented listing filter/sort combination must be answered through
+    an index on realestate_house rather than a full table scan.
+    """
+    FILTER_COMBINATIONS = [
+        {},
+        {'property_status': 'for_sale'},
+        {'property_status': 'for_rent', 'min_price': 500, 'max_price': 1500},
+        {'min_price': 500, 'max_price': 1500},
+        {'property_type': 'TYPE'},
+        {'agent_id': 'AGENT'},
+        {'bedrooms': 4, 'bathrooms': 3},
+        {'ordering': 'price'},
+        {'ordering': '-area'},
+        {'ordering': 'bedrooms'},
+        {'ordering': '-bathrooms'},
+        {'ordering': 'popular'},
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='agent')
+        cls.agent = Agent.objects.create(user=user, name='Agent', phone='123')
+        cls.property_type = PropertyType.objects.create(name='Apartment')
+        House.objects.bulk_create([
+            House(
+                title=f'House {i}', description='Nice house', price=100 + (i * 37) % 2000,
+                address='Main Street', property_status='for_sale' if i % 2 else 'for_rent',
+                bedrooms=1 + i % 5, bathrooms=1 + i % 3, area=50 + i % 400,
+                property_type=cls.property_type if i % 7 == 0 else None,
+                agent=cls.agent if i % 10 == 0 else None, created_by=user)
+            for i in range(1000)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE TABLE realestate_house' if connection.vendor == 'mysql' else 'ANALYZE')
+
+    def get_listing_queryset(self, params, after=None):
+        """
+        Return the queryset of the first page of listings for the given
+        params, or of the page following the `after`-th row.
+        """
+        params = {
+            key: {'TYPE': self.property_type.pk, 'AGENT': self.agent.pk}.get(value, value)
+            for key, value in params.items()
+        }
+        view = HouseViewSet(action='list', format_kwarg=None, kwargs={})
+        view.request = Request(APIRequestFactory().get('/api/properties/listings/', params))
+        queryset = view.filter_queryset(view.get_queryset())
+        paginator = ListingCursorPagination()
+        ordering = paginator.get_ordering(queryset)
+        descending = ordering.startswith('-')
+        queryset = queryset.order_by(ordering, '-pk' if descending else 'pk')
+        if after is not None:
+            field_name = ordering.lstrip('-')
+            value, pk = queryset.values_list(field_name, 'pk')[after]
+            queryset = queryset.filter(paginator.cursor_filter(field_name, value, pk, descending))
+        return queryset[:paginator.page_size + 1]
+
+    def full_scans(self, queryset, ordered_walk=False):
+        """
+        Return the plan steps that read realestate_house without an index,
+        or through a whole index without a constraint on it. With
+        ordered_walk, reading an index in the requested order is allowed,
+        as the LIMIT stops it after one page.
+        """
+        if connection.vendor == 'mysql':
+            def tables(node):
+                if isinstance(node, dict):
+                    if node.get('table_name') == 'realestate_house':
+                        yield node
+                    for value in node.values():
+                        yield from tables(value)
+                elif isinstance(node, list):
+                    for value in node:
+                        yield from tables(value)
+
+            plan = json.loads(queryset.explain(format='json'))
+            rejected = {'ALL'} if ordered_walk else {'ALL', 'index'}
+            return [table for table in tables(plan) if table.get('access_type') in rejected]
+
+        plan = queryset.explain()
+        steps = [line for line in plan.splitlines() if 'SCAN realestate_house' in line]
+        if ordered_walk and 'TEMP B-TREE' not in plan:
+            return [line for line in steps if 'USING' not in line]
+        return steps
+
+    def test_filter_combinations_use_indexes(self):
+        if connection.vendor not in ('mysql', 'sqlite'):
+            self.skipTest('EXPLAIN parsing is only implemented for MySQL and SQLite')
+        for params in self.FILTER_COMBINATIONS:
+            with self.subTest(params=params):
+                self.assertEqual(self.full_scans(self.get_listing_queryset(params), ordered_walk=True), [])
+                # Following pages are index range scans.
+                self.assertEqual(self.full_scans(self.get_listing_queryset(params, after=20)), [])
+
+
+class ListingPaginationTests(TestCase):
+    """
+    Listings are paged by (sort value, id) cursors in both directions.
+    """
+
+    def setUp(self):
+        user = User.objects.create(username='agent')
+        # Two prices only, so most pages split rows sharing a sort value.
+        self.houses = [
+            House.objects.create(
+                title=f'House {i}', description='Nice house', price=1000 if i < 5 else 2000, address='Main Street',
+                area=100 - i, property_status='for_rent', created_by=user)
+            for i in range(7)
+        ]
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def walk(self, data, link):
+        pages = [[house['id'] for house in data['results']]]
+        while data[link]:
+            data = self.get(data[link])
+            pages.append([house['id'] for house in data['results']])
+        return pages, data
+
+    def test_ties_are_neither_skipped_nor_repeated(self):
+        pages, last = self.walk(self.get('/api/properties/listings/', ordering='price', page_size=2), 'next')
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        ids = [pk for page in pages for pk in page]
+        expected = sorted(self.houses, key=lambda house: (house.price, str(house.pk)))
+        self.assertEqual(ids, [str(house.pk) for house in expected])
+
+        # Following `previous` from the last page returns the same pages backwards.
+        back, first = self.walk(last, 'previous')
+        self.assertEqual(back, pages[::-1])
+        self.assertIsNone(first['previous'])
+        self.assertIsNotNone(first['next'])
+
+    def test_cursor_of_another_ordering_ignored(self):
+        cursor = parse_qs(urlparse(self.get('/api/properties/listings/', ordering='price', page_size=2)['next']).query)['cursor'][0]
+        data = self.get('/api/properties/listings/', ordering='-area', page_size=2, cursor=cursor)
+        self.assertEqual([house['title'] for house in data['results']], ['House 0', 'House 1'])
+        self.assertIsNone(data['previous'])
+        self.assertNotIn(cursor, data['next'])
+
+    def test_malformed_cursor_not_found(self):
+        for cursor in ('not-a-cursor', base64.urlsafe_b64encode(b'{"o":"-created_at"}').decode(),
+                       base64.urlsafe_b64encode(b'{"o":"-created_at","v":"yesterday","pk":"x"}').decode()):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get('/api/properties/listings/', {'cursor': cursor}).status_code, 404)
+
+
+class ListingSearchTests(TestCase):
+    """
+    The `search` parameter goes through the ranked full-text index.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        user = User.objects.create(username='agent')
+        listings = [
+            ('Riverside villa', 'Quiet villa near the Nile river', 'Juba'),
+            ('Family apartment', 'Apartment with a view of the riverside park', 'Juba'),
+            ('Office space', 'Commercial office close to the market', 'Wau'),
+        ]
+        for title, description, location in listings:
+            House.objects.create(
+                title=title, description=description, price=1000, address='Main Street',
+                location=location, property_status='for_rent', created_by=user)
+
+    def search(self, query, **params):
+        response = self.client.get('/api/properties/listings/', {'search': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [house['title'] for house in response.data['results']]
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.search('riverside'), ['Riverside villa', 'Family apartment'])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.search('juba apartment'), ['Family apartment'])
+
+    def test_prefix_and_typo_matching(self):
+        self.assertEqual(self.search('offi'), ['Office space'])
+        self.assertEqual(self.search('apartmnet'), ['Family apartment'])
+        # Swapped letters count as a single edit.
+        self.assertEqual(self.search('qiuet'), ['Riverside villa'])
+        self.assertEqual(self.search('ofifce'), ['Office space'])
+
+    def test_typos_found_among_many_terms(self):
+        # More terms starting with "o" than the fuzzy lookup reads, all sorting before "office".
+        words = [f"oa{a}{b}{c}" for a in 'abcdefghijklm' for b in 'abcdefghijklmnopqrstuvwxyz' for c in 'abcdefg']
+        self.assertGreater(len(words), MAX_FUZZY_CANDIDATES)
+        House.objects.create(
+            title='Dictionary', description=' '.join(words), price=1000, address='Main Street', location='Juba',
+            property_status='for_rent', created_by=User.objects.get(username='agent'))
+        self.assertEqual(self.search('offcie'), ['Office space'])
+
+    def test_search_index_follows_updates(self):
+        house = House.objects.get(title='Office space')
+        house.title = 'Warehouse'
+        house.save()
+        self.assertEqual(self.search('warehouse'), ['Warehouse'])
+        self.assertEqual(self.search('space'), [])
+
+    def test_ranked_results_paginate(self):
+        first = self.client.get('/api/properties/listings/', {'search': 'juba', 'page_size': 1}).data
+        second = self.client.get(first['next']).data
+        self.assertEqual(len(first['results']), 1)
+        self.assertEqual(len(second['results']), 1)
+        self.assertNotEqual(first['results'][0]['id'], second['results'][0]['id'])
+        self.assertIsNone(second['next'])
+
+
+class ListingFacetTests(TestCase):
+    """
+    The facets action counts the filtered listings in a single query.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        user = User.objects.create(username='agent')
+        self.apartment = PropertyType.objects.create(name='Apartment')
+        for price, bedrooms, status, property_type in [
+            (800, 1, 'for_rent', self.apartment),
+            (1200, 2, 'for_rent', self.apartment),
+            (250000, 6, 'for_sale', None),
+        ]:
+            House.objects.create(
+                title='House', description='Nice house', price=price, address='Main Street',
+                property_status=status, bedrooms=bedrooms, property_type=property_type, created_by=user)
+
+    def test_facet_counts(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/properties/listings/facets/')
+        self.assertEqual(response.status_code, 200)
+        facets = response.data
+        self.assertEqual(facets['count'], 3)
+        self.assertEqual(facets['property_type'], [{'id': self.apartment.id, 'name': 'Apartment', 'count': 2}])
+        self.assertEqual({f['value']: f['count'] for f in facets['property_status']}, {'for_rent': 2, 'for_sale': 1})
+        self.assertEqual({f['value']: f['count'] for f in facets['bedrooms']}['5+'], 1)
+        prices = {f['value']: f['count'] for f in facets['price']}
+        self.assertEqual((prices['500-1000'], prices['1000-5000'], prices['100000-500000']), (1, 1, 1))
+
+    def test_facets_respect_filters(self):
+        response = self.client.get('/api/properties/listings/facets/', {'property_status': 'for_rent'})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual({f['value']: f['count'] for f in response.data['property_status']},
+                         {'for_rent': 2, 'for_sale': 0})
+
+
+class SparseFieldsetTests(TestCase):
+    """
+    Listing cards are compact by default and `fields`/`expand` shape the payload.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        user = User.objects.create(username='agent')
+        agent = Agent.objects.create(user=user, name='Agent', phone='123')
+        self.house = House.objects.create(
+            title='House', description='Nice house', price=1000, address='Main Street',
+            property_status='for_rent', agent=agent, created_by=user)
+        self.house.features.add(Feature.objects.create(name='Garden'))
+        for name in ('front', 'back'):
+            PropertyImage.objects.create(house=self.house, image=f'property_images/{name}.jpg')
+
+    def test_list_is_compact(self):
+        result = self.client.get('/api/properties/listings/').data['results'][0]
+        self.assertNotIn('description', result)
+        self.assertNotIn('agent', result)
+        self.assertEqual(len(result['images']), 1)
+
+    def test_expand(self):
+        result = self.client.get('/api/properties/listings/', {'expand': 'agent,features'}).data['results'][0]
+        self.assertEqual(result['agent']['name'], 'Agent')
+        self.assertEqual([feature['name'] for feature in result['features']], ['Garden'])
+
+    def test_fields_skip_relation_queries(self):
+        # The ETag validators and the page itself.
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/properties/listings/', {'fields': 'id,title,price'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title', 'price'})
+
+        response = self.client.get(f'/api/properties/listings/{self.house.id}/', {'fields': 'title,images'})
+        self.assertEqual(set(response.data), {'title', 'images'})
+        self.assertEqual(len(response.data['images']), 2)
+
+
+class ListingFragmentCacheTests(TestCase):
+    """
+    Listings are rendered from cached fragments until something they show changes.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='agent')
+        self.agent = Agent.objects.create(user=self.user, name='Agent', phone='123')
+        self.house = House.objects.create(
+            title='House', description='Nice house', price=1000, address='Main Street',
+            property_status='for_rent', agent=self.agent, created_by=self.user)
+        self.url = f'/api/properties/listings/{self.house.id}/'
+
+    def test_cached_fragment_is_reused(self):
+        first = self.client.get(self.url).data
+        # One query for the ETag validators, one for the house itself.
+        with self.assertNumQueries(2):
+            second = self.client.get(self.url).data
+        self.assertEqual(first, second)
+        self.assertEqual(fragment_cache_stats(), {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+    def test_related_changes_invalidate_fragment(self):
+        self.client.get(self.url)
+
+        PropertyImage.objects.create(house=self.house, image='property_images/front.jpg')
+        self.assertEqual(len(self.client.get(self.url).data['images']), 1)
+
+        self.house.features.add(Feature.objects.create(name='Garden'))
+        self.assertEqual(len(self.client.get(self.url).data['features']), 1)
+
+        self.agent.name = 'Renamed'
+        self.agent.save()
+        self.assertEqual(self.client.get(self.url).data['agent']['name'], 'Renamed')
+
+        House.objects.create(
+            title='Other', description='Other house', price=500, address='Side Street',
+            property_status='for_rent', agent=self.agent, created_by=self.user)
+        self.assertEqual(self.client.get(self.url).data['agent']['property_count'], 2)
+
+        self.user.username = 'renamed'
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).data['agent']['username'], 'renamed')
+
+    def test_agent_changes_leave_other_listings_alone(self):
+        response = self.client.get(self.url)
+        updated_at = House.objects.get(pk=self.house.pk).updated_at
+        change_id = ListingChange.objects.get(house_id=self.house.pk).pk
+
+        House.objects.create(
+            title='Other', description='Other house', price=500, address='Side Street',
+            property_status='for_rent', agent=self.agent, created_by=self.user)
+        self.user.first_name = 'Agent'
+        self.user.save()
+
+        self.assertEqual(House.objects.get(pk=self.house.pk).updated_at, updated_at)
+        self.assertEqual(ListingChange.objects.get(house_id=self.house.pk).pk, change_id)
+        # The rendered agent changed, so the listing's validators did too.
+        revalidated = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 200)
+        self.assertEqual(revalidated.data['agent']['property_count'], 2)
+        self.assertEqual(revalidated.data['updated_at'], response.data['updated_at'])
+
+
+class ConditionalRequestTests(TestCase):
+    """
+    Listing and catalogue endpoints answer revalidation with 304 Not Modified.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='agent')
+        self.agent = Agent.objects.create(user=self.user, name='Agent', phone='123')
+        self.house = House.objects.create(
+            title='House', description='Nice house', price=1000, address='Main Street',
+            property_status='for_rent', agent=self.agent, created_by=self.user)
+
+    def test_not_modified_without_rendering(self):
+        url = f'/api/properties/listings/{self.house.id}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('Last-Modified', response)
+
+        # Keep this request from being the one that flushes engagement counters.
+        with self.settings(ENGAGEMENT_FLUSH_INTERVAL=3600), self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(fragment_cache_stats()['hits'], 0)
+
+    def test_changes_update_etag(self):
+        url = '/api/properties/listings/'
+        etag = self.client.get(url)['ETag']
+
+        self.house.price = 1200
+        self.house.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        House.objects.create(
+            title='Other', description='Other house', price=500, address='Side Street',
+            property_status='for_rent', agent=self.agent, created_by=self.user)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_depends_on_query(self):
+        url = '/api/properties/listings/'
+        self.assertNotEqual(self.client.get(url)['ETag'], self.client.get(url + '?fields=id')['ETag'])
+
+    def test_catalogue_count_changes_update_etag(self):
+        property_type = PropertyType.objects.create(name='Villa')
+        url = '/api/properties/types/'
+        response = self.client.get(url)
+        self.assertIn('max-age=3600', response['Cache-Control'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        self.house.property_type = property_type
+        self.house.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_missing_object_is_not_found(self):
+        self.assertEqual(self.client.get('/api/properties/types/999/').status_code, 404)
+
+
+@override_settings(LISTING_CHANGES_COMMIT_LAG=0)
+class ListingChangesTests(TestCase):
+    """
+    The changes endpoint returns only what changed since a sync token.
+    """
+    url = '/api/properties/listings/changes/'
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='agent')
+        self.houses = [self.create_house(f'House {i}') for i in range(3)]
+
+    def create_house(self, title):
+        return House.objects.create(
+            title=title, description='Nice house', price=1000, address='Main Street',
+            property_status='for_rent', created_by=self.user)
+
+    def sync(self, token=None):
+        params = {'since': token} if token else {}
+        return self.client.get(self.url, params).data
+
+    def test_full_then_incremental_sync(self):
+        full = self.sync()
+        self.assertEqual([house['id'] for house in full['results']], [str(house.id) for house in self.houses])
+        self.assertFalse(full['has_more'])
+
+        self.assertEqual(self.sync(full['next'])['results'], [])
+
+        self.houses[1].price = 900
+        self.houses[1].save()
+        deleted_id = self.houses[2].id
+        self.houses[2].delete()
+        created = self.create_house('New')
+
+        delta = self.sync(full['next'])
+        self.assertEqual([house['id'] for house in delta['results']], [str(self.houses[1].id), str(created.id)])
+        self.assertEqual(delta['deleted'], [deleted_id])
+
+    def test_log_keeps_latest_change_per_house(self):
+        for price in (900, 800, 700):
+            self.houses[0].price = price
+            self.houses[0].save()
+        self.assertEqual(ListingChange.objects.filter(house_id=self.houses[0].id).count(), 1)
+
+    def test_paging(self):
+        first = self.client.get(self.url, {'page_size': 2}).data
+        self.assertTrue(first['has_more'])
+        second = self.client.get(self.url, {'page_size': 2, 'since': first['next']}).data
+        self.assertFalse(second['has_more'])
+        self.assertEqual(len(first['results']) + len(second['results']), 3)
+
+    def test_young_changes_served_again(self):
+        token = self.sync()['next']
+        self.houses[1].price = 900
+        self.houses[1].save()
+        with self.settings(LISTING_CHANGES_COMMIT_LAG=60):
+            delta = self.sync(token)
+            self.assertEqual([house['id'] for house in delta['results']], [str(self.houses[1].id)])
+            # A change with a lower id may still commit, so the token stays before this one.
+            delta = self.sync(delta['next'])
+            self.assertEqual([house['id'] for house in delta['results']], [str(self.houses[1].id)])
+        delta = self.sync(delta['next'])
+        self.assertEqual(len(delta['results']), 1)
+        self.assertEqual(self.sync(delta['next'])['results'], [])
+
+    def test_young_pages_held_back(self):
+        token = self.sync()['next']
+        for house in self.houses:
+            house.price = 900
+            house.save()
+        with self.settings(LISTING_CHANGES_COMMIT_LAG=60):
+            page = self.client.get(self.url, {'page_size': 2, 'since': token}).data
+            self.assertEqual((page['results'], page['deleted'], page['has_more']), ([], [], True))
+            self.assertEqual(page['next'], token)
+        page = self.client.get(self.url, {'page_size': 2, 'since': token}).data
+        self.assertEqual(len(page['results']), 2)
+        self.assertTrue(page['has_more'])
+
+    def test_concurrent_records_keep_one_change(self):
+        bulk_create = ListingChange.objects.bulk_create
+        raced = []
+
+        def racing_bulk_create(changes):
+            if not raced:
+                # Another writer records the same house between the delete and the insert.
+                raced.append(bulk_create([ListingChange(house_id=self.houses[0].id)]))
+            return bulk_create(changes)
+
+        with mock.patch.object(ListingChange.objects, 'bulk_create', side_effect=racing_bulk_create):
+            record_changes([self.houses[0].id])
+        self.assertEqual(ListingChange.objects.filter(house_id=self.houses[0].id).count(), 1)
+
+    def test_expired_and_invalid_tokens(self):
+        token = self.sync()['next']
+        with self.settings(LISTING_CHANGES_RETENTION_DAYS=-1):
+            self.assertEqual(self.client.get(self.url, {'since': token}).status_code, 410)
+        self.assertEqual(self.client.get(self.url, {'since': 'garbage'}).status_code, 404)
+
+    def test_compaction(self):
+        deleted_id = self.houses[0].id
+        self.houses[0].delete()
+        ListingChange.objects.filter(house_id=self.houses[1].id).delete()
+
+        out = StringIO()
+        with self.settings(LISTING_CHANGES_RETENTION_DAYS=-1):
+            call_command('compact_listing_changes', stdout=out)
+        self.assertIn('fixed 1 missing', out.getvalue())
+        self.assertFalse(ListingChange.objects.filter(house_id=deleted_id).exists())
+        self.assertTrue(ListingChange.objects.filter(house_id=self.houses[1].id).exists())
+
+
+class MediaTestCase(TestCase):
+    """
+    Stores media files, including resumable uploads, in a temporary directory
+    removed after each test, and serves them from Django.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, RESUMABLE_UPLOAD_DIR=f'{self.media_root}/uploads', MEDIA_SENDFILE_BACKEND='')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class ImagePipelineTests(MediaTestCase):
+    """
+    Uploaded images are queued and processed into resized variants off the request path.
+    """
+
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create(username='agent')
+        self.house = House.objects.create(
+            title='House', description='Nice house', price=1000, address='Main Street',
+            property_status='for_rent', created_by=user)
+
+    def upload(self, size=(1200, 800)):
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera Maker'
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (200, 100, 50)).save(buffer, format='JPEG', exif=exif)
+        return PropertyImage.objects.create(
+            house=self.house, image=SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg'))
+
+    def test_variants_generated(self):
+        image = self.upload()
+        self.assertEqual(ImageJob.objects.get(image=image).status, ImageJob.PENDING)
+        self.assertEqual(image.variants, {})
+        # The original is stored without its EXIF metadata.
+        with image.image.open('rb') as original:
+            self.assertFalse(Image.open(original).getexif())
+
+        self.assertEqual(process_pending_jobs(), 1)
+        image.refresh_from_db()
+        self.assertEqual(ImageJob.objects.get(image=image).status, ImageJob.DONE)
+        self.assertEqual((image.width, image.height), (1200, 800))
+        # Nothing is upscaled past the original size.
+        self.assertEqual(list(image.variants), ['thumbnail', 'medium'])
+        self.assertEqual((image.variants['thumbnail']['width'], image.variants['thumbnail']['height']), (320, 213))
+        with image.image.storage.open(image.variants['medium']['webp']) as variant:
+            self.assertEqual(Image.open(variant).format, 'WEBP')
+        # 1 original + 2 sizes x 2 formats, all in use.
+        self.assertFalse(ImageBlob.objects.filter(ref_count=0).exists())
+        self.assertEqual(ImageBlob.objects.filter(ref_count=1).count(), 5)
+
+    def test_metadata_of_older_originals_stripped(self):
+        with mock.patch('realestate.storage.strip_metadata', return_value=None):
+            image = self.upload()
+        with image.image.open('rb') as original:
+            self.assertTrue(Image.open(original).getexif())
+        process_pending_jobs()
+        image.refresh_from_db()
+        with image.image.open('rb') as original:
+            self.assertFalse(Image.open(original).getexif())
+        # Only the original with EXIF is left unreferenced.
+        self.assertEqual(ImageBlob.objects.filter(ref_count=0).count(), 1)
+
+    def test_metadata_stripped_losslessly(self):
+        for image_format in ('JPEG', 'PNG', 'WEBP'):
+            with self.subTest(image_format):
+                exif = Image.Exif()
+                exif[0x010F] = 'Camera Maker'
+                exif[0x0112] = 6
+                exif.get_ifd(0x8825)[2] = (52.0, 22.0, 1.5)
+                picture = Image.new('RGB', (120, 80), (200, 100, 50))
+                picture.putpixel((3, 4), (0, 0, 0))
+                buffer = io.BytesIO()
+                picture.save(buffer, format=image_format, exif=exif, xmp=b'<x:xmpmeta/>')
+                image = PropertyImage.objects.create(
+                    house=self.house, image=SimpleUploadedFile(f'photo.{image_format.lower()}', buffer.getvalue()))
+
+                with image.image.open('rb') as stored:
+                    stored = Image.open(stored)
+                    self.assertEqual(dict(stored.getexif()), {0x0112: 6})
+                    self.assertNotIn('xmp', stored.info)
+                    self.assertEqual(stored.tobytes(), Image.open(buffer).tobytes())
+                process_image(image)
+                self.assertEqual((image.width, image.height), (80, 120))
+
+    def test_serialized_variants(self):
+        image = self.upload(size=(400, 300))
+        process_pending_jobs()
+        data = APIClient().get(f'/api/properties/listings/{self.house.id}/').data['images'][0]
+        self.assertEqual(data['width'], 400)
+        self.assertTrue(data['variants']['thumbnail']['webp'].startswith('http://testserver/media/'))
+        self.assertIn(' 320w', data['srcset']['jpeg'])
+
+    def test_jobs_submitted_without_returned_ids(self):
+        features = type(connection.features)
+        with mock.patch.object(features, 'can_return_rows_from_bulk_insert', False), \
+                mock.patch('realestate.images.submit_jobs') as submit_jobs, \
+                self.captureOnCommitCallbacks(execute=True):
+            image = self.upload()
+        self.assertEqual(submit_jobs.call_args.args[0], [ImageJob.objects.get(image=image).pk])
+
+    def test_failed_jobs_are_retried(self):
+        image = self.upload()
+        os.remove(image.image.path)
+        with self.assertLogs('realestate.images', 'ERROR'):
+            for _ in range(3):
+                process_pending_jobs()
+        job = ImageJob.objects.get(image=image)
+        self.assertEqual((job.status, job.attempts), (ImageJob.FAILED, 3))
+
+
+def jpeg_bytes(size=(64, 48)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (20, 120, 220)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class PhotoUploadTests(MediaTestCase):
+    """
+    Listing photos are streamed, validated from their headers and inserted in bulk.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='agent')
+        UserProfile.objects.create(user=self.user, role='agent')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_house(self, *files):
+        return self.client.post('/api/properties/listings/', {
+            'title': 'House', 'description': 'Nice house', 'price': '1000', 'address': 'Main Street',
+            'property_status': 'for_rent', 'uploaded_images': list(files),
+        }, format='multipart')
+
+    def test_images_inserted_in_bulk(self):
+        photos = [SimpleUploadedFile(f'photo{i}.jpg', jpeg_bytes(), content_type='image/jpeg') for i in range(3)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.create_house(*photos)
+        self.assertEqual(response.status_code, 201)
+        house = House.objects.get()
+        self.assertEqual(house.images.count(), 3)
+        self.assertTrue(all(image.image.storage.exists(image.image.name) for image in house.images.all()))
+        self.assertEqual(ImageJob.objects.count(), 3)
+        image_inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "realestate_propertyimage"')]
+        self.assertEqual(len(image_inserts), 1)
+
+    def test_non_image_rejected(self):
+        response = self.create_house(SimpleUploadedFile('notes.jpg', b'not an image' * 100))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('uploaded_images', response.data)
+        self.assertFalse(House.objects.exists())
+
+    def test_resumable_upload(self):
+        house = House.objects.create(
+            title='House', description='Nice house', price=1000, address='Main Street',
+            property_status='for_rent', created_by=self.user)
+        content = jpeg_bytes(size=(640, 480))
+        response = self.client.post('/api/properties/uploads/', {
+            'house_id': str(house.id), 'filename': 'photo.jpg', 'length': len(content)})
+        self.assertEqual(response.status_code, 201)
+        url = f"/api/properties/uploads/{response.data['id']}/"
+
+        def send(chunk, offset):
+            return self.client.generic('PATCH', url, chunk, content_type='application/offset+octet-stream',
+                                       HTTP_UPLOAD_OFFSET=str(offset))
+
+        half = len(content) // 2
+        self.assertEqual(send(content[:half], 0)['Upload-Offset'], str(half))
+        # A retry from a stale offset is refused and told where to resume.
+        conflict = send(content[:half], 0)
+        self.assertEqual((conflict.status_code, conflict['Upload-Offset']), (409, str(half)))
+        self.assertEqual(self.client.head(url)['Upload-Offset'], str(half))
+
+        response = send(content[half:], half)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.data['image'])
+        self.assertEqual(house.images.count(), 1)
+
+    def test_resumable_upload_rejects_non_image(self):
+        house = House.objects.create(
+            title='House', description='Nice house', price=1000, address='Main Street',
+            property_status='for_rent', created_by=self.user)
+        upload = ImageUpload.objects.create(house=house, uploaded_by=self.user, filename='x.jpg', length=20)
+        response = self.client.generic('PATCH', f'/api/properties/uploads/{upload.id}/', b'plain text, no image',
+                                       content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET='0')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(house.images.exists())
+
+
+class ContentAddressedStorageTests(MediaTestCase):
+    """
+    Identical photos are stored once and deleted when no image uses them.
+    """
+
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create(username='agent')
+        self.houses = [
+            House.objects.create(
+                title=f'House {i}', description='Nice house', price=1000, address='Main Street',
+                property_status='for_rent', created_by=user)
+            for i in range(2)
+        ]
+
+    def add_photo(self, house, content):
+        return PropertyImage.objects.create(house=house, image=SimpleUploadedFile('photo.jpg', content))
+
+    def test_identical_uploads_share_a_blob(self):
+        content = jpeg_bytes()
+        first = self.add_photo(self.houses[0], content)
+        second = self.add_photo(self.houses[1], content)
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertIn(ImageBlob.objects.get().digest, first.image.name)
+        self.assertEqual(ImageBlob.objects.get().ref_count, 2)
+
+        first.delete()
+        self.assertEqual(ImageBlob.objects.get().ref_count, 1)
+        self.assertTrue(second.image.storage.exists(second.image.name))
+
+    def test_garbage_collection(self):
+        kept = self.add_photo(self.houses[0], jpeg_bytes(size=(10, 10)))
+        dropped = self.add_photo(self.houses[1], jpeg_bytes(size=(20, 20)))
+        path = dropped.image.path
+        self.houses[1].delete()
+        # Simulate a counter that drifted, e.g. after a raw SQL delete.
+        ImageBlob.objects.filter(name=kept.image.name).update(ref_count=5)
+
+        out = StringIO()
+        call_command('collect_image_blobs', grace_hours=0, stdout=out)
+        self.assertIn('fixed 1 reference count(s), deleted 1 unreferenced file(s)', out.getvalue())
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(ImageBlob.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(kept.image.path))
+
+
+class MediaServingTests(MediaTestCase):
+    """
+    Media files are streamed with range, conditional request and cache header support.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.content = bytes(range(256)) * 4
+        digest = 'ab' + '0' * 62
+        self.blob = f'property_images/ab/{digest}.jpg'
+        for name in (self.blob, 'profile_images/me.jpg'):
+            os.makedirs(os.path.join(self.media_root, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(self.media_root, name), 'wb') as file:
+                file.write(self.content)
+
+    def get(self, name, **headers):
+        return self.client.get(f'/media/{name}', **headers)
+
+    def test_full_file(self):
+        response = self.get(self.blob)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertNotIn('immutable', self.get('profile_images/me.jpg')['Cache-Control'])
+
+    def test_ranges(self):
+        response = self.get(self.blob, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+
+        response = self.get(self.blob, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+
+        response = self.get(self.blob, HTTP_RANGE='bytes=5000-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, f'bytes */{len(self.content)}'))
+
+        # A stale If-Range gets the whole, current file.
+        response = self.get(self.blob, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_request(self):
+        etag = self.get(self.blob)['ETag']
+        self.assertEqual(self.get(self.blob, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_delegation_to_proxy(self):
+        with self.settings(MEDIA_SENDFILE_BACKEND='nginx', MEDIA_ACCEL_REDIRECT_PREFIX='/internal/'):
+            response = self.get(self.blob)
+        self.assertEqual(response['X-Accel-Redirect'], f'/internal/{self.blob}')
+        self.assertEqual(response.content, b'')
+
+    def test_paths_outside_media_root(self):
+        self.assertEqual(self.get('../settings.py').status_code, 404)
+        self.assertEqual(self.get('property_images/').status_code, 404)
+
+
+class RoleClaimsTests(TestCase):
+    """
+    Access tokens carry the role and agent id, and are revoked when the role changes.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='agent', password='secret')
+        self.profile = UserProfile.objects.create(user=self.user, role='agent')
+        self.agent = Agent.objects.create(user=self.user, name='Agent', phone='123')
+        tenant = User.objects.create(username='tenant')
+        house = House.objects.create(
+            title='House', description='Nice house', price=1000, address='Main Street',
+            property_status='for_rent', agent=self.agent, created_by=self.user)
+        PropertyInquiry.objects.create(tenant=tenant, house=house, message='Is it available?')
+
+    def login(self):
+        return self.client.post('/api/users/token/', {'username': 'agent', 'password': 'secret'}).data
+
+    def test_read_requests_do_not_load_the_user(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.login()['access']}")
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/properties/inquiries/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+        principal_queries = [q['sql'] for q in queries if re.search(
+            r'FROM "(auth_user|realestate_userprofile|realestate_agent)" WHERE', q['sql'])]
+        self.assertEqual(principal_queries, [])
+
+    def test_me_loads_the_user_once(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.login()['access']}")
+        with self.assertNumQueries(1):
+            response = client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['username'], response.data['profile']['role']), ('agent', 'agent'))
+
+        # Tokens of deleted users are refused rather than failing on the missing row.
+        self.user.delete()
+        self.assertEqual(client.get('/api/users/me/').status_code, 401)
+
+    def test_role_change_revokes_tokens(self):
+        tokens = self.login()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        self.assertEqual(client.post(f'/api/properties/inquiries/{PropertyInquiry.objects.get().pk}/respond/',
+                                     {'response': 'Yes'}).status_code, 200)
+
+        self.profile.role = 'tenant'
+        self.profile.save()
+        self.assertEqual(UserProfile.objects.get().token_version, 1)
+
+        response = client.post('/api/properties/listings/', {'title': 'House'})
+        self.assertEqual(response.status_code, 401)
+        response = self.client.post('/api/users/token/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.client.post('/api/users/token/refresh/',
+                                          {'refresh': self.login()['refresh']}).status_code, 200)
+
+
+class PrincipalCacheTests(TestCase):
+    """
+    Requests loading the user resolve it, with its role and agent, from the principal cache.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='agent', password='secret')
+        self.profile = UserProfile.objects.create(user=self.user, role='agent')
+        self.agent = Agent.objects.create(user=self.user, name='Agent', phone='123')
+        access = self.client.post('/api/users/token/', {'username': 'agent', 'password': 'secret'}).data['access']
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def principal_queries(self):
+        # An invalid listing: authenticated, then rejected by validation.
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.api.post('/api/properties/listings/', {}).status_code, 400)
+        return [q['sql'] for q in queries if re.search(
+            r'FROM "(auth_user|realestate_userprofile|realestate_agent)" ', q['sql'])]
+
+    def test_cached_between_requests(self):
+        self.assertEqual(len(self.principal_queries()), 1)
+        self.assertEqual(self.principal_queries(), [])
+
+        # Saving the agent drops the cached bundle.
+        self.agent.save()
+        self.assertEqual(len(self.principal_queries()), 1)
+
+    def test_deactivation_is_seen_immediately(self):
+        self.principal_queries()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.api.post('/api/properties/listings/', {}).status_code, 401)
+
+    def test_disabled(self):
+        with self.settings(PRINCIPAL_CACHE_ENABLED=False):
+            self.principal_queries()
+            # The user, then its token version.
+            self.assertEqual(len(self.principal_queries()), 2)
+
+
+class RecommendationTests(TestCase):
+    """
+    Recommendations rank listings by similarity to the tenant's favorites.
+    """
+
+    def setUp(self):
+        cache.clear()
+        reset_index()
+        self.tenant = User.objects.create(username='tenant')
+        UserProfile.objects.create(user=self.tenant, role='tenant')
+        self.client = APIClient()
+        self.client.force_authenticate(self.tenant)
+        self.apartment = PropertyType.objects.create(name='Apartment')
+        self.villa = PropertyType.objects.create(name='Villa')
+        self.favorite = self.create_house('Favorite', self.apartment, 1000, 'Juba Munuki')
+        Favorite.objects.create(user=self.tenant, house=self.favorite)
+
+    def create_house(self, title, property_type, price, location, bedrooms=2):
+        return House.objects.create(
+            title=title, description='Nice house', price=price, address='Main Street', location=location,
+            bedrooms=bedrooms, property_status='for_rent', property_type=property_type, created_by=self.tenant)
+
+    def recommended(self, **params):
+        response = self.client.get('/api/properties/favorites/recommended/', params)
+        self.assertEqual(response.status_code, 200)
+        return [house['title'] for house in response.data]
+
+    def test_ranked_by_similarity(self):
+        self.create_house('Villa in Wau', self.villa, 90000, 'Wau', bedrooms=6)
+        self.create_house('Apartment in Juba', self.apartment, 1100, 'Juba Munuki')
+        self.create_house('Apartment in Wau', self.apartment, 1000, 'Wau')
+        self.assertEqual(self.recommended(), ['Apartment in Juba', 'Apartment in Wau', 'Villa in Wau'])
+        self.assertEqual(self.recommended(limit=1), ['Apartment in Juba'])
+
+    def test_index_follows_listing_changes(self):
+        self.recommended()
+        house = self.create_house('Apartment in Juba', self.apartment, 1100, 'Juba Munuki')
+        self.assertEqual(get_index().recommend([self.favorite.pk]), [house.pk])
+        house.delete()
+        self.assertEqual(get_index().recommend([self.favorite.pk]), [])
+
+    def test_stale_index_rebuilt_in_background(self):
+        house = self.create_house('Apartment in Juba', self.apartment, 1100, 'Juba Munuki')
+        index = get_index()
+        matrix = index.matrix
+        index.built_at -= 3601
+        with mock.patch.object(index, 'rebuild_in_background') as rebuild_in_background, \
+                mock.patch.object(index, 'rebuild', side_effect=AssertionError("rebuilt in the request")):
+            self.assertEqual(get_index().recommend([self.favorite.pk]), [house.pk])
+        rebuild_in_background.assert_called_once_with()
+
+        # The new matrix is swapped in once loaded.
+        index.rebuild()
+        self.assertIsNot(index.matrix, matrix)
+        self.assertEqual(index.recommend([self.favorite.pk]), [house.pk])
+
+    def test_benchmark_rebuild(self):
+        out = StringIO()
+        call_command('benchmark_recommendations', houses=200, queries=5, rebuild=True, stdout=out)
+        self.assertIn('rebuild: 201 listings from the database', out.getvalue())
+        self.assertEqual(House.objects.count(), 1)
+
+    def test_cached_per_user_until_favorites_change(self):
+        self.create_house('Apartment in Juba', self.apartment, 1100, 'Juba Munuki')
+        self.create_house('Villa in Wau', self.villa, 90000, 'Wau', bedrooms=6)
+        self.assertEqual(self.recommended(), ['Apartment in Juba', 'Villa in Wau'])
+        with CaptureQueriesContext(connection) as queries:
+            self.recommended()
+        self.assertFalse([q for q in queries if 'realestate_listingchange' in q['sql']])
+
+        Favorite.objects.create(user=self.tenant, house=House.objects.get(title='Apartment in Juba'))
+        self.assertEqual(self.recommended(), ['Villa in Wau'])
+
+
+class SimilarListingTests(TestCase):
+    """
+    Similar listings are precomputed, kept current as houses change and read with one query.
+    """
+
+    def setUp(self):
+        cache.clear()
+        reset_index()
+        self.user = User.objects.create(username='agent')
+        self.apartment = PropertyType.objects.create(name='Apartment')
+        self.villa = PropertyType.objects.create(name='Villa')
+        self.house = self.create_house('House', self.apartment, 1000, 'Juba Munuki')
+        self.create_house('Villa in Wau', self.villa, 90000, 'Wau', bedrooms=6)
+        self.create_house('Apartment in Wau', self.apartment, 1000, 'Wau')
+        self.refresh()
+
+    def create_house(self, title, property_type, price, location, bedrooms=2):
+        with self.captureOnCommitCallbacks(execute=True):
+            return House.objects.create(
+                title=title, description='Nice house', price=price, address='Main Street', location=location,
+                bedrooms=bedrooms, property_status='for_rent', property_type=property_type, created_by=self.user)
+
+    def refresh(self):
+        out = StringIO()
+        call_command('refresh_similar_listings', stdout=out)
+        return out.getvalue()
+
+    def similar(self, house=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/properties/listings/{(house or self.house).pk}/similar/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([q for q in queries if 'realestate_similarlisting' in q['sql']]), 1)
+        return [house['title'] for house in response.data]
+
+    def test_similar_listings(self):
+        self.assertEqual(self.similar(), ['Apartment in Wau', 'Villa in Wau'])
+        self.assertEqual(self.client.get('/api/properties/listings/not-a-house/similar/').status_code, 404)
+
+    def test_updated_when_houses_change(self):
+        close = self.create_house('Apartment in Juba', self.apartment, 1100, 'Juba Munuki')
+        # Saving only queues the house; its neighbours are computed by the sweep.
+        self.assertEqual(list(SimilarListingRefresh.objects.values_list('house_id', flat=True)), [close.pk])
+        self.assertEqual(self.similar(close), [])
+        self.assertIn('for 1 queued listing(s)', self.refresh())
+        self.assertFalse(SimilarListingRefresh.objects.exists())
+        self.assertEqual(self.similar()[0], 'Apartment in Juba')
+        self.assertIn('House', self.similar(close))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            close.delete()
+        self.refresh()
+        self.assertEqual(self.similar(), ['Apartment in Wau', 'Villa in Wau'])
+
+    def test_refresh_is_idempotent(self):
+        stale = [(self.house.pk, [(pk, 0.5) for pk in House.objects.exclude(pk=self.house.pk).values_list('pk', flat=True)])]
+        # A refresh finishing after another one replaces its list instead of colliding with it.
+        store_neighbours(stale)
+        store_neighbours(stale)
+        self.assertEqual(SimilarListing.objects.filter(house=self.house).count(), 2)
+        # Lists of houses deleted meanwhile are not written.
+        self.assertEqual(store_neighbours([(uuid.uuid4(), stale[0][1])]), 0)
+
+    def test_rebuild_command(self):
+        with self.settings(SIMILAR_LISTINGS_AUTO_REFRESH=False):
+            self.create_house('Apartment in Juba', self.apartment, 1100, 'Juba Munuki')
+        self.assertNotIn('Apartment in Juba', self.similar())
+        call_command('rebuild_similar_listings', stdout=StringIO())
+        self.assertEqual(self.similar()[0], 'Apartment in Juba')
+
+
+class MapBrowsingTests(TestCase):
+    """
+    Listings are geocoded, filtered by viewport or distance and clustered per zoom level.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='agent')
+        self.munuki = self.create_house('Munuki', 'Munuki, Juba')
+        self.gudele = self.create_house('Gudele', 'Gudele')
+        self.wau = self.create_house('Wau', 'Wau town')
+        self.unknown = self.create_house('Unknown', 'Somewhere')
+
+    def create_house(self, title, location):
+        return House.objects.create(
+            title=title, description='Nice house', price=1000, address='Main Street', location=location,
+            property_status='for_rent', created_by=self.user)
+
+    def titles(self, **params):
+        response = self.client.get('/api/properties/listings/', params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(house['title'] for house in response.data['results'])
+
+    def test_geocoded_on_save(self):
+        self.assertEqual((float(self.munuki.latitude), float(self.munuki.longitude)), (4.8667, 31.5667))
+        self.assertTrue(self.munuki.geohash.startswith('s'))
+        self.assertIsNone(self.unknown.latitude)
+        self.assertEqual(self.unknown.geohash, '')
+
+    def test_geocoded_again_when_moved(self):
+        self.assertTrue(self.munuki.coordinates_approximate)
+        self.munuki.location = 'Wau'
+        self.munuki.save()
+        self.munuki.refresh_from_db()
+        self.assertEqual(float(self.munuki.latitude), 7.7011)
+        self.assertTrue(self.munuki.coordinates_approximate)
+
+        # Coordinates given with the new address are kept, and exact.
+        response = APIClient().get(f'/api/properties/listings/{self.wau.pk}/')
+        self.assertTrue(response.data['coordinates_approximate'])
+        self.wau.location, self.wau.latitude, self.wau.longitude = 'Juba', Decimal('4.85'), Decimal('31.58')
+        self.wau.save()
+        self.wau.refresh_from_db()
+        self.assertEqual((self.wau.latitude, self.wau.coordinates_approximate), (Decimal('4.850000'), False))
+
+        # Moving somewhere unknown drops the old coordinates.
+        self.wau.location = 'Somewhere'
+        self.wau.save()
+        self.assertIsNone(self.wau.latitude)
+        self.assertEqual(self.wau.geohash, '')
+
+    def test_bbox_and_radius_filters(self):
+        self.assertEqual(self.titles(bbox='31.4,4.7,31.7,5.0'), ['Gudele', 'Munuki'])
+        self.assertEqual(self.titles(bbox='27,7,29,8'), ['Wau'])
+        self.assertEqual(self.titles(near='4.8667,31.5667', radius='1'), ['Munuki'])
+        self.assertEqual(self.titles(near='4.8667,31.5667', radius='5'), ['Gudele', 'Munuki'])
+        self.assertEqual(self.client.get('/api/properties/listings/', {'bbox': '1,2,3'}).status_code, 400)
+
+    def test_clusters(self):
+        url = '/api/properties/listings/clusters/'
+        country = self.client.get(url, {'bbox': '24,3,36,12', 'zoom': 5}).data
+        self.assertEqual(sorted(cluster['count'] for cluster in country), [1, 2])
+        self.assertEqual(next(c for c in country if c['count'] == 1)['house_id'], self.wau.pk)
+
+        city = self.client.get(url, {'bbox': '31.4,4.7,31.7,5.0', 'zoom': 15}).data
+        self.assertEqual([cluster['count'] for cluster in city], [1, 1])
+
+    def test_geocode_command(self):
+        House.objects.filter(pk=self.unknown.pk).update(location='Yei')
+        with self.settings(GEOCODE_ON_SAVE=False):
+            call_command('geocode_listings', stdout=StringIO())
+        self.unknown.refresh_from_db()
+        self.assertEqual(float(self.unknown.latitude), 4.095)
+        self.assertTrue(self.unknown.geohash)
+
+
+class SuggestTests(TestCase):
+    """
+    Search box completions come from an in-memory prefix index.
+    """
+    url = '/api/properties/listings/suggest/'
+
+    def setUp(self):
+        reset_index()
+        suggest.reset_index()
+        self.user = User.objects.create(username='agent')
+        self.villa = PropertyType.objects.create(name='Villa')
+        for location in ['Munuki, Juba', 'Munuki, Juba', 'Munuki Block B', 'Gudele']:
+            self.create_house(location)
+
+    def create_house(self, location, address='Main Street'):
+        return House.objects.create(
+            title='House', description='Nice house', price=1000, address=address, location=location,
+            property_type=self.villa, property_status='for_rent', created_by=self.user)
+
+    def suggestions(self, q, **params):
+        response = self.client.get(self.url, {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(item['text'], item['count']) for item in response.data]
+
+    def test_prefix_completions_ranked_by_count(self):
+        self.assertEqual(self.suggestions('mun'), [('Munuki, Juba', 2), ('Munuki Block B', 1)])
+        self.assertEqual(self.suggestions('ju'), [('Munuki, Juba', 2)])
+        self.assertEqual(self.suggestions('munuki  JUBA'), [('Munuki, Juba', 2)])
+        self.assertEqual(self.suggestions('vil'), [('Villa', 4)])
+        self.assertEqual(self.suggestions('ma'), [('Main Street', 4)])
+        self.assertEqual(self.suggestions('mun', limit=1), [('Munuki, Juba', 2)])
+        self.assertEqual(self.suggestions('xyz'), [])
+        self.assertEqual(self.suggestions(''), [])
+
+    def test_no_query_per_keystroke(self):
+        self.suggestions('m')
+        with self.assertNumQueries(0):
+            for q in ['mu', 'mun', 'munu', 'gu']:
+                self.suggestions(q)
+
+    def test_updated_on_commit(self):
+        self.suggestions('mun')
+        with self.captureOnCommitCallbacks(execute=True):
+            house = self.create_house('Munuki Block B')
+        self.assertEqual(self.suggestions('munuki b'), [('Munuki Block B', 2)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            house.location = 'Kator'
+            house.save()
+        self.assertEqual(self.suggestions('kat'), [('Kator', 1)])
+        self.assertEqual(self.suggestions('munuki b'), [('Munuki Block B', 1)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            house.delete()
+        self.assertEqual(self.suggestions('kat'), [])
+
+    def test_other_processes_follow_change_log(self):
+        self.suggestions('gu')
+        # Saved without this process noticing, as if by another process.
+        House.objects.create(
+            title='House', description='Nice house', price=1000, address='Main Street', location='Gumbo',
+            property_status='for_rent', created_by=self.user)
+        self.assertEqual(self.suggestions('gum'), [])
+        with self.settings(SUGGEST_INDEX_SYNC_INTERVAL=0):
+            self.assertEqual(self.suggestions('gum'), [('Gumbo', 1)])
+
+    def test_hot_prefix_refilled_after_removals(self):
+        index = suggest.SuggestionIndex()
+        for i in range(300):
+            for copy in range(100 - i // 3):
+                index.upsert((f'{i}-{copy}', f'Zone {i:03}', '', ''))
+        self.assertEqual(len(index.suggest('zone', 20)), 20)
+        self.assertIn('zone', index.hot)
+        for i in range(60):
+            for copy in range(100 - i // 3):
+                index.remove(f'{i}-{copy}')
+        self.assertEqual([item['text'] for item in index.suggest('zone', 20)],
+                         [f'Zone {i:03}' for i in range(60, 80)])
+
+    def test_rebuilt_outside_the_lock(self):
+        index = suggest.SuggestionIndex()
+        acquired = []
+
+        def load_rows():
+            # A lookup from another thread is not held up by the load.
+            def lookup():
+                acquired.append(index.lock.acquire(timeout=1))
+                if acquired[-1]:
+                    index.lock.release()
+
+            thread = threading.Thread(target=lookup)
+            thread.start()
+            thread.join()
+            return [(1, 'Gudele', '', '')]
+
+        with mock.patch('realestate.suggest.load_rows', load_rows):
+            index.sync()
+        self.assertEqual(acquired, [True])
+        self.assertEqual(len(index), 1)
+
+
+class EngagementTests(TestCase):
+    """
+    Views, favorites and inquiries are counted in memory and written in
+    batches, feeding the popularity ordering.
+    """
+
+    def setUp(self):
+        get_buffer().take()
+        self.user = User.objects.create(username='tenant')
+        self.houses = [
+            House.objects.create(
+                title=f'House {i}', description='Nice house', price=1000, address='Main Street',
+                property_status='for_rent', created_by=self.user)
+            for i in range(3)
+        ]
+
+    def tearDown(self):
+        get_buffer().cancel()
+        get_buffer().take()
+
+    def view(self, house, times=1):
+        for _ in range(times):
+            self.assertEqual(self.client.get(f'/api/properties/listings/{house.pk}/').status_code, 200)
+
+    @override_settings(ENGAGEMENT_FLUSH_INTERVAL=3600)
+    def test_views_written_in_one_update(self):
+        self.view(self.houses[0], 3)
+        self.view(self.houses[1])
+        self.client.get('/api/properties/listings/00000000-0000-0000-0000-000000000000/')
+        self.assertEqual(House.objects.get(pk=self.houses[0].pk).view_count, 0)
+        self.assertEqual(len(get_buffer()), 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(flush_engagement(), 2)
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE')]), 1)
+        counts = dict(House.objects.values_list('pk', 'view_count'))
+        self.assertEqual([counts[house.pk] for house in self.houses], [3, 1, 0])
+        self.assertAlmostEqual(
+            House.objects.get(pk=self.houses[0].pk).popularity / popularity_increment('view'), 3, places=3)
+        self.assertEqual(flush_engagement(), 0)
+
+    @override_settings(ENGAGEMENT_FLUSH_INTERVAL=3600)
+    def test_favorites_and_inquiries_counted_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.user, house=self.houses[2])
+            PropertyInquiry.objects.create(tenant=self.user, house=self.houses[2], message='Available?')
+        flush_engagement()
+        house = House.objects.get(pk=self.houses[2].pk)
+        self.assertEqual((house.view_count, house.favorite_count, house.inquiry_count), (0, 1, 1))
+
+        # A full save of a stale instance keeps the counters.
+        self.houses[2].title = 'Renamed'
+        self.houses[2].save()
+        self.assertEqual(House.objects.get(pk=self.houses[2].pk).inquiry_count, 1)
+
+    @override_settings(ENGAGEMENT_FLUSH_INTERVAL=3600)
+    def test_popular_ordering(self):
+        self.view(self.houses[1], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.user, house=self.houses[2])
+        flush_engagement()
+        response = self.client.get('/api/properties/listings/', {'ordering': 'popular', 'page_size': 2})
+        self.assertEqual([item['id'] for item in response.data['results']],
+                         [str(self.houses[2].pk), str(self.houses[1].pk)])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([item['id'] for item in response.data['results']], [str(self.houses[0].pk)])
+
+    @override_settings(ENGAGEMENT_FLUSH_INTERVAL=3600)
+    def test_popular_ordering_revalidated_after_flush(self):
+        for ordering in ('popular', '-popularity'):
+            with self.subTest(ordering):
+                url = f'/api/properties/listings/?ordering={ordering}'
+                etag = self.client.get(url)['ETag']
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                self.view(self.houses[0])
+                flush_engagement()
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_popularity_decays(self):
+        now = 1735689600 + 86400 * 30
+        self.assertAlmostEqual(
+            popularity_increment('view', now) / popularity_increment('view', now - 7 * 86400), 2)
+        self.assertAlmostEqual(
+            popularity_increment('favorite', now) / popularity_increment('view', now), 5)
+
+    def test_flushed_when_due(self):
+        with self.settings(ENGAGEMENT_FLUSH_INTERVAL=3600, ENGAGEMENT_FLUSH_SIZE=2):
+            self.view(self.houses[0])
+            self.view(self.houses[1])
+        self.assertEqual(len(get_buffer()), 0)
+        self.assertEqual(House.objects.get(pk=self.houses[1].pk).view_count, 1)
+
+    @override_settings(ENGAGEMENT_FLUSH_INTERVAL=3600)
+    def test_failed_flush_keeps_counts(self):
+        self.view(self.houses[0])
+        with mock.patch.object(House.objects, 'filter', side_effect=DatabaseError('gone')), \
+                self.assertLogs('realestate.engagement', 'ERROR'):
+            self.assertEqual(flush_engagement(), 0)
+        self.assertEqual(len(get_buffer()), 1)
+        flush_engagement()
+        self.assertEqual(House.objects.get(pk=self.houses[0].pk).view_count, 1)
+
+    @override_settings(ENGAGEMENT_FLUSH_INTERVAL=3600)
+    def test_idle_worker_flushed_by_timer(self):
+        buffer = get_buffer()
+        # Off unless the server enabled it.
+        self.view(self.houses[0])
+        self.assertIsNone(buffer.timer)
+        timer = mock.Mock()
+        with mock.patch.object(buffer, 'timer_class', timer):
+            self.view(self.houses[0])
+            self.view(self.houses[1])
+        timer.assert_called_once_with(3600, buffer.flush_in_background)
+        timer.return_value.start.assert_called_once_with()
+
+        # The timer thread closes its own connection, not the test's.
+        with mock.patch('realestate.engagement.connection'):
+            buffer.flush_in_background()
+        self.assertIsNone(buffer.timer)
+        counts = dict(House.objects.values_list('pk', 'view_count'))
+        self.assertEqual([counts[house.pk] for house in self.houses], [2, 1, 0])
+
+
+class SavedSearchTests(TestCase):
+    """
+    New and changed listings are matched against saved searches through the
+    predicate index and collected in the "new for you" feed.
+    """
+    url = '/api/properties/saved-searches/'
+
+    def setUp(self):
+        reset_index()
+        saved_searches.reset_index()
+        self.tenant = User.objects.create(username='tenant')
+        UserProfile.objects.create(user=self.tenant, role='tenant')
+        self.client = APIClient()
+        self.client.force_authenticate(self.tenant)
+        self.agent_user = User.objects.create(username='agent')
+        self.apartment = PropertyType.objects.create(name='Apartment')
+        self.villa = PropertyType.objects.create(name='Villa')
+
+    def save_search(self, **criteria):
+        response = self.client.post(self.url, criteria, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def create_house(self, title, property_type=None, price=1000, bedrooms=2, property_status='for_rent'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return House.objects.create(
+                title=title, description='Nice house', price=price, address='Main Street', bedrooms=bedrooms,
+                property_status=property_status, property_type=property_type, created_by=self.agent_user)
+
+    def feed(self, **params):
+        response = self.client.get(f'{self.url}feed/', params)
+        self.assertEqual(response.status_code, 200)
+        return [match['house']['title'] for match in response.data['results']]
+
+    def test_interval_tree_matches_brute_force(self):
+        random = Random(7)
+        intervals = []
+        for key in range(300):
+            low = random.choice([saved_searches.LOWEST, random.randint(0, 1000)])
+            high = random.choice([saved_searches.HIGHEST, random.randint(0, 1000)])
+            if low <= high:
+                intervals.append((low, high, key))
+        tree = saved_searches.IntervalTree(intervals)
+        for point in range(-10, 1010, 7):
+            self.assertEqual(sorted(tree.stab(point)), sorted(key for low, high, key in intervals if low <= point <= high))
+
+    def test_new_listings_matched(self):
+        cheap = self.save_search(
+            name='Cheap apartments', property_type_id=str(self.apartment.pk), property_status='for_rent',
+            min_price='500', max_price='1500')
+        self.save_search(bedrooms=4)
+        self.save_search(property_type_id=str(self.villa.pk), property_status='for_sale')
+        self.create_house('Apartment', self.apartment, 1000)
+        self.create_house('Expensive apartment', self.apartment, 5000)
+        self.create_house('Big house', None, 5000, bedrooms=4)
+        self.create_house('Villa for rent', self.villa, 1000)
+        self.create_house('Villa for sale', self.villa, 90000, property_status='for_sale')
+        House.objects.create(
+            title='Own listing', description='Nice house', price=1000, address='Main Street',
+            property_status='for_rent', property_type=self.apartment, created_by=self.tenant)
+
+        self.assertEqual(self.feed(), ['Villa for sale', 'Big house', 'Apartment'])
+        self.assertEqual(self.feed(search=cheap), ['Apartment'])
+        self.assertEqual(self.client.get(f'{self.url}feed/', {'search': 'nonsense'}).status_code, 400)
+
+    def test_changed_listings_matched_once(self):
+        self.save_search(max_price='1500')
+        house = self.create_house('Apartment', price=5000)
+        self.assertEqual(self.feed(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            house.price = 1200
+            house.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            house.title = 'Renovated apartment'
+            house.save()
+        self.assertEqual(self.feed(), ['Renovated apartment'])
+        self.assertEqual(SavedSearchMatch.objects.count(), 1)
+
+        House.objects.filter(pk=house.pk).update(status='sold')
+        self.assertEqual(self.feed(), [])
+
+    def test_matching_cost_independent_of_saved_searches(self):
+        users = User.objects.bulk_create([User(username=f'tenant{i}') for i in range(200)])
+        SavedSearch.objects.bulk_create([
+            SavedSearch(user=user, property_type=self.villa if i % 2 else self.apartment,
+                        min_price=i * 10, max_price=i * 10 + 100)
+            for i, user in enumerate(users)
+        ])
+        self.create_house('Warm-up', self.villa, 10 ** 6)
+        house = House.objects.create(
+            title='Apartment', description='Nice house', price=1050, address='Main Street',
+            property_status='for_rent', property_type=self.apartment, created_by=self.agent_user)
+        # The listing, the index's change check, the searches' ids and the insert.
+        with self.assertNumQueries(4):
+            self.assertEqual(saved_searches.match_houses([house.pk]), 5)
+
+    def test_searches_changed_elsewhere(self):
+        self.create_house('Warm-up')
+        other = User.objects.create(username='other')
+        search = SavedSearch.objects.create(user=other, max_price=2000)
+        self.create_house('Apartment')
+        self.assertEqual(SavedSearchMatch.objects.filter(search=search).count(), 1)
+
+        search.delete()
+        self.create_house('Another apartment')
+        self.assertEqual(SavedSearchMatch.objects.count(), 0)
+        self.assertEqual(len(saved_searches.get_index()), 0)
+
+    def test_saved_searches_are_private(self):
+        search = self.save_search(name='Mine')
+        self.assertEqual(self.client.post(self.url, {'min_price': 10, 'max_price': 5}, format='json').status_code, 400)
+        other = APIClient()
+        other.force_authenticate(self.agent_user)
+        self.assertEqual(other.get(self.url).data, [])
+        self.assertEqual(other.get(f'{self.url}{search}/').status_code, 404)
+        self.assertEqual(other.post(self.url, {'name': 'Agent search'}, format='json').status_code, 403)
+
+
+class InquiryTestCase(TestCase):
+    """
+    Two agents with a house each and inquiries about both, logged in as the first.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='agent', password='secret')
+        UserProfile.objects.create(user=self.user, role='agent')
+        self.agent = Agent.objects.create(user=self.user, name='Agent', phone='123')
+        other_user = User.objects.create(username='other')
+        self.other_agent = Agent.objects.create(user=other_user, name='Other', phone='456')
+        self.tenant = User.objects.create(username='tenant')
+        self.house = self.create_house(self.agent)
+        self.other_house = self.create_house(self.other_agent)
+        self.inquiries = [
+            PropertyInquiry.objects.create(tenant=self.tenant, house=self.house, message=f'Question {i}')
+            for i in range(5)
+        ]
+        for i, inquiry in enumerate(self.inquiries):
+            PropertyInquiry.objects.filter(pk=inquiry.pk).update(created_at=timezone.now() - timedelta(minutes=5 - i))
+        PropertyInquiry.objects.create(tenant=self.tenant, house=self.other_house, message='Elsewhere')
+        access = self.client.post('/api/users/token/', {'username': 'agent', 'password': 'secret'}).data['access']
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def create_house(self, agent):
+        return House.objects.create(
+            title=f'House of {agent.name}', description='Nice house', price=1000, address='Main Street',
+            property_status='for_rent', agent=agent, created_by=agent.user)
+
+    def counts(self, agent):
+        agent.refresh_from_db()
+        return agent.pending_inquiry_count, agent.responded_inquiry_count
+
+
+class InquiryInboxTests(InquiryTestCase):
+    """
+    Agents page through their inquiries by the denormalized agent, with
+    counters kept on the agent.
+    """
+
+    def test_agent_and_counters_maintained(self):
+        self.assertTrue(all(inquiry.agent_id == self.agent.pk for inquiry in self.inquiries))
+        self.assertEqual(self.counts(self.agent), (5, 0))
+
+        response = self.api.post(f'/api/properties/inquiries/{self.inquiries[0].pk}/respond/', {'response': 'Yes'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counts(self.agent), (4, 1))
+
+        self.inquiries[1].status = 'closed'
+        self.inquiries[1].save()
+        self.inquiries[2].delete()
+        self.assertEqual(self.counts(self.agent), (2, 1))
+
+        self.house.agent = self.other_agent
+        self.house.save()
+        self.assertEqual(self.counts(self.agent), (0, 0))
+        self.assertEqual(self.counts(self.other_agent), (3, 1))
+        self.assertEqual(PropertyInquiry.objects.filter(agent=self.other_agent).count(), 5)
+
+        Agent.objects.update(pending_inquiry_count=9, responded_inquiry_count=9)
+        call_command('recount_properties', stdout=StringIO())
+        self.assertEqual(self.counts(self.other_agent), (3, 1))
+
+    def test_inbox_pages(self):
+        seen = []
+        url = '/api/properties/inquiries/inbox/?page_size=2'
+        while url:
+            with self.assertNumQueries(2):
+                response = self.api.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['counts'], {'pending': 5, 'responded': 0})
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, [str(inquiry.pk) for inquiry in reversed(self.inquiries)])
+
+        row = response.data['results'][0]
+        self.assertEqual(row['house_title'], 'House of Agent')
+        self.assertEqual(row['tenant_username'], 'tenant')
+        self.assertNotIn('house', row)
+
+    def test_inbox_status_filter(self):
+        self.api.post(f'/api/properties/inquiries/{self.inquiries[0].pk}/respond/', {'response': 'Yes'})
+        response = self.api.get('/api/properties/inquiries/inbox/', {'status': 'responded'})
+        self.assertEqual([row['id'] for row in response.data['results']], [str(self.inquiries[0].pk)])
+        self.assertEqual(self.api.get('/api/properties/inquiries/inbox/', {'status': 'bogus'}).status_code, 400)
+
+    def test_inbox_uses_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN parsing is only implemented for SQLite')
+        for inquiry_status in (None, 'pending'):
+            plan = inbox_queryset(self.agent.pk, inquiry_status).order_by('-created_at', '-pk').explain()
+            self.assertIn('inquiry_agent_', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+
+class BulkInquiryTests(InquiryTestCase):
+    """
+    Agents respond to or close many inquiries with one ownership query and one UPDATE.
+    """
+
+    def test_bulk_respond(self):
+        foreign = PropertyInquiry.objects.get(agent=self.other_agent)
+        ids = [str(inquiry.pk) for inquiry in self.inquiries[:3]]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.post('/api/properties/inquiries/bulk_respond/', {
+                'ids': ids + [str(foreign.pk), 'nonsense', '00000000-0000-0000-0000-000000000000'],
+                'response': 'Still available',
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 3)
+        self.assertEqual(response.data['results'], {
+            **{pk: 'responded' for pk in ids},
+            str(foreign.pk): 'forbidden',
+            'nonsense': 'not_found',
+            '00000000-0000-0000-0000-000000000000': 'not_found',
+        })
+        self.assertEqual(response.data['counts'], {'pending': 2, 'responded': 3})
+        inquiry_updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "realestate_propertyinquiry"')]
+        self.assertEqual(len(inquiry_updates), 1)
+        self.assertEqual(
+            set(PropertyInquiry.objects.filter(response='Still available').values_list('pk', flat=True)),
+            {inquiry.pk for inquiry in self.inquiries[:3]})
+        self.assertEqual(PropertyInquiry.objects.get(pk=foreign.pk).status, 'pending')
+
+    def test_bulk_close(self):
+        ids = [str(inquiry.pk) for inquiry in self.inquiries[:2]]
+        self.api.post('/api/properties/inquiries/bulk_respond/', {'ids': ids[:1], 'response': 'Yes'}, format='json')
+        response = self.api.post('/api/properties/inquiries/bulk_close/', {'ids': ids}, format='json')
+        self.assertEqual(response.data['results'], {pk: 'closed' for pk in ids})
+        self.assertEqual(response.data['counts'], {'pending': 3, 'responded': 0})
+        response = self.api.post('/api/properties/inquiries/bulk_close/', {'ids': ids}, format='json')
+        self.assertEqual(response.data['results'], {pk: 'unchanged' for pk in ids})
+
+        call_command('recount_properties', stdout=StringIO())
+        self.assertEqual(self.counts(self.agent), (3, 0))
+
+    def test_bulk_validation(self):
+        url = '/api/properties/inquiries/bulk_close/'
+        self.assertEqual(self.api.post(url, {'ids': []}, format='json').status_code, 400)
+        self.assertEqual(self.api.post(url, {'ids': 'x'}, format='json').status_code, 400)
+        response = self.api.post('/api/properties/inquiries/bulk_respond/',
+                                 {'ids': [str(self.inquiries[0].pk)]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        tenant = APIClient()
+        tenant.force_authenticate(self.tenant)
+        self.assertEqual(tenant.post(url, {'ids': [str(self.inquiries[0].pk)]}, format='json').status_code, 403)
+
+
+class InquiryEventTests(InquiryTestCase):
+    """
+    Inquiry changes are pushed to the agent and tenant over Server-Sent Events.
+    """
+    url = '/api/properties/inquiries/events/'
+
+    def setUp(self):
+        super().setUp()
+        reset_broker()
+        self.tenant.set_password('secret')
+        self.tenant.save()
+        UserProfile.objects.create(user=self.tenant, role='tenant')
+        self.tokens = {
+            username: self.client.post('/api/users/token/', {'username': username, 'password': 'secret'}).data['access']
+            for username in ('agent', 'tenant')
+        }
+
+    def ticket(self, username):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.tokens[username]}')
+        response = client.post('/api/properties/inquiries/events/ticket/')
+        self.assertEqual(response.status_code, 200)
+        return response.data['ticket']
+
+    async def open_stream(self, username, headers=None):
+        ticket = await sync_to_async(self.ticket)(username)
+        response = await self.async_client.get(self.url, {'ticket': ticket}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+        return stream
+
+    async def next_event(self, stream):
+        chunk = (await asyncio.wait_for(anext(stream), 5)).decode()
+        fields = dict(line.split(': ', 1) for line in chunk.strip().splitlines())
+        return fields['event'], json.loads(fields['data'])
+
+    def create_inquiry(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return PropertyInquiry.objects.create(tenant=self.tenant, house=self.house, message='Parking?')
+
+    def respond(self, inquiry):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.api.post(f'/api/properties/inquiries/{inquiry.pk}/respond/', {'response': 'Yes'})
+
+    async def test_agent_and_tenant_notified(self):
+        agent_stream = await self.open_stream('agent')
+        tenant_stream = await self.open_stream('tenant')
+
+        inquiry = await sync_to_async(self.create_inquiry)()
+        expected = {'id': str(inquiry.pk), 'house_id': str(self.house.pk), 'status': 'pending'}
+        self.assertEqual(await self.next_event(agent_stream), ('inquiry.created', expected))
+        self.assertEqual(await self.next_event(tenant_stream), ('inquiry.created', expected))
+
+        await sync_to_async(self.respond)(inquiry)
+        for stream in (agent_stream, tenant_stream):
+            self.assertEqual(await self.next_event(stream), ('inquiry.responded', {**expected, 'status': 'responded'}))
+
+        # A client disconnecting cancels the stream, which unsubscribes it.
+        for stream in (agent_stream, tenant_stream):
+            read = asyncio.ensure_future(anext(stream))
+            await asyncio.sleep(0.01)
+            read.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await read
+        self.assertEqual(get_broker().subscriber_count(), 0)
+
+    async def test_bulk_changes_notified(self):
+        stream = await self.open_stream('tenant')
+        ids = [str(inquiry.pk) for inquiry in self.inquiries[:2]]
+
+        def close():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.api.post('/api/properties/inquiries/bulk_close/', {'ids': ids}, format='json')
+
+        await sync_to_async(close)()
+        events = [await self.next_event(stream) for _ in ids]
+        self.assertEqual(sorted((kind, data['id']) for kind, data in events),
+                         sorted(('inquiry.closed', pk) for pk in ids))
+        await stream.aclose()
+
+    @override_settings(EVENTS_HEARTBEAT=0.01)
+    async def test_heartbeat_and_resync(self):
+        stream = await self.open_stream('agent', headers={'Last-Event-ID': '7'})
+        self.assertEqual((await self.next_event(stream))[0], 'resync')
+        self.assertEqual(await anext(stream), b': heartbeat\n\n')
+        await stream.aclose()
+
+    async def test_slow_clients_get_resync(self):
+        broker = LocalBroker()
+        subscription = broker.subscribe(['agent:1'], queue_size=2)
+        for i in range(4):
+            await asyncio.to_thread(broker.publish, ['agent:1', 'agent:2'], {'type': 'inquiry.created', 'id': i})
+        await asyncio.sleep(0)
+        # The backlog was dropped for a single resync when the queue overflowed.
+        self.assertIs(await subscription.get(1), RESYNC)
+        self.assertEqual(await subscription.get(1), {'type': 'inquiry.created', 'id': 3})
+        self.assertEqual(subscription.dropped, 2)
+        broker.unsubscribe(subscription)
+        self.assertEqual(broker.subscriber_count(), 0)
+
+    async def test_authentication_required(self):
+        self.assertEqual((await self.async_client.get(self.url)).status_code, 401)
+        # Access tokens are not accepted in the URL, where they would be logged.
+        self.assertEqual((await self.async_client.get(self.url, {'token': self.tokens['tenant']})).status_code, 401)
+        self.assertEqual((await self.async_client.get(self.url, {'ticket': 'nonsense'})).status_code, 401)
+
+        # Tickets are single use.
+        ticket = await sync_to_async(self.ticket)('tenant')
+        response = await self.async_client.get(self.url, {'ticket': ticket})
+        self.assertEqual(response.status_code, 200)
+        await aiter(response.streaming_content).aclose()
+        self.assertEqual((await self.async_client.get(self.url, {'ticket': ticket})).status_code, 401)
+
+        # A ticket does not outlive the revocation of its token.
+        ticket = await sync_to_async(self.ticket)('tenant')
+        await UserProfile.objects.filter(user=self.tenant).aupdate(role='agent', token_version=1)
+        await sync_to_async(cache.clear)()
+        self.assertEqual((await self.async_client.get(self.url, {'ticket': ticket})).status_code, 401)
+
+    def test_ticket_requires_token(self):
+        client = APIClient()
+        self.assertEqual(client.post('/api/properties/inquiries/events/ticket/').status_code, 401)
+        client.force_authenticate(self.tenant)
+        self.assertEqual(client.post('/api/properties/inquiries/events/ticket/').status_code, 400)
+
+    def test_several_workers_need_shared_state(self):
+        check_worker_setup()
+        with self.settings(WEB_CONCURRENCY=2), self.assertRaisesMessage(ImproperlyConfigured, 'RedisBroker'):
+            check_worker_setup()
+        with self.settings(WEB_CONCURRENCY=2, EVENTS_BROKER='realestate.events.RedisBroker'):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'local memory'):
+                check_worker_setup()
+            with self.settings(CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempfile.gettempdir()}}):
+                check_worker_setup()
+
+    def test_refused_under_wsgi(self):
+        response = self.client.get(self.url, {'ticket': self.ticket('tenant')})
+        self.assertEqual(response.status_code, 501)
+
+    async def test_redis_broker_relays_between_workers(self):
+        class Bus:
+            def __init__(self):
+                self.messages = []
+
+            def publish(self, channel, data):
+                self.messages.append((channel, data))
+
+        bus = Bus()
+        sender, receiver = RedisBroker(client=bus), RedisBroker(client=bus)
+        # Subscribe without starting the listener thread, which needs a server.
+        receiver.listener = True
+        subscription = receiver.subscribe(['agent:1'], queue_size=5)
+        sender.publish(['agent:1', 'tenant:2'], {'type': 'inquiry.created', 'id': '7'})
+        self.assertEqual([channel for channel, _ in bus.messages], ['inquiry-events'])
+        for _, data in bus.messages:
+            await asyncio.to_thread(receiver.receive, data)
+        self.assertEqual(await subscription.get(1), {'type': 'inquiry.created', 'id': '7'})
+        await asyncio.to_thread(receiver.broadcast, RESYNC)
+        self.assertIs(await subscription.get(1), RESYNC)
+        receiver.unsubscribe(subscription)
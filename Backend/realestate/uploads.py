@@ -0,0 +1,201 @@
+"""
+Streaming ingestion of property photos.
+
+Multipart uploads are written to temporary files chunk by chunk by
+ImageUploadHandler, which checks the image header as the first chunks
+arrive, so memory use stays at one chunk per request however large the
+photos are and a non-image is rejected without reading it into memory.
+
+Resumable uploads follow the tus protocol loosely: the client declares the
+length of a file, then appends to it with PATCH requests carrying the
+offset they start at. A dropped connection only loses the chunk in flight;
+the client asks for the current offset and carries on from there.
+"""
+import os
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image, ImageFile
+
+from .cache import touch_listings
+from .images import enqueue_images
+from .models import House, PropertyImage
+from .blobs import adjust_blob_references, blob_names
+
+ALLOWED_IMAGE_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF'}
+
+# Image headers (including EXIF, ICC and XMP segments) must fit in this many bytes.
+MAX_HEADER_BYTES = 1024 * 1024
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ImageHeaderValidator:
+    """
+    Incremental image validator fed with consecutive chunks of a file.
+
+    Stops looking at the data as soon as Pillow has parsed the header, so
+    only the first few kilobytes of a valid image are ever inspected.
+    """
+
+    def __init__(self):
+        self.parser = ImageFile.Parser()
+        self.bytes_seen = 0
+        self.format = None
+        self.size = None
+        self.error = None
+
+    @property
+    def done(self):
+        return self.format is not None or self.error is not None
+
+    def feed(self, chunk):
+        if self.done:
+            return
+        self.bytes_seen += len(chunk)
+        try:
+            self.parser.feed(chunk)
+        except Exception:
+            self.parser = None
+            self.error = 'Upload a valid image. The file you uploaded was either not an image or a corrupted image.'
+            return
+
+        image = self.parser.image
+        if image is None:
+            if self.bytes_seen > MAX_HEADER_BYTES:
+                self.error = 'Upload a valid image. The image header could not be read.'
+            return
+        if image.format not in ALLOWED_IMAGE_FORMATS:
+            self.error = f'Unsupported image format {image.format}.'
+        elif image.width * image.height > (Image.MAX_IMAGE_PIXELS or float('inf')):
+            self.error = 'Image dimensions are too large.'
+        else:
+            self.format, self.size = image.format, image.size
+        # The header is all that is needed; drop the decoder state.
+        self.parser = None
+
+    def finish(self):
+        """
+        Raise ValidationError unless a valid image header was seen.
+        """
+        if self.error is None and self.format is None:
+            self.error = 'Upload a valid image. The file is empty or truncated.'
+        if self.error:
+            raise ValidationError(self.error, code='invalid_image')
+
+
+def validate_image_file(file):
+    """
+    Validate an uploaded file's image header, using the result recorded by
+    ImageUploadHandler when available and reading the file in chunks otherwise.
+    """
+    validator = getattr(file, 'image_validator', None)
+    if validator is None:
+        validator = ImageHeaderValidator()
+        for chunk in file.chunks(CHUNK_SIZE):
+            validator.feed(chunk)
+            if validator.done:
+                break
+        file.seek(0)
+    validator.finish()
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Upload handler streaming every file to a temporary file on disk and
+    validating its image header from the first chunks. Once a file is known
+    not to be an image the rest of it is discarded instead of written.
+    """
+    chunk_size = CHUNK_SIZE
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.validator = ImageHeaderValidator()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.validator.feed(raw_data)
+        if self.validator.error is None:
+            self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.image_validator = self.validator
+        return file
+
+
+def add_images(house, files):
+    """
+    Attach the uploaded files to a house with a single bulk insert and queue
+    them for processing.
+
+    bulk_create does not send post_save, so the work normally done by the
+    PropertyImage signal handlers is done here once for the whole batch.
+    """
+    images = PropertyImage.objects.bulk_create([PropertyImage(house=house, image=file) for file in files])
+    if images:
+        adjust_blob_references([name for image in images for name in blob_names(image)], 1)
+        enqueue_images(images)
+        touch_listings(House.objects.filter(pk=house.pk))
+    return images
+
+
+def upload_directory():
+    return getattr(settings, 'RESUMABLE_UPLOAD_DIR', os.path.join(settings.BASE_DIR, 'uploads'))
+
+
+def upload_path(upload):
+    return os.path.join(upload_directory(), str(upload.pk))
+
+
+def append_chunks(upload, stream):
+    """
+    Append the request body to a resumable upload, chunk by chunk, and
+    return the new offset. Bytes past the declared length are rejected.
+    """
+    os.makedirs(upload_directory(), exist_ok=True)
+    path = upload_path(upload)
+    offset = upload.offset
+    validator = ImageHeaderValidator() if offset == 0 else None
+
+    with open(path, 'r+b' if offset else 'wb') as target:
+        target.seek(offset)
+        target.truncate()
+        while True:
+            try:
+                chunk = stream.read(CHUNK_SIZE)
+            except OSError:
+                # The client went away; keep what arrived so it can resume.
+                break
+            if not chunk:
+                break
+            if offset + len(chunk) > upload.length:
+                raise ValidationError('Upload exceeds the declared length.', code='too_long')
+            if validator is not None:
+                validator.feed(chunk)
+                if validator.error:
+                    validator.finish()
+            target.write(chunk)
+            offset += len(chunk)
+    return offset
+
+
+def complete_upload(upload):
+    """
+    Validate a fully received upload and turn it into a PropertyImage.
+    """
+    path = upload_path(upload)
+    with open(path, 'rb') as source:
+        file = File(source, name=upload.filename)
+        validate_image_file(file)
+        image = add_images(upload.house, [file])[0]
+    discard_upload(upload)
+    return image
+
+
+def discard_upload(upload):
+    try:
+        os.remove(upload_path(upload))
+    except FileNotFoundError:
+        pass
@@ -1,17 +1,44 @@
 from django.shortcuts import render
-from rest_framework import viewsets, permissions, filters, serializers
+from rest_framework import viewsets, mixins, permissions, filters, serializers
 from rest_framework.decorators import action
+from rest_framework.exceptions import AuthenticationFailed, NotFound
 from rest_framework.response import Response
+from django.conf import settings
 from django.contrib.auth.models import User
-from .models import House, PropertyType, Feature, PropertyImage, Agent, UserProfile, Favorite, PropertyInquiry
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max, Prefetch, Sum
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+import hashlib
+import uuid
+from .models import (House, PropertyType, Feature, PropertyImage, ImageUpload, Agent, UserProfile, Favorite, PropertyInquiry,
+                     SavedSearch)
+from .authentication import RoleRefreshToken, get_agent_id, get_role
+from .principals import principal_cache_stats
+from .cache import fragment_cache_stats, render_listings, representation_variant
+from .engagement import record_engagement
+from .events import issue_ticket
+from .facets import listing_facets
+from .inquiries import MAX_BULK_IDS, bulk_update_inquiries, inbox_counts, inbox_queryset
+from .geo import bbox_q, cluster_listings, filter_near, parse_bbox, parse_point
+from .pagination import ListingCursorPagination
+from .recommendations import DEFAULT_LIMIT, MAX_LIMIT, recommended_house_ids
+from .saved_searches import MAX_SAVED_SEARCHES, feed_queryset
+from .similar import neighbour_count, similar_houses
+from .search import search_houses
+from .suggest import DEFAULT_LIMIT as DEFAULT_SUGGESTIONS, MAX_LIMIT as MAX_SUGGESTIONS, suggest
+from .sync import listing_changes
+from .uploads import ImageUploadHandler, append_chunks, complete_upload, discard_upload
 from .serializers import (
-    HouseSerializer, PropertyTypeSerializer, FeatureSerializer, PropertyImageSerializer, AgentSerializer, UserSerializer, UserProfileSerializer, FavoriteSerializer, RegisterSerializer, PropertyInquirySerializer
+    SparseFieldsetMixin, HouseSerializer, HouseListSerializer, PropertyTypeSerializer, FeatureSerializer, PropertyImageSerializer, ImageUploadSerializer, AgentSerializer, UserSerializer, UserProfileSerializer, FavoriteSerializer, RegisterSerializer, PropertyInquirySerializer,
+    InquiryInboxSerializer, SavedSearchSerializer, SavedSearchMatchSerializer
 )
 from rest_framework import status
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.views import TokenObtainPairView
-from .serializers import TenantTokenObtainPairSerializer, AgentTokenObtainPairSerializer, AutoDetectRoleTokenObtainPairSerializer
+from rest_framework_simplejwt.tokens import Token
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from .serializers import (TenantTokenObtainPairSerializer, AgentTokenObtainPairSerializer, AutoDetectRoleTokenObtainPairSerializer,
+                          VersionedTokenRefreshSerializer)
 
 # Custom permission classes
 class IsTenant(permissions.BasePermission):
@@ -19,39 +46,161 @@ class IsTenant(permissions.BasePermission):
     Custom permission to only allow tenants to access a view.
     """
     def has_permission(self, request, view):
-        return hasattr(request.user, 'profile') and request.user.profile.role == 'tenant'
+        return get_role(request.user) == 'tenant'
 
 class IsAgent(permissions.BasePermission):
     """
     Custom permission to only allow agents to access a view.
     """
     def has_permission(self, request, view):
-        return hasattr(request.user, 'profile') and request.user.profile.role == 'agent'
+        return get_role(request.user) == 'agent'
 
-class HouseViewSet(viewsets.ModelViewSet):
+class SparseFieldsetViewMixin:
+    """
+    Viewset mixin passing the comma-separated `fields` and `expand` query
+    parameters of read requests to serializers using SparseFieldsetMixin.
+    """
+
+    def get_fieldset_kwargs(self):
+        if self.request is None or self.request.method not in permissions.SAFE_METHODS:
+            return {}
+        kwargs = {}
+        for param in ('fields', 'expand'):
+            value = self.request.query_params.get(param)
+            if value:
+                kwargs[param] = [name.strip() for name in value.split(',') if name.strip()]
+        return kwargs
+
+    def get_serializer(self, *args, **kwargs):
+        if issubclass(self.get_serializer_class(), SparseFieldsetMixin):
+            for key, value in self.get_fieldset_kwargs().items():
+                kwargs.setdefault(key, value)
+        return super().get_serializer(*args, **kwargs)
+
+
+class ConditionalRequestMixin:
+    """
+    Viewset mixin adding ETag and Last-Modified validators to list and
+    retrieve, and answering conditional requests with 304 Not Modified.
+
+    Validators are computed from `last_modified_field`, and the fields
+    returned by get_modified_fields() for related rows rendered with each
+    object, with a single aggregate query (latest modification time and row
+    count, so deletions change the ETag too) without serializing the body.
+    get_validator_aggregates() adds values the ETag depends on for state
+    that changes without touching those fields. `cache_control` maps
+    actions to Cache-Control directives.
+    """
+    last_modified_field = 'updated_at'
+    cache_control = {}
+
+    def get_modified_fields(self):
+        return [self.last_modified_field]
+
+    def get_validator_aggregates(self):
+        return {}
+
+    def get_validators(self):
+        """
+        Return (last_modified, etag) for the current list or retrieve request,
+        or None if the object does not exist.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            try:
+                queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+            except (TypeError, ValueError, ValidationError):
+                return None
+        fields = self.get_modified_fields()
+        extra = {f'extra_{name}': aggregate for name, aggregate in self.get_validator_aggregates().items()}
+        state = queryset.aggregate(
+            count=Count('pk'), **{f'modified_{i}': Max(field) for i, field in enumerate(fields)}, **extra)
+        if self.action == 'retrieve' and not state['count']:
+            return None
+
+        modified = [state[f'modified_{i}'] for i in range(len(fields))]
+        last_modified = max(filter(None, modified), default=None)
+        basis = ':'.join([
+            self.action,
+            str(state['count']),
+            *(value.isoformat() if value else '' for value in modified),
+            *(str(state[name]) for name in extra),
+            self.request.get_full_path(),
+            representation_variant(self),
+        ])
+        return last_modified, quote_etag(hashlib.md5(basis.encode()).hexdigest())
+
+    def conditional_response(self, render):
+        """
+        Return 304 Not Modified if the client's validators are current,
+        otherwise the response produced by render() with validators attached.
+        """
+        validators = self.get_validators()
+        response = None
+        if validators is not None:
+            last_modified, etag = validators
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+            response = get_conditional_response(self.request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = render()
+        if validators is not None and response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(timestamp)
+        if self.action in self.cache_control:
+            patch_cache_control(response, **self.cache_control[self.action])
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(lambda: super(ConditionalRequestMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            lambda: super(ConditionalRequestMixin, self).retrieve(request, *args, **kwargs))
+
+
+# Default and largest radius of `near` listing searches, in kilometres.
+DEFAULT_RADIUS_KM = 5
+MAX_RADIUS_KM = 200
+
+
+class HouseViewSet(ConditionalRequestMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing properties.
 
     Provides CRUD operations for properties with filtering capabilities.
     Automatically assigns the agent when an agent creates a property.
     """
-    queryset = House.objects.all().order_by('-created_at')
+    queryset = House.objects.order_by('-created_at')
     serializer_class = HouseSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['title', 'address', 'location', 'description']
-    ordering_fields = ['price', 'created_at', 'bedrooms', 'bathrooms', 'area']
+    pagination_class = ListingCursorPagination
+    cache_control = {
+        'list': {'public': True, 'max_age': 30},
+        'retrieve': {'public': True, 'max_age': 60},
+    }
+    filter_backends = [filters.OrderingFilter]
+    ordering_fields = ['price', 'created_at', 'bedrooms', 'bathrooms', 'area', 'popularity']
 
     def get_permissions(self):
         """
-        Allow anyone to list and retrieve properties.
-        Only agents can create, update, and delete properties.
+        Allow anyone to list, retrieve and sync properties and read their
+        facet counts, map clusters, search suggestions and similar properties. Only agents can create, update, and delete properties,
+        and only staff can read the cache statistics.
         """
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'facets', 'changes', 'similar', 'clusters', 'suggest']:
             return [permissions.AllowAny()]
         elif self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [permissions.IsAuthenticated(), IsAgent()]
+        elif self.action == 'cache_stats':
+            return [permissions.IsAdminUser()]
         return [permissions.IsAuthenticated()]
 
+    def initialize_request(self, request, *args, **kwargs):
+        # Stream photo uploads to disk, validating image headers on the way in.
+        request.upload_handlers = [ImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         """
         Set the created_by field to the current user.
@@ -61,11 +210,11 @@ class HouseViewSet(viewsets.ModelViewSet):
         user = self.request.user
         uploaded_images = self.request.FILES.getlist('uploaded_images')
         try:
-            if hasattr(user, 'profile') and user.profile.role == 'agent':
-                try:
-                    agent = Agent.objects.get(user=user)
-                    instance = serializer.save(created_by=user, agent=agent, uploaded_images=uploaded_images)
-                except Agent.DoesNotExist:
+            if get_role(user) == 'agent':
+                agent_id = get_agent_id(user)
+                if agent_id:
+                    instance = serializer.save(created_by=user, agent_id=agent_id, uploaded_images=uploaded_images)
+                else:
                     import logging
                     logger = logging.getLogger(__name__)
                     logger.error(f"User {user.username} has agent role but no agent profile")
@@ -78,11 +227,53 @@ class HouseViewSet(viewsets.ModelViewSet):
             logger.error(f"Error creating property: {str(e)}")
             raise
 
+    def get_modified_fields(self):
+        """
+        Listings rendering their agent also change when the agent does.
+        """
+        fields = super().get_modified_fields()
+        if 'agent' in self.get_serializer().fields:
+            fields.append('agent__updated_at')
+        return fields
+
+    def get_validator_aggregates(self):
+        """
+        Engagement flushes reorder listings by popularity without touching
+        updated_at, so lists in that order also depend on its total.
+        """
+        ordering = self.request.query_params.get('ordering', '')
+        if self.action == 'list' and (
+                ordering == 'popular' or 'popularity' in {field.strip().lstrip('-') for field in ordering.split(',')}):
+            return {'popularity': Sum('popularity')}
+        return {}
+
+    def get_serializer_class(self):
+        """
+        Use the compact card representation for the listing and sync endpoints.
+        """
+        if self.action in ['list', 'changes', 'similar']:
+            return HouseListSerializer
+        return super().get_serializer_class()
+
+    def with_eager_loading(self, queryset):
+        """
+        Load only the relations rendered by the serializer for this request.
+        """
+        return queryset.prefetch_related(*self.get_serializer().get_prefetch_lookups())
+
     def get_queryset(self):
         """
         Filter properties based on query parameters.
+
+        list and retrieve render through the fragment cache, which loads
+        relations only for the listings that are not cached.
         """
         queryset = super().get_queryset()
+        if self.action not in ['list', 'retrieve']:
+            queryset = self.with_eager_loading(queryset)
+        elif 'agent' in self.get_serializer().fields:
+            # The agent's version keys its cached fragment (see render_listings).
+            queryset = queryset.select_related('agent')
         property_type = self.request.query_params.get('property_type')
         min_price = self.request.query_params.get('min_price')
         max_price = self.request.query_params.get('max_price')
@@ -91,6 +282,8 @@ class HouseViewSet(viewsets.ModelViewSet):
         search = self.request.query_params.get('search')
         property_status = self.request.query_params.get('property_status')
         agent_id = self.request.query_params.get('agent_id')
+        bbox = self.request.query_params.get('bbox')
+        near = self.request.query_params.get('near')
 
         if property_type:
             queryset = queryset.filter(property_type_id=property_type)
@@ -103,20 +296,148 @@ class HouseViewSet(viewsets.ModelViewSet):
         if bathrooms:
             queryset = queryset.filter(bathrooms__gte=bathrooms)
         if search:
-            queryset = queryset.filter(title__icontains=search)
+            # Ranked full-text search over title, address, location and description
+            queryset = search_houses(queryset, search)
         if property_status:
             queryset = queryset.filter(property_status=property_status)
         if agent_id:
             queryset = queryset.filter(agent_id=agent_id)
+        if bbox and self.action != 'clusters':
+            queryset = queryset.filter(bbox_q(self.get_bbox()))
+        if near:
+            try:
+                latitude, longitude = parse_point(near)
+                radius = float(self.request.query_params.get('radius', DEFAULT_RADIUS_KM))
+            except ValueError:
+                raise serializers.ValidationError({'near': 'Expected near=lat,lng and radius in kilometres.'})
+            if not 0 < radius <= MAX_RADIUS_KM:
+                raise serializers.ValidationError({'radius': f'Radius must be between 0 and {MAX_RADIUS_KM} km.'})
+            queryset = filter_near(queryset, latitude, longitude, radius)
+        if self.request.query_params.get('ordering') == 'popular':
+            # Most popular first, an index scan on (popularity, id).
+            queryset = queryset.order_by('-popularity')
 
         return queryset
 
+    def get_bbox(self):
+        try:
+            return parse_bbox(self.request.query_params.get('bbox', ''))
+        except ValueError:
+            raise serializers.ValidationError({'bbox': 'Expected bbox=min_lng,min_lat,max_lng,max_lat.'})
+
+    def list(self, request, *args, **kwargs):
+        """
+        List properties, assembling the page from cached per-listing fragments.
+        """
+        def render():
+            queryset = self.filter_queryset(self.get_queryset())
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                return self.get_paginated_response(render_listings(self, page))
+            return Response(render_listings(self, list(queryset)))
+
+        return self.conditional_response(render)
+
+    def retrieve(self, request, *args, **kwargs):
+        def render():
+            instance = self.get_object()
+            return Response(render_listings(self, [instance])[0])
+
+        response = self.conditional_response(render)
+        if response.status_code in (200, 304):
+            record_engagement(kwargs['pk'], 'view')
+        return response
+
+    @action(detail=False, methods=['get'])
+    def cache_stats(self, request):
+        """
+        Return hit/miss counters of the listing fragment cache (staff only).
+        """
+        return Response(fragment_cache_stats())
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """
+        Return listing counts per property type, status, bedroom and bathroom
+        bucket and price band for the current filters, in a single query.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(listing_facets(queryset))
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """
+        Return the listings created, updated or deleted since the `since`
+        sync token, oldest change first. Without a token every listing is
+        returned. Follow `next` while `has_more` is true, then keep it for
+        the next sync.
+        """
+        page_size = self.paginator.get_page_size(request)
+        changes = listing_changes(request.query_params.get('since'), page_size)
+        return Response({
+            'next': changes['next'],
+            'has_more': changes['has_more'],
+            'results': render_listings(self, changes['houses']),
+            'deleted': changes['deleted'],
+        })
+
+    @action(detail=False, methods=['get'])
+    def clusters(self, request):
+        """
+        Return map markers for the `bbox` viewport at the `zoom` level (0-20):
+        listings matching the current filters grouped into geohash cells,
+        with at most 256 clusters per response.
+        """
+        try:
+            zoom = min(max(int(request.query_params.get('zoom', 12)), 0), 20)
+        except ValueError:
+            raise serializers.ValidationError({'zoom': 'Expected an integer zoom level.'})
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(cluster_listings(queryset, self.get_bbox(), zoom))
+
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        """
+        Return completions of `q` among listing locations, addresses and
+        property types, the most common first, from the in-memory prefix
+        index (`?limit=` up to 20).
+        """
+        try:
+            limit = min(max(int(request.query_params.get('limit', DEFAULT_SUGGESTIONS)), 1), MAX_SUGGESTIONS)
+        except ValueError:
+            limit = DEFAULT_SUGGESTIONS
+        response = Response(suggest(request.query_params.get('q', ''), limit))
+        patch_cache_control(response, public=True, max_age=30)
+        return response
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """
+        Return the properties most similar to this one, closest first, from
+        the precomputed neighbour table (`?limit=` up to SIMILAR_LISTINGS_COUNT).
+        """
+        try:
+            limit = min(max(int(request.query_params.get('limit', neighbour_count())), 1), neighbour_count())
+        except ValueError:
+            limit = neighbour_count()
+        try:
+            houses = list(similar_houses(pk, limit))
+        except ValidationError:
+            raise NotFound()
+        if not houses and not House.objects.filter(pk=pk).exists():
+            raise NotFound()
+        return Response(render_listings(self, houses))
+
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
     def my_properties(self, request):
         """
         Return properties created by the current user.
         """
-        houses = House.objects.filter(created_by=request.user)
+        houses = self.with_eager_loading(House.objects.filter(created_by=request.user))
+        page = self.paginate_queryset(houses)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
         serializer = self.get_serializer(houses, many=True)
         return Response(serializer.data)
 
@@ -132,34 +453,42 @@ class HouseViewSet(viewsets.ModelViewSet):
 
         try:
             # Check if user has a profile and is an agent
-            if not hasattr(user, 'profile'):
+            role = get_role(user)
+            if role is None:
                 logger.warning(f"User {user.username} attempted to access agent properties but has no profile")
                 return Response(
                     {"detail": "You do not have a user profile."},
                     status=status.HTTP_403_FORBIDDEN
                 )
 
-            if user.profile.role != 'agent':
-                logger.warning(f"User {user.username} attempted to access agent properties but is not an agent (role: {user.profile.role})")
+            if role != 'agent':
+                logger.warning(f"User {user.username} attempted to access agent properties but is not an agent (role: {role})")
                 return Response(
                     {"detail": "You must have an agent role to access agent properties."},
                     status=status.HTTP_403_FORBIDDEN
                 )
 
-            # Auto-create agent profile if missing
-            from .models import Agent
-            agent, created = Agent.objects.get_or_create(
-                user=user,
-                defaults={
-                    'name': f"{user.first_name} {user.last_name}".strip() or user.username,
-                    'phone': getattr(user.profile, 'phone_number', '') or ''
-                }
-            )
-            if created:
-                logger.info(f"Auto-created agent profile for user {user.username}")
+            agent_id = get_agent_id(user)
+            if agent_id is None:
+                # Auto-create agent profile if missing
+                user = User.objects.select_related('profile').get(pk=user.pk)
+                agent, created = Agent.objects.get_or_create(
+                    user=user,
+                    defaults={
+                        'name': f"{user.first_name} {user.last_name}".strip() or user.username,
+                        'phone': getattr(user.profile, 'phone_number', '') or ''
+                    }
+                )
+                if created:
+                    logger.info(f"Auto-created agent profile for user {user.username}")
+                agent_id = agent.pk
 
             # Get the properties and return them
-            houses = House.objects.filter(agent=agent)
+            houses = self.with_eager_loading(House.objects.filter(agent_id=agent_id))
+            page = self.paginate_queryset(houses)
+            if page is not None:
+                serializer = self.get_serializer(page, many=True)
+                return self.get_paginated_response(serializer.data)
             serializer = self.get_serializer(houses, many=True)
             return Response(serializer.data)
 
@@ -171,7 +500,7 @@ class HouseViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class PropertyTypeViewSet(viewsets.ModelViewSet):
+class PropertyTypeViewSet(ConditionalRequestMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing property types.
 
@@ -180,6 +509,10 @@ class PropertyTypeViewSet(viewsets.ModelViewSet):
     """
     queryset = PropertyType.objects.all()
     serializer_class = PropertyTypeSerializer
+    cache_control = {
+        'list': {'public': True, 'max_age': 3600},
+        'retrieve': {'public': True, 'max_age': 3600},
+    }
 
     def get_permissions(self):
         """
@@ -192,7 +525,7 @@ class PropertyTypeViewSet(viewsets.ModelViewSet):
             return [permissions.IsAuthenticated(), IsAgent()]
         return [permissions.IsAuthenticated()]
 
-class FeatureViewSet(viewsets.ModelViewSet):
+class FeatureViewSet(ConditionalRequestMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing property features.
 
@@ -201,6 +534,10 @@ class FeatureViewSet(viewsets.ModelViewSet):
     """
     queryset = Feature.objects.all()
     serializer_class = FeatureSerializer
+    cache_control = {
+        'list': {'public': True, 'max_age': 3600},
+        'retrieve': {'public': True, 'max_age': 3600},
+    }
 
     def get_permissions(self):
         """
@@ -213,7 +550,7 @@ class FeatureViewSet(viewsets.ModelViewSet):
             return [permissions.IsAuthenticated(), IsAgent()]
         return [permissions.IsAuthenticated()]
 
-class PropertyImageViewSet(viewsets.ModelViewSet):
+class PropertyImageViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing property images.
 
@@ -298,13 +635,85 @@ class PropertyImageViewSet(viewsets.ModelViewSet):
                 "detail": "An error occurred while uploading the image. Please try again later."
             })
 
-class AgentViewSet(viewsets.ModelViewSet):
+class ImageUploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin,
+                         viewsets.GenericViewSet):
+    """
+    API endpoint for resumable property image uploads.
+
+    POST declares an upload with house_id, filename and length. PATCH
+    appends the raw request body (Content-Type: application/offset+octet-stream)
+    at the offset given in the Upload-Offset header. After a dropped
+    connection, GET or HEAD returns the offset to resume from. The PATCH that
+    completes the file creates the property image.
+    """
+    serializer_class = ImageUploadSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAgent]
+    http_method_names = ['get', 'post', 'patch', 'delete', 'head', 'options']
+
+    def get_queryset(self):
+        return ImageUpload.objects.filter(uploaded_by=self.request.user).select_related('house', 'image')
+
+    def offset_response(self, upload, status_code=status.HTTP_200_OK):
+        response = Response(self.get_serializer(upload).data, status=status_code)
+        response['Upload-Offset'] = str(upload.offset)
+        return response
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        house = serializer.validated_data['house']
+        user = request.user
+        if not (house.created_by_id == user.pk or (house.agent_id and house.agent.user_id == user.pk)):
+            raise serializers.ValidationError({
+                "permission": "You don't have permission to add images to this property. "
+                             "Only the property creator or the associated agent can add images."
+            })
+        upload = serializer.save(uploaded_by=user)
+        return self.offset_response(upload, status.HTTP_201_CREATED)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.offset_response(self.get_object())
+
+    def partial_update(self, request, *args, **kwargs):
+        upload = self.get_object()
+        if upload.is_complete:
+            return Response({'detail': 'Upload is already complete.'}, status=status.HTTP_409_CONFLICT)
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            raise serializers.ValidationError({'Upload-Offset': 'This header is required and must be an integer.'})
+        if offset != upload.offset:
+            response = Response({'detail': 'Upload-Offset does not match the received length.'},
+                                status=status.HTTP_409_CONFLICT)
+            response['Upload-Offset'] = str(upload.offset)
+            return response
+
+        try:
+            if request.stream is not None:
+                upload.offset = append_chunks(upload, request.stream)
+            if upload.is_complete:
+                upload.image = complete_upload(upload)
+        except ValidationError as exc:
+            if upload.is_complete:
+                # The whole file arrived but is not an image: start over.
+                discard_upload(upload)
+                ImageUpload.objects.filter(pk=upload.pk).update(offset=0)
+            raise serializers.ValidationError({'file': exc.messages})
+        upload.save(update_fields=['offset', 'image', 'updated_at'])
+        return self.offset_response(upload)
+
+    def perform_destroy(self, instance):
+        discard_upload(instance)
+        instance.delete()
+
+
+class AgentViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing real estate agents.
 
     Provides operations to view agent profiles and their associated properties.
     """
-    queryset = Agent.objects.all()
+    queryset = Agent.objects.select_related('user')
     serializer_class = AgentSerializer
     filter_backends = [filters.SearchFilter]
     search_fields = ['name', 'phone']
@@ -339,9 +748,13 @@ class AgentViewSet(viewsets.ModelViewSet):
         Return properties associated with a specific agent.
         """
         agent = self.get_object()
-        properties = House.objects.filter(agent=agent)
-        serializer = HouseSerializer(properties, many=True)
-        return Response(serializer.data)
+        fieldset = self.get_fieldset_kwargs()
+        properties = House.objects.filter(agent=agent).prefetch_related(
+            *HouseSerializer(**fieldset).get_prefetch_lookups())
+        paginator = ListingCursorPagination()
+        page = paginator.paginate_queryset(properties, request, view=self)
+        serializer = HouseSerializer(page, many=True, **fieldset)
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
     def my_profile(self, request):
@@ -354,7 +767,8 @@ class AgentViewSet(viewsets.ModelViewSet):
 
         try:
             # Check if user has a profile
-            if not hasattr(user, 'profile'):
+            role = get_role(user)
+            if role is None:
                 logger.warning(f"User {user.username} attempted to access agent profile but has no user profile")
                 return Response(
                     {"detail": "You do not have a user profile."},
@@ -362,8 +776,8 @@ class AgentViewSet(viewsets.ModelViewSet):
                 )
 
             # Check if user has agent role
-            if user.profile.role != 'agent':
-                logger.warning(f"User {user.username} attempted to access agent profile but is not an agent (role: {user.profile.role})")
+            if role != 'agent':
+                logger.warning(f"User {user.username} attempted to access agent profile but is not an agent (role: {role})")
                 return Response(
                     {"detail": "You must have an agent role to access an agent profile."},
                     status=status.HTTP_403_FORBIDDEN
@@ -371,7 +785,7 @@ class AgentViewSet(viewsets.ModelViewSet):
 
             # Try to get the agent profile
             try:
-                agent = Agent.objects.get(user=user)
+                agent = Agent.objects.select_related('user').get(pk=get_agent_id(user))
             except Agent.DoesNotExist:
                 logger.error(f"User {user.username} has agent role but no agent profile")
                 return Response(
@@ -391,7 +805,7 @@ class AgentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class FavoriteViewSet(viewsets.ModelViewSet):
+class FavoriteViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing favorite properties.
 
@@ -401,7 +815,9 @@ class FavoriteViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Favorite.objects.filter(user=self.request.user)
+        return Favorite.objects.filter(user=self.request.user).prefetch_related(
+            Prefetch('house', queryset=House.objects.for_listing())
+        )
 
     def perform_create(self, serializer):
         """
@@ -435,7 +851,8 @@ class FavoriteViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def recommended(self, request):
         """
-        Return recommended properties based on user's favorites.
+        Return recommended properties based on user's favorites, ranked by
+        similarity (see realestate.recommendations); `?limit=` up to 50.
         This is a tenant-specific feature.
         """
         import logging
@@ -443,30 +860,26 @@ class FavoriteViewSet(viewsets.ModelViewSet):
 
         try:
             # Check if user is a tenant
-            if not hasattr(request.user, 'profile') or request.user.profile.role != 'tenant':
+            if get_role(request.user) != 'tenant':
                 logger.warning(f"User {request.user.username} attempted to access tenant-only feature but is not a tenant")
                 return Response(
                     {"detail": "This feature is only available for tenants."},
                     status=status.HTTP_403_FORBIDDEN
                 )
 
-            # Get user's favorites
-            favorites = Favorite.objects.filter(user=request.user)
-
-            if not favorites.exists():
-                # If no favorites, return some default recommendations
-                recommended = House.objects.all().order_by('-created_at')[:5]
+            try:
+                limit = min(max(int(request.query_params.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+            except ValueError:
+                limit = DEFAULT_LIMIT
+
+            # Houses closest to the user's favorites, best first
+            house_ids = recommended_house_ids(request.user, limit)
+            if house_ids:
+                houses = House.objects.for_listing().in_bulk(house_ids)
+                recommended = [houses[pk] for pk in house_ids if pk in houses]
             else:
-                # Get property types and features from favorites
-                favorite_houses = [fav.house for fav in favorites]
-                property_types = set(house.property_type for house in favorite_houses if house.property_type)
-
-                # Find similar properties
-                recommended = House.objects.filter(
-                    property_type__in=property_types
-                ).exclude(
-                    id__in=[house.id for house in favorite_houses]
-                ).order_by('-created_at')[:5]
+                # If no favorites, return some default recommendations
+                recommended = House.objects.for_listing().order_by('-created_at')[:limit]
 
             serializer = HouseSerializer(recommended, many=True)
             return Response(serializer.data)
@@ -478,6 +891,57 @@ class FavoriteViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+
+class SavedSearchViewSet(viewsets.ModelViewSet):
+    """
+    API endpoint for managing saved searches.
+
+    Tenants save the listing filters they use often. New and changed listings
+    matching them are collected in the `feed` action.
+    """
+    serializer_class = SavedSearchSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return SavedSearch.objects.filter(user=self.request.user)
+
+    def get_permissions(self):
+        """
+        Only tenants can save, change and delete searches. Anyone
+        authenticated can view their own searches and feed.
+        """
+        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+            return [permissions.IsAuthenticated(), IsTenant()]
+        return [permissions.IsAuthenticated()]
+
+    def perform_create(self, serializer):
+        if SavedSearch.objects.filter(user=self.request.user).count() >= MAX_SAVED_SEARCHES:
+            raise serializers.ValidationError(
+                {'detail': f'You can save up to {MAX_SAVED_SEARCHES} searches.'})
+        serializer.save(user=self.request.user)
+
+    @action(detail=False, methods=['get'])
+    def feed(self, request):
+        """
+        Return the "new for you" feed: active listings that matched the
+        user's saved searches when they were created or changed, newest
+        match first, with keyset pagination (follow `next`). `?search=`
+        keeps the matches of one saved search.
+        """
+        search_id = request.query_params.get('search')
+        if search_id is not None:
+            try:
+                search_id = uuid.UUID(search_id)
+            except ValueError:
+                raise serializers.ValidationError({'search': 'Expected a saved search id.'})
+        matches = feed_queryset(request.user, search_id).prefetch_related(
+            Prefetch('house', queryset=House.objects.prefetch_related(*HouseListSerializer().get_prefetch_lookups()))
+        )
+        paginator = ListingCursorPagination()
+        page = paginator.paginate_queryset(matches, request, self)
+        return paginator.get_paginated_response(SavedSearchMatchSerializer(page, many=True, context={'request': request}).data)
+
+
 class UserProfileViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -503,7 +967,7 @@ class RegisterView(APIView):
         serializer = RegisterSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            refresh = RefreshToken.for_user(user)
+            refresh = RoleRefreshToken.for_user(user)
             return Response({
                 'access': str(refresh.access_token),
                 'refresh': str(refresh),
@@ -518,10 +982,25 @@ class UserMeView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        serializer = UserSerializer(request.user)
+        # Read requests authenticate with a user built from token claims;
+        # load every serialized field, and the profile, in one query.
+        user = User.objects.select_related('profile').filter(pk=request.user.pk).first()
+        if user is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        serializer = UserSerializer(user)
         return Response(serializer.data)
 
 
+class PrincipalCacheStatsView(APIView):
+    """
+    Returns the principal cache counters of the serving process (staff only).
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(principal_cache_stats())
+
+
 class AutoDetectRoleTokenObtainPairView(TokenObtainPairView):
     """
     Custom token view that automatically detects the user's role.
@@ -546,7 +1025,14 @@ class AgentTokenObtainPairView(TokenObtainPairView):
     serializer_class = AgentTokenObtainPairSerializer
 
 
-class PropertyInquiryViewSet(viewsets.ModelViewSet):
+class VersionedTokenRefreshView(TokenRefreshView):
+    """
+    Token refresh view that refuses refresh tokens revoked by a role change.
+    """
+    serializer_class = VersionedTokenRefreshSerializer
+
+
+class PropertyInquiryViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing property inquiries.
 
@@ -563,12 +1049,12 @@ class PropertyInquiryViewSet(viewsets.ModelViewSet):
         """
         Set permissions based on the action:
         - create, update, delete: tenant only
-        - respond: agent only
+        - respond, inbox, bulk_respond, bulk_close: agent only
         - list, retrieve: authenticated user (filtered by role in get_queryset)
         """
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [permissions.IsAuthenticated(), IsTenant()]
-        elif self.action == 'respond':
+        elif self.action in ['respond', 'inbox', 'bulk_respond', 'bulk_close']:
             return [permissions.IsAuthenticated(), IsAgent()]
         return [permissions.IsAuthenticated()]
 
@@ -598,22 +1084,26 @@ class PropertyInquiryViewSet(viewsets.ModelViewSet):
         logger = logging.getLogger(__name__)
 
         # Check if user has a profile
-        if not hasattr(user, 'profile'):
+        role = get_role(user)
+        if role is None:
             logger.warning(f"User {user.username} attempted to access inquiries but has no profile")
             return PropertyInquiry.objects.none()
 
+        inquiries = PropertyInquiry.objects.select_related('tenant__profile').prefetch_related(
+            Prefetch('house', queryset=House.objects.for_listing())
+        )
+
         # Return inquiries based on role
-        if user.profile.role == 'tenant':
-            return PropertyInquiry.objects.filter(tenant=user)
-        elif user.profile.role == 'agent':
-            try:
-                agent = Agent.objects.get(user=user)
-                return PropertyInquiry.objects.filter(house__agent=agent)
-            except Agent.DoesNotExist:
+        if role == 'tenant':
+            return inquiries.filter(tenant=user)
+        elif role == 'agent':
+            agent_id = get_agent_id(user)
+            if agent_id is None:
                 logger.error(f"User {user.username} has agent role but no agent profile")
                 return PropertyInquiry.objects.none()
-        elif user.profile.role == 'admin':
-            return PropertyInquiry.objects.all()
+            return inquiries.filter(agent_id=agent_id)
+        elif role == 'admin':
+            return inquiries.all()
         else:
             return PropertyInquiry.objects.none()
 
@@ -627,7 +1117,7 @@ class PropertyInquiryViewSet(viewsets.ModelViewSet):
         logger = logging.getLogger(__name__)
 
         # Check if user is a tenant
-        if not hasattr(user, 'profile') or user.profile.role != 'tenant':
+        if get_role(user) != 'tenant':
             logger.warning(f"User {user.username} attempted to create an inquiry but is not a tenant")
             raise serializers.ValidationError({
                 "detail": "Only tenants can create property inquiries."
@@ -647,20 +1137,19 @@ class PropertyInquiryViewSet(viewsets.ModelViewSet):
         logger = logging.getLogger(__name__)
 
         # Check if the inquiry is about a property associated with this agent
-        try:
-            agent = Agent.objects.get(user=request.user)
-            if inquiry.house.agent != agent:
-                logger.warning(f"Agent {agent.name} attempted to respond to an inquiry about a property not associated with them")
-                return Response(
-                    {"detail": "You can only respond to inquiries about your own properties."},
-                    status=status.HTTP_403_FORBIDDEN
-                )
-        except Agent.DoesNotExist:
+        agent_id = get_agent_id(request.user)
+        if agent_id is None:
             logger.error(f"User {request.user.username} has agent role but no agent profile")
             return Response(
                 {"detail": "You have an agent role but no agent profile. Please contact an administrator."},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+        if str(inquiry.agent_id) != str(agent_id):
+            logger.warning(f"User {request.user.username} attempted to respond to an inquiry about a property not associated with them")
+            return Response(
+                {"detail": "You can only respond to inquiries about your own properties."},
+                status=status.HTTP_403_FORBIDDEN
+            )
 
         # Update the inquiry with the response
         response = request.data.get('response', '')
@@ -676,3 +1165,87 @@ class PropertyInquiryViewSet(viewsets.ModelViewSet):
 
         serializer = self.get_serializer(inquiry)
         return Response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def inbox(self, request):
+        """
+        Return the agent's inquiries newest first, as compact rows with keyset
+        pagination (follow `next`), optionally only those with the given
+        `status`, together with the agent's pending and responded counts.
+        """
+        agent_id = get_agent_id(request.user)
+        if agent_id is None:
+            return Response(
+                {"detail": "You have an agent role but no agent profile. Please contact an administrator."},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        inquiry_status = request.query_params.get('status')
+        if inquiry_status is not None and inquiry_status not in dict(PropertyInquiry.STATUS_CHOICES):
+            raise serializers.ValidationError({'status': f'Unknown status "{inquiry_status}".'})
+
+        paginator = ListingCursorPagination()
+        page = paginator.paginate_queryset(inbox_queryset(agent_id, inquiry_status), request, self)
+        response = paginator.get_paginated_response(InquiryInboxSerializer(page, many=True).data)
+        response.data['counts'] = inbox_counts(agent_id)
+        return response
+
+    @action(detail=False, methods=['post'], url_path='events/ticket')
+    def events_ticket(self, request):
+        """
+        Exchange the access token of the request for a short-lived,
+        single-use ticket opening the inquiry event stream.
+        """
+        if not isinstance(request.auth, Token):
+            return Response(
+                {"detail": "Stream tickets are issued for JWT access tokens only."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({
+            'ticket': issue_ticket(str(request.auth)),
+            'expires_in': getattr(settings, 'EVENTS_TICKET_TIMEOUT', 30),
+        })
+
+    @action(detail=False, methods=['post'])
+    def bulk_respond(self, request):
+        """
+        Respond to many of the agent's inquiries at once with the same
+        `response`. Takes `ids`, a list of up to 500 inquiry ids.
+        """
+        response = request.data.get('response', '')
+        if not response:
+            return Response(
+                {"detail": "Response cannot be empty."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return self.bulk_update(request, 'responded', response)
+
+    @action(detail=False, methods=['post'])
+    def bulk_close(self, request):
+        """
+        Close many of the agent's inquiries at once. Takes `ids`, a list of
+        up to 500 inquiry ids.
+        """
+        return self.bulk_update(request, 'closed')
+
+    def bulk_update(self, request, inquiry_status, response=None):
+        """
+        Apply a bulk change and return the outcome for every id: the new
+        status, "unchanged", "not_found" or "forbidden", with the agent's
+        updated inbox counters.
+        """
+        agent_id = get_agent_id(request.user)
+        if agent_id is None:
+            return Response(
+                {"detail": "You have an agent role but no agent profile. Please contact an administrator."},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not ids or len(ids) > MAX_BULK_IDS:
+            raise serializers.ValidationError({'ids': f'Expected a list of 1 to {MAX_BULK_IDS} inquiry ids.'})
+
+        results = bulk_update_inquiries(agent_id, ids, inquiry_status, response)
+        return Response({
+            'updated': sum(outcome == inquiry_status for outcome in results.values()),
+            'results': results,
+            'counts': inbox_counts(agent_id),
+        })
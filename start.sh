@@ -0,0 +1,15 @@
+#!/usr/bin/env bash
+set -o errexit  # Exit on error
+
+# Move into Backend folder where manage.py is
+cd Backend
+
+# Serve the ASGI application, which the inquiry event streams need, from
+# gunicorn-managed uvicorn workers. With more than one worker set
+# EVENTS_BROKER=realestate.events.RedisBroker and a shared cache, or the
+# application refuses to start. ASGI has no sendfile, so let the proxy send
+# media files (MEDIA_SENDFILE_BACKEND).
+exec gunicorn ajok_backend.asgi:application \
+    --worker-class uvicorn_worker.UvicornWorker \
+    --workers "${WEB_CONCURRENCY:-1}" \
+    --bind "0.0.0.0:${PORT:-8000}"